@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Export benchmark: milliseconds per scene for create_html_display() and PDF
+export of a single story.
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import tempfile
+from pathlib import Path
+
+from common import make_story_data, quiet, result, time_call
+
+from gemini_picturebook_generator.backends import make_png
+from gemini_picturebook_generator.enhanced_story_generator import (
+    create_html_display,
+    create_pdf_from_html,
+    load_weasyprint,
+)
+
+
+def run(num_scenes=50, repeat=3):
+    """
+    Render one story to HTML and PDF and measure time per scene.
+
+    Args:
+        num_scenes: Scenes in the benchmark story
+        repeat: Timed runs per export
+
+    Returns:
+        dict: Benchmark results keyed by name
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_export_") as tmp, quiet():
+        story_dir = Path(tmp)
+        story_data = make_story_data("story_export", num_scenes)
+        for scene in range(1, num_scenes + 1):
+            (story_dir / f"scene_{scene:02d}.png").write_bytes(make_png(256, (scene % 256, 90, 160)))
+
+        html_timing = time_call(lambda: create_html_display(story_data, story_dir), repeat)
+        results["export.html_ms_per_scene"] = result(
+            html_timing["median_ms"] / num_scenes, "ms/scene", scenes=num_scenes, **html_timing
+        )
+
+        if load_weasyprint() is not None:
+            html_path = create_html_display(story_data, story_dir)
+            pdf_timing = time_call(lambda: create_pdf_from_html(html_path, story_dir), repeat)
+            results["export.pdf_ms_per_scene"] = result(
+                pdf_timing["median_ms"] / num_scenes, "ms/scene", scenes=num_scenes, **pdf_timing
+            )
+        else:
+            results["export.pdf_ms_per_scene"] = {"skipped": "WeasyPrint not available"}
+
+    return results
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Generation throughput benchmark: scenes per second through
+generate_custom_story_with_images() against the fake backend.
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import tempfile
+import time
+from pathlib import Path
+
+from common import quiet, result
+
+from gemini_picturebook_generator.enhanced_story_generator import (
+    generate_custom_story_with_images,
+    setup_client,
+)
+
+
+def run(num_scenes=50, stories=3):
+    """
+    Generate several stories and measure scene throughput.
+
+    Args:
+        num_scenes: Scenes per story
+        stories: Number of stories to generate
+
+    Returns:
+        dict: Benchmark results keyed by name
+    """
+    with tempfile.TemporaryDirectory(prefix="bench_generation_") as tmp, quiet():
+        client = setup_client()
+        start = time.perf_counter()
+        for i in range(stories):
+            output_dir = Path(tmp) / f"story_{i:04d}"
+            output_dir.mkdir()
+            story_data = generate_custom_story_with_images(
+                client, "A benchmark adventure", num_scenes, output_dir,
+                progress_callback=lambda event: None,
+            )
+            if not story_data:
+                raise RuntimeError("Generation failed under the fake backend")
+        elapsed = time.perf_counter() - start
+
+    total_scenes = num_scenes * stories
+    return {
+        "generation.scenes_per_sec": result(
+            total_scenes / elapsed, "scenes/s", better="higher",
+            scenes=total_scenes, stories=stories,
+        ),
+    }
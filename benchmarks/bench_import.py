@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark: cold import cost of each entry point, measured with
+`python -X importtime` in fresh interpreters.
+
+It also guards the lazy imports: google.genai, PIL, WeasyPrint and boto3 must
+not be loaded just by importing an entry point. Any that are get reported as
+violations, which fail the benchmark run.
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import PROJECT_DIR, result
+
+ENTRY_POINTS = {
+    "package": "gemini_picturebook_generator",
+    "mcp_server": "gemini_picturebook_generator.mcp_server",
+    "flask_ui": "gemini_picturebook_generator.flask_ui",
+    "batch": "gemini_picturebook_generator.batch",
+    "asgi": "gemini_picturebook_generator.asgi",
+}
+
+# Loaded on first use only; importing an entry point must not pull them in
+DEFERRED_MODULES = ("google.genai", "PIL", "weasyprint", "boto3")
+
+
+def measure_import(module, cwd):
+    """
+    Import a module in a fresh interpreter and read its -X importtime report.
+
+    Args:
+        module: Module to import
+        cwd: Working directory for the interpreter
+
+    Returns:
+        tuple: (cumulative import time in ms, set of modules imported)
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(PROJECT_DIR), env.get("PYTHONPATH")]))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    cumulative_us = None
+    imported = set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            _, cumulative, name = (field.strip() for field in line.split("|"))
+            cumulative = int(cumulative)
+        except ValueError:
+            # Header line
+            continue
+        imported.add(name)
+        if name == module:
+            cumulative_us = cumulative
+    if cumulative_us is None:
+        raise RuntimeError(f"{module} missing from the importtime report")
+    return cumulative_us / 1000, imported
+
+
+def run(repeat=5):
+    """
+    Measure the cold import time of every entry point.
+
+    Args:
+        repeat: Fresh interpreters started per entry point
+
+    Returns:
+        dict: Benchmark results keyed by name
+    """
+    results = {}
+    # Entry points may create log files in the working directory
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, module in ENTRY_POINTS.items():
+            timings = []
+            imported = set()
+            for _ in range(repeat):
+                elapsed_ms, imported = measure_import(module, cwd)
+                timings.append(elapsed_ms)
+            violations = sorted(m for m in DEFERRED_MODULES if m in imported)
+            results[f"import.{name}_ms"] = result(
+                statistics.median(timings), "ms",
+                module=module,
+                min_ms=round(min(timings), 3),
+                runs=repeat,
+                violations=violations,
+            )
+    return results
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Listing benchmark: latency of the Flask gallery() page and the MCP
+list_generated_stories() tool over catalogs of increasing size.
+
+Fixture catalogs are expensive to build at 100k stories, so they are kept in
+a fixtures directory and reused across runs.
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import asyncio
+import time
+from pathlib import Path
+
+from common import make_story_data, quiet, result, stories_dir, time_call
+
+from gemini_picturebook_generator.backends import make_png
+from gemini_picturebook_generator.catalog import iter_story_dirs, story_path
+from gemini_picturebook_generator.story_metadata import write_story_metadata
+
+SCENES_PER_FIXTURE_STORY = 3
+
+
+def build_catalog(root, count):
+    """
+    Create (or top up) a catalog of synthetic stories.
+
+    Args:
+        root: Catalog directory
+        count: Number of stories it must contain
+
+    Returns:
+        Path: Catalog directory
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    existing = sum(1 for _ in iter_story_dirs(root=root))
+    image = make_png(16, (200, 120, 40))
+    for i in range(existing, count):
+        story_dir = story_path(f"story_{i:08d}", root)
+        story_dir.mkdir(parents=True, exist_ok=True)
+        write_story_metadata(make_story_data(story_dir.name, SCENES_PER_FIXTURE_STORY), story_dir)
+        for scene in range(1, SCENES_PER_FIXTURE_STORY + 1):
+            (story_dir / f"scene_{scene:02d}.png").write_bytes(image)
+    return root
+
+
+def run(sizes=(100, 10_000, 100_000), fixtures_dir="benchmarks/.fixtures", limit=20):
+    """
+    Measure gallery and story listing latency at each catalog size.
+
+    Args:
+        sizes: Catalog sizes to measure
+        fixtures_dir: Where fixture catalogs are kept between runs
+        limit: Page size passed to list_generated_stories()
+
+    Returns:
+        dict: Benchmark results keyed by name
+    """
+    # Imported late so OUTPUT_DIR and the fake backend are already configured
+    from gemini_picturebook_generator.flask_ui import app
+    from gemini_picturebook_generator.mcp_server import list_generated_stories
+
+    results = {}
+    client = app.test_client()
+    for size in sizes:
+        catalog = Path(fixtures_dir) / f"catalog_{size}"
+        build_start = time.perf_counter()
+        build_catalog(catalog, size)
+        build_seconds = time.perf_counter() - build_start
+
+        repeat = 3 if size <= 10_000 else 1
+        with stories_dir(catalog), quiet():
+            gallery_timing = time_call(lambda: client.get("/gallery"), repeat)
+            list_timing = time_call(lambda: asyncio.run(list_generated_stories(limit=limit)), repeat)
+
+        results[f"listing.gallery_ms.{size}"] = result(
+            gallery_timing["median_ms"], "ms", stories=size, **gallery_timing
+        )
+        results[f"listing.list_generated_stories_ms.{size}"] = result(
+            list_timing["median_ms"], "ms", stories=size, limit=limit, **list_timing
+        )
+        results[f"listing.fixture_build_s.{size}"] = {"value": round(build_seconds, 3), "unit": "s", "informational": True}
+
+    return results
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the Gemini Picture Book Generator benchmarks.
+
+All benchmarks run offline against the fake model backend and write into
+temporary story directories selected through OUTPUT_DIR, so they never touch
+real stories or API quota.
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import contextlib
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+if str(PROJECT_DIR) not in sys.path:
+    sys.path.insert(0, str(PROJECT_DIR))
+
+# Select the offline backend before any package module reads the environment
+os.environ.setdefault("PICTUREBOOK_BACKEND", "fake")
+os.environ.setdefault("FAKE_GEMINI_LATENCY", "0")
+os.environ.setdefault("FAKE_GEMINI_LATENCY_PER_SCENE", "0")
+os.environ.setdefault("FAKE_GEMINI_SEED", "42")
+# Measure the code, not the API quota pacing
+os.environ.setdefault("GEMINI_RPM", "0")
+os.environ.setdefault("GEMINI_RETRY_BASE_DELAY", "0")
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the generator's console output while timing."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+@contextlib.contextmanager
+def stories_dir(path):
+    """Point the story catalog at a benchmark directory."""
+    previous = os.environ.get("OUTPUT_DIR")
+    os.environ["OUTPUT_DIR"] = str(path)
+    try:
+        yield Path(path)
+    finally:
+        if previous is None:
+            os.environ.pop("OUTPUT_DIR", None)
+        else:
+            os.environ["OUTPUT_DIR"] = previous
+
+
+def time_call(func, repeat=3):
+    """
+    Time a callable several times.
+
+    Args:
+        func: Callable taking no arguments
+        repeat: Number of timed runs
+
+    Returns:
+        dict: Median, min and max wall time in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "runs": repeat,
+    }
+
+
+def result(value, unit, better="lower", **extra):
+    """Build a benchmark result record comparable across runs."""
+    return {"value": round(value, 3), "unit": unit, "better": better, **extra}
+
+
+def make_story_data(story_id, num_scenes):
+    """Build synthetic story data with one text and one image part per scene."""
+    scenes = []
+    for scene in range(1, num_scenes + 1):
+        scenes.append({
+            "type": "text",
+            "content": f"**Scene {scene}:** A benchmark scene with enough words to fill a paragraph of story text.",
+            "scene_number": scene,
+            "part_index": scene * 2 - 2,
+        })
+        scenes.append({
+            "type": "image",
+            "filename": f"scene_{scene:02d}.png",
+            "scene_number": scene,
+            "part_index": scene * 2 - 1,
+            "image_size": [256, 256],
+        })
+    return {
+        "id": story_id,
+        "scenes": scenes,
+        "generated_at": "2026-01-01T00:00:00",
+        "model": "fake",
+        "original_prompt": f"Benchmark story {story_id}",
+        "num_scenes": num_scenes,
+        "total_parts": len(scenes),
+        "character_name": "",
+        "setting": "",
+        "style": "cartoon",
+    }
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark runner for Gemini Picture Book Generator.
+
+Runs the generation, export, listing and import-time benchmarks offline
+against the fake model backend and writes the results as JSON, so runs can be
+compared across commits to catch regressions.
+
+Usage:
+    python benchmarks/run_benchmarks.py                          # All suites
+    python benchmarks/run_benchmarks.py --suites listing --sizes 100,10000
+    python benchmarks/run_benchmarks.py --suites import          # Cold-start guard
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/baseline.json
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import common
+from gemini_picturebook_generator.metrics import REGISTRY
+
+SUITES = ("generation", "export", "listing", "import")
+
+
+def git_commit():
+    """Get the current git commit, if available."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=common.PROJECT_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suites(args):
+    """Run the selected benchmark suites and collect their results."""
+    results = {}
+    for suite in args.suites:
+        print(f"⏱️  Running {suite} benchmarks...")
+        if suite == "generation":
+            import bench_generation
+            results.update(bench_generation.run(num_scenes=args.scenes, stories=args.stories))
+        elif suite == "export":
+            import bench_export
+            results.update(bench_export.run(num_scenes=args.scenes, repeat=args.repeat))
+        elif suite == "listing":
+            import bench_listing
+            results.update(bench_listing.run(sizes=args.sizes, fixtures_dir=args.fixtures_dir))
+        elif suite == "import":
+            import bench_import
+            results.update(bench_import.run(repeat=args.repeat))
+    return results
+
+
+def compare_results(current, baseline, threshold):
+    """
+    Compare results against a baseline run.
+
+    Args:
+        current: Results from this run
+        baseline: Results from the baseline run
+        threshold: Allowed relative slowdown (0.2 = 20%)
+
+    Returns:
+        list: Descriptions of regressions beyond the threshold
+    """
+    regressions = []
+    for name, record in sorted(current.items()):
+        base = baseline.get(name)
+        if not base or "value" not in record or "value" not in base or record.get("informational"):
+            continue
+        if not base["value"]:
+            continue
+        change = (record["value"] - base["value"]) / base["value"]
+        if record.get("better") == "higher":
+            change = -change
+        marker = "❌" if change > threshold else "✅"
+        print(f"   {marker} {name}: {base['value']} → {record['value']} {record['unit']} ({change:+.1%} worse)" if change > 0
+              else f"   {marker} {name}: {base['value']} → {record['value']} {record['unit']} ({-change:.1%} better)")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    """Main entry point for the benchmark runner."""
+    parser = argparse.ArgumentParser(description="Run picture book generator benchmarks offline")
+    parser.add_argument("--suites", default=",".join(SUITES),
+                        help=f"Comma-separated suites to run ({', '.join(SUITES)})")
+    parser.add_argument("--scenes", type=int, default=50, help="Scenes per story for generation/export")
+    parser.add_argument("--stories", type=int, default=3, help="Stories generated by the generation suite")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per export measurement")
+    parser.add_argument("--sizes", default="100,10000,100000", help="Catalog sizes for the listing suite")
+    parser.add_argument("--fixtures-dir", default=str(common.PROJECT_DIR / "benchmarks" / ".fixtures"),
+                        help="Where listing fixture catalogs are kept between runs")
+    parser.add_argument("--output", help="Results JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression (default 0.2)")
+    args = parser.parse_args()
+
+    args.suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = [s for s in args.suites if s not in SUITES]
+    if unknown:
+        parser.error(f"Unknown suites: {', '.join(unknown)}")
+    args.sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    results = run_suites(args)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "suites": args.suites,
+        },
+        "results": results,
+        # Where the time went, aggregated over all suites
+        "metrics": REGISTRY.snapshot(),
+    }
+
+    output = Path(args.output) if args.output else (
+        common.PROJECT_DIR / "benchmarks" / "results" / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"💾 Results saved: {output}")
+
+    for name, record in sorted(results.items()):
+        if "value" in record:
+            print(f"   {name}: {record['value']} {record['unit']}")
+        else:
+            print(f"   {name}: skipped ({record.get('skipped', 'n/a')})")
+
+    # Hard failures (e.g. a deferred dependency imported at start-up) regardless of baseline
+    violations = {name: record["violations"] for name, record in results.items() if record.get("violations")}
+    for name, modules in sorted(violations.items()):
+        print(f"   ❌ {name}: imports {', '.join(modules)} at start-up")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        print(f"\n📊 Comparing against {args.compare}")
+        regressions = compare_results(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            return 1
+        print("\n✅ No regressions")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,8 +10,15 @@ Date: 2025-05-28
 """
 
 import os
-from pathlib import Path
 from datetime import datetime
+from html.parser import HTMLParser
+from pathlib import Path
+
+from gemini_picturebook_generator.story_metadata import (
+    has_current_sidecar,
+    read_story_metadata,
+    write_story_metadata,
+)
 
 try:
     from weasyprint import HTML, CSS
@@ -429,134 +436,154 @@ def create_enhanced_pdf(story_data, output_dir):
         return None
 
 
-def extract_story_data_from_html(html_file_path):
+class StoryHTMLExtractor(HTMLParser):
+    """
+    Streaming extractor for story HTML written by create_html_display.
+
+    Tracks only the handful of elements that carry story data (the title,
+    info boxes and scene blocks), so it can be fed the file in chunks without
+    building a DOM.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.info_text = {'generated-info': [], 'story-info': []}
+        self.scenes = []
+        self._div_stack = []
+        self._in_title = False
+        self._title_parts = []
+        self._scene = None
+
+    def _inside(self, class_name):
+        return any(class_name in classes for classes in self._div_stack)
+
+    def handle_starttag(self, tag, attrs):
+        attributes = dict(attrs)
+        classes = (attributes.get('class') or '').split()
+
+        if tag == 'h2' and self.title is None:
+            self._in_title = True
+        elif tag == 'div':
+            self._div_stack.append(classes)
+            if 'scene' in classes:
+                self._scene = {'number_text': [], 'image': None, 'texts': [], 'other_text': []}
+            elif self._scene is not None and 'scene-text' in classes:
+                self._scene['texts'].append([])
+        elif tag == 'img' and self._scene is not None and 'scene-image' in classes:
+            self._scene['image'] = attributes.get('src')
+        elif tag == 'br' and self._inside('generated-info'):
+            self.info_text['generated-info'].append('\n')
+
+    def handle_endtag(self, tag):
+        if tag == 'h2' and self._in_title:
+            self._in_title = False
+            self.title = ''.join(self._title_parts).strip()
+        elif tag == 'div' and self._div_stack:
+            classes = self._div_stack.pop()
+            if 'scene' in classes and self._scene is not None:
+                self.scenes.append(self._scene)
+                self._scene = None
+        elif tag in ('p', 'li') and self._div_stack:
+            for class_name in self.info_text:
+                if self._inside(class_name):
+                    self.info_text[class_name].append('\n')
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+        for class_name in self.info_text:
+            if self._inside(class_name):
+                self.info_text[class_name].append(data)
+        if self._scene is None or not self._div_stack:
+            return
+        innermost = self._div_stack[-1]
+        if 'scene-number' in innermost:
+            self._scene['number_text'].append(data)
+        elif 'scene-text' in innermost and self._scene['texts']:
+            self._scene['texts'][-1].append(data)
+        elif data.strip():
+            self._scene['other_text'].append(data.strip())
+
+
+def _info_value(info_text, label):
+    """Find the value following a label such as 'Model:' in extracted text."""
+    for line in info_text.split('\n'):
+        if label in line:
+            return line.split(label, 1)[1].strip()
+    return None
+
+
+def extract_story_data_from_html(html_file_path, chunk_size=64 * 1024):
     """
-    Extract story data from existing HTML file using BeautifulSoup.
+    Extract story data from an existing HTML file with a streaming parser.
+
+    Only used as a fallback for legacy stories that have no metadata sidecar.
 
     Args:
         html_file_path (Path): Path to HTML file
+        chunk_size (int): Bytes of HTML fed to the parser at a time
 
     Returns:
         dict: Extracted story data
     """
     try:
-        from bs4 import BeautifulSoup
-        from bs4.element import Tag
-        from datetime import datetime
-
+        parser = StoryHTMLExtractor()
         with open(html_file_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-
-        soup = BeautifulSoup(html_content, 'html.parser')
-
-        # Extract basic info
-        title_elem = soup.find('h2')
-        original_prompt = title_elem.get_text().strip('"') if title_elem else "Unknown Story"
-
-        # Extract model info and generation date
-        model = 'Unknown'
-        generated_at = datetime.now().isoformat()
+            while chunk := f.read(chunk_size):
+                parser.feed(chunk)
+        parser.close()
 
-        generated_info = soup.find(class_='generated-info')
-        if generated_info:
-            info_text = generated_info.get_text()
-            if 'Model:' in info_text:
-                model_line = [line for line in info_text.split('\n') if 'Model:' in line]
-                if model_line:
-                    model = model_line[0].replace('Model:', '').strip()
+        original_prompt = (parser.title or '').strip('"') or "Unknown Story"
 
-            if 'Generated on:' in info_text:
-                date_line = [line for line in info_text.split('\n') if 'Generated on:' in line]
-                if date_line:
-                    generated_at = date_line[0].replace('Generated on:', '').strip()
+        generated_info = ''.join(parser.info_text['generated-info'])
+        model = _info_value(generated_info, 'Model:') or 'Unknown'
+        generated_at = _info_value(generated_info, 'Generated on:') or datetime.now().isoformat()
 
-        # Extract story info details
-        story_info = soup.find(class_='story-info')
         num_scenes = 0
-        if story_info:
-            info_text = story_info.get_text()
-            if 'Scenes Generated:' in info_text:
-                scenes_line = [line for line in info_text.split('\n') if 'Scenes Generated:' in line]
-                if scenes_line:
-                    try:
-                        num_scenes = int(scenes_line[0].split(':')[1].strip())
-                    except ValueError:
-                        pass
-
-        # Extract scenes
-        scenes = []
-        scene_divs = soup.find_all(class_='scene')
-        print(f"🎬 Processing {len(scene_divs)} scene divs for extraction")
+        story_info = ''.join(parser.info_text['story-info'])
+        for label in ('Scenes Generated:', 'Scenes Requested:'):
+            value = _info_value(story_info, label)
+            if value and value.isdigit():
+                num_scenes = int(value)
+                break
 
-        for i, scene_div in enumerate(scene_divs):
-            if not isinstance(scene_div, Tag):
-                print(f"❌ Skipping invalid scene div {i}: {type(scene_div)}")
-                continue
-            # Get scene number
-            scene_number_elem = scene_div.find('div', class_='scene-number')
-            if scene_number_elem:
-                scene_num_text = scene_number_elem.get_text()
-                try:
-                    scene_number = int(scene_num_text.replace('Scene', '').strip())
-                    print(f"📝 Processing scene {scene_number}")
-                except ValueError:
-                    print(f"❌ Could not parse scene number from: {scene_num_text}")
-                    continue
-            else:
-                print(f"❌ No scene number found in scene div {i}")
+        scenes = []
+        print(f"🎬 Processing {len(parser.scenes)} scene blocks for extraction")
+        for scene in parser.scenes:
+            scene_num_text = ''.join(scene['number_text'])
+            try:
+                scene_number = int(scene_num_text.replace('Scene', '').strip())
+            except ValueError:
+                print(f"❌ Could not parse scene number from: {scene_num_text.strip()}")
                 continue
 
-            # Get image
-            img_elem = scene_div.find('img', class_='scene-image')
-            if img_elem and isinstance(img_elem, Tag) and img_elem.has_attr('src'):
+            if scene['image']:
                 scenes.append({
                     'type': 'image',
-                    'filename': img_elem['src'],
+                    'filename': scene['image'],
                     'scene_number': scene_number
                 })
-                print(f"   🖼️  Added image: {img_elem['src']}")
-
-            # Get text
-            text_elem = scene_div.find(class_='scene-text')
-            text_content = None
-
-            if text_elem:
-                text_content = text_elem.get_text().strip()
-            else:
-                # Alternative: look for div with strong tag containing scene info
-                strong_elem = scene_div.find('strong')
-                if isinstance(strong_elem, Tag):
-                    # Get the parent div of the strong element
-                    parent_div = strong_elem.parent
-                    if parent_div and parent_div.name == 'div':
-                        text_content = parent_div.get_text().strip()
-                else:
-                    # Last resort: get all text content except scene number
-                    all_text = scene_div.get_text().strip()
-                    # Remove scene number and image alt text
-                    lines = all_text.split('\n')
-                    text_lines = [line.strip() for line in lines
-                                if line.strip() and
-                                not line.strip().startswith(f'Scene {scene_number}') and
-                                not line.strip().startswith('alt=')]
-                    if text_lines:
-                        text_content = ' '.join(text_lines)
+
+            paragraphs = [''.join(parts).strip() for parts in scene['texts']]
+            text_content = '\n\n'.join(p for p in paragraphs if p)
+            if not text_content:
+                # Last resort: any other text in the scene block
+                text_content = ' '.join(scene['other_text'])
+
+            # Clean up scene labels
+            for label in (f'Scene {scene_number}:', f'**Scene {scene_number}:**'):
+                if text_content.startswith(label):
+                    text_content = text_content[len(label):].strip()
 
             if text_content:
-                # Clean up the text
-                if text_content.startswith(f'Scene {scene_number}:'):
-                    text_content = text_content[len(f'Scene {scene_number}:'):].strip()
-                elif text_content.startswith(f'**Scene {scene_number}:**'):
-                    text_content = text_content[len(f'**Scene {scene_number}:**'):].strip()
-
-                if text_content:  # Make sure we still have content after cleanup
-                    scenes.append({
-                        'type': 'text',
-                        'content': text_content,
-                        'scene_number': scene_number
-                    })
+                scenes.append({
+                    'type': 'text',
+                    'content': text_content,
+                    'scene_number': scene_number
+                })
 
-        story_data = {
+        return {
             'scenes': scenes,
             'generated_at': generated_at,
             'model': model,
@@ -564,14 +591,78 @@ def extract_story_data_from_html(html_file_path):
             'num_scenes': num_scenes or len([s for s in scenes if s['type'] == 'image'])
         }
 
-        return story_data
-
-    except ImportError:
-        print("⚠️  BeautifulSoup not available, using basic extraction")
-        return None
     except Exception as e:
         print(f"❌ Error extracting from HTML: {e}")
         return None
+
+
+def reconstruct_story_data(story_dir):
+    """
+    Rebuild story data for a legacy story that has no metadata sidecar.
+
+    Parses the original HTML file with the streaming extractor, falling back to
+    a listing of the scene images.
+
+    Args:
+        story_dir (Path): Story directory
+
+    Returns:
+        dict: Reconstructed story data
+    """
+    html_files = [f for f in story_dir.glob("*.html") if not f.name.endswith('_print.html')]
+    html_files = html_files or list(story_dir.glob("*.html"))
+
+    story_data = None
+    if html_files:
+        print(f"📖 Extracting story data from HTML file: {html_files[0].name}")
+        story_data = extract_story_data_from_html(html_files[0])
+
+    if not story_data:
+        print("⚠️  HTML extraction failed, using basic reconstruction...")
+        scene_images = sorted(story_dir.glob("scene_*.png"))
+        story_data = {
+            'scenes': [{
+                'type': 'image',
+                'filename': img_path.name,
+                'scene_number': i + 1,
+                'part_index': i
+            } for i, img_path in enumerate(scene_images)],
+            'generated_at': datetime.now().isoformat(),
+            'model': 'gemini-2.0-flash-preview-image-generation',
+            'original_prompt': story_dir.name.replace('story_', '').replace('_', ' '),
+            'num_scenes': len(scene_images)
+        }
+
+    return story_data
+
+
+def backfill_story_sidecar(story_dir_path):
+    """
+    Write a canonical metadata sidecar for a story that lacks one.
+
+    Legacy sidecars (no schema version) are rewritten in the compact format;
+    stories without any sidecar are reconstructed from their HTML.
+
+    Args:
+        story_dir_path (str): Path to story directory
+
+    Returns:
+        str: What was done ("current", "upgraded" or "reconstructed")
+    """
+    story_dir = Path(story_dir_path)
+    if has_current_sidecar(story_dir):
+        return "current"
+
+    story_data = read_story_metadata(story_dir)
+    action = "upgraded"
+    if not story_data:
+        story_data = reconstruct_story_data(story_dir)
+        action = "reconstructed"
+
+    write_story_metadata(story_data, story_dir)
+    return action
+
+
 def regenerate_existing_story_pdf(story_dir_path):
     """
     Regenerate PDF for an existing story with enhanced formatting.
@@ -588,62 +679,17 @@ def regenerate_existing_story_pdf(story_dir_path):
         print(f"❌ Story directory not found: {story_dir}")
         return None
 
-    # Look for story metadata first
-    metadata_file = story_dir / "story_metadata.json"
-    if metadata_file.exists():
-        import json
-        try:
-            with open(metadata_file, 'r') as f:
-                story_data = json.load(f)
-            print(f"📖 Found story metadata: {story_data.get('original_prompt', 'Unknown')}")
-        except Exception as e:
-            print(f"❌ Error reading metadata: {e}")
-            story_data = None
+    # Use the metadata sidecar; legacy stories get one backfilled from their HTML
+    story_data = read_story_metadata(story_dir)
+    if story_data:
+        print(f"📖 Found story metadata: {story_data.get('original_prompt', 'Unknown')}")
     else:
-        story_data = None
-
-    # If no metadata, try to extract from HTML
-    if not story_data:
-        html_files = list(story_dir.glob("*.html"))
-        if not html_files:
+        if not list(story_dir.glob("*.html")):
             print("❌ No HTML files found in story directory")
             return None
-
-        # Find the original HTML file (not the print version)
-        original_html = None
-        for html_file in html_files:
-            if not html_file.name.endswith('_print.html'):
-                original_html = html_file
-                break
-
-        if not original_html:
-            print("⚠️  No original HTML file found, using first available")
-            original_html = html_files[0]
-
-        print(f"📖 Extracting story data from HTML file: {original_html.name}")
-        story_data = extract_story_data_from_html(original_html)
-
-        if not story_data:
-            print("⚠️  HTML extraction failed, using basic reconstruction...")
-            # Fallback to basic reconstruction
-            story_data = {
-                'scenes': [],
-                'generated_at': datetime.now().isoformat(),
-                'model': 'gemini-2.0-flash-preview-image-generation',
-                'original_prompt': story_dir.name.replace('story_', '').replace('_', ' '),
-                'num_scenes': len(list(story_dir.glob("scene_*.png")))
-            }
-
-            # Add scenes from images only
-            scene_images = sorted(story_dir.glob("scene_*.png"))
-            for i, img_path in enumerate(scene_images):
-                story_data['scenes'].append({
-                    'type': 'image',
-                    'filename': img_path.name,
-                    'path': str(img_path),
-                    'scene_number': i + 1,
-                    'part_index': i
-                })
+        story_data = reconstruct_story_data(story_dir)
+        write_story_metadata(story_data, story_dir)
+        print("💾 Backfilled metadata sidecar for legacy story")
 
     # Generate enhanced PDF
     return create_enhanced_pdf(story_data, story_dir)
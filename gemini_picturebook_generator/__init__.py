@@ -18,14 +18,16 @@ __version__ = "2.1.0"
 __author__ = "Assistant"
 __license__ = "MIT"
 
-from .enhanced_story_generator import (
-    create_html_display,
-    create_pdf_from_html,
-    generate_custom_story_with_images,
-    setup_client,
-    test_api_connection,
-)
-from .flask_ui import app as flask_app
+# Public names are imported on first access (PEP 562), so importing a single
+# submodule such as mcp_server does not load the generator and the web UI.
+_LAZY_EXPORTS = {
+    "create_html_display": ("enhanced_story_generator", "create_html_display"),
+    "create_pdf_from_html": ("enhanced_story_generator", "create_pdf_from_html"),
+    "flask_app": ("flask_ui", "app"),
+    "generate_custom_story_with_images": ("enhanced_story_generator", "generate_custom_story_with_images"),
+    "setup_client": ("enhanced_story_generator", "setup_client"),
+    "test_api_connection": ("enhanced_story_generator", "test_api_connection"),
+}
 
 __all__ = [
     "create_html_display",
@@ -35,3 +37,18 @@ __all__ = [
     "setup_client",
     "test_api_connection",
 ]
+
+
+def __getattr__(name):
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    module_name, attribute = _LAZY_EXPORTS[name]
+    value = getattr(importlib.import_module(f".{module_name}", __name__), attribute)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,766 @@
+#!/usr/bin/env python3
+"""
+Cold-Tier Story Archive for Gemini Picture Book Generator
+
+Old stories are rarely viewed but still cost a dozen or more small files each
+(inodes, backup time). `gemini-picturebook-archive` packs stories that have
+not changed for ARCHIVE_MIN_AGE_DAYS (default 30) into pack files under
+<stories dir>/.archive and removes their folders:
+
+    .archive/pack-<timestamp>.pack      concatenated, individually compressed files
+    .archive/pack-<timestamp>.idx.json  offset index: story -> file -> location
+
+Each file is compressed on its own (zstd when the optional zstandard package
+is installed, zlib otherwise; already compressed images are stored as-is), so
+a single scene image is read with one seek without touching the rest of the
+pack. The index also keeps each story's metadata header, original file
+modification times (so ETags and export fingerprints survive a round trip) and
+a CRC of every file.
+
+Reads are transparent: scene images, story details and cached exports (such
+as the PDF download) of an archived story are served straight from its pack.
+Anything that needs real files (viewing, rebuilding an export, regenerating a
+scene) restores the story to the hot tier first, and so does frequent access:
+ARCHIVE_PROMOTE_HITS accesses (default 3, counted at most once a minute)
+within ARCHIVE_PROMOTE_WINDOW seconds (default 86400) move a story back.
+
+Restored and expired stories leave dead space in their pack. Once less than
+half of a pack is still in use it is compacted: the live entries are copied
+into a new pack and the old one is deleted (a pack with no stories left is
+deleted outright). The archive command and every garbage collection pass (see
+retention.py) compact packs.
+
+Usage:
+    gemini-picturebook-archive --dry-run
+    gemini-picturebook-archive --min-age-days 60
+    gemini-picturebook-archive --restore story_01JAB3X6T3R2V8Y0Q9KZ4M5N7P
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+import zlib
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from .catalog import (
+    get_stories_dir,
+    is_valid_story_id,
+    iter_story_dirs,
+    story_created_at,
+    story_last_modified,
+    story_path,
+)
+from .exports import current_exports
+from .job_store import TERMINAL_STATUSES, get_job_store
+from .metrics import REGISTRY
+from .story_metadata import (
+    METADATA_FILENAME,
+    SCENES_FILENAME,
+    atomic_write_bytes,
+    is_story_locked,
+    read_story_header,
+)
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    fcntl = None
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIRNAME = ".archive"
+PACK_SUFFIX = ".pack"
+INDEX_SUFFIX = ".idx.json"
+INDEX_VERSION = 1
+
+DEFAULT_MIN_AGE_DAYS = 30
+DEFAULT_MAX_PACK_MB = 512
+DEFAULT_PROMOTE_HITS = 3
+DEFAULT_PROMOTE_WINDOW = 86400
+
+# Accesses closer together than this count once (one page view loads every image)
+ACCESS_DEDUP_SECONDS = 60
+
+# Store a file uncompressed unless compression saves at least this fraction
+MIN_COMPRESSION_SAVING = 0.03
+
+# Compact a pack once less than this fraction of it holds live stories
+DEFAULT_COMPACT_LIVE_FRACTION = 0.5
+
+ARCHIVE_READS_TOTAL = REGISTRY.counter("picturebook_archive_reads_total", "Files read from archive packs")
+ARCHIVE_PROMOTIONS_TOTAL = REGISTRY.counter("picturebook_archive_promotions_total", "Archived stories restored to hot storage")
+
+# story_id -> (index file, story entry), rebuilt when the archive directory changes
+_index: dict[str, tuple[Path, dict[str, Any]]] = {}
+_index_stamp: tuple[str, int | None] | None = None
+_index_lock = threading.Lock()
+
+# Serializes pack and index changes within the process (flock covers other processes)
+_write_lock = threading.RLock()
+
+_accesses: dict[str, list[float]] = {}
+_promoting: set[str] = set()
+_access_lock = threading.Lock()
+
+
+def get_archive_dir() -> Path:
+    """Get the directory holding the pack files."""
+    return get_stories_dir() / ARCHIVE_DIRNAME
+
+
+def _compress(data: bytes) -> tuple[str, bytes]:
+    if ZSTD_AVAILABLE:
+        codec, packed = "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+    else:
+        codec, packed = "zlib", zlib.compress(data, 6)
+    if len(packed) > len(data) * (1 - MIN_COMPRESSION_SAVING):
+        return "raw", data
+    return codec, packed
+
+
+def _decompress(codec: str, packed: bytes) -> bytes:
+    if codec == "raw":
+        return packed
+    if codec == "zlib":
+        return zlib.decompress(packed)
+    if codec == "zstd":
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("This pack was written with zstd; install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(packed)
+    raise ValueError(f"Unknown pack codec: {codec}")
+
+
+def _read_index_file(path: Path) -> dict[str, Any]:
+    try:
+        index = json.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return {}
+    return index if isinstance(index, dict) and index.get("version") == INDEX_VERSION else {}
+
+
+def _load_index() -> dict[str, tuple[Path, dict[str, Any]]]:
+    global _index, _index_stamp
+    archive_dir = get_archive_dir()
+    try:
+        # Index files are replaced by rename, which changes the directory's mtime
+        mtime_ns = archive_dir.stat().st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    stamp = (str(archive_dir), mtime_ns)
+    with _index_lock:
+        if stamp != _index_stamp:
+            index = {}
+            for index_path in sorted(archive_dir.glob(f"*{INDEX_SUFFIX}")) if mtime_ns is not None else []:
+                for story_id, entry in _read_index_file(index_path).get("stories", {}).items():
+                    index[story_id] = (index_path, entry)
+            _index, _index_stamp = index, stamp
+        return _index
+
+
+def _lookup(story_id: str) -> tuple[Path, dict[str, Any]] | None:
+    return _load_index().get(story_id)
+
+
+def _pack_path(index_path: Path) -> Path:
+    return index_path.with_name(index_path.name[:-len(INDEX_SUFFIX)] + PACK_SUFFIX)
+
+
+@contextmanager
+def _archive_lock() -> Iterator[None]:
+    """Hold the archive's write lock, across threads and processes."""
+    with _write_lock:
+        if not FCNTL_AVAILABLE:
+            yield
+            return
+        archive_dir = get_archive_dir()
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        with open(archive_dir / ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def is_archived(story_id: str) -> bool:
+    """Check whether a story is in an archive pack."""
+    return _lookup(story_id) is not None
+
+
+def _read_entry(pack_path: Path, location: dict[str, Any]) -> bytes:
+    fd = os.open(pack_path, os.O_RDONLY)
+    try:
+        packed = os.pread(fd, location["length"], location["offset"])
+    finally:
+        os.close(fd)
+    data = _decompress(location["codec"], packed)
+    if zlib.crc32(data) != location["crc32"]:
+        raise ValueError(f"Corrupt archive entry in {pack_path.name} at offset {location['offset']}")
+    return data
+
+
+def archived_file_info(story_id: str, filename: str) -> dict[str, Any] | None:
+    """
+    Get the size and modification time of a file in an archived story.
+
+    Returns:
+        Dict with size and mtime_ns, or None if not archived
+    """
+    found = _lookup(story_id)
+    location = found[1]["files"].get(filename) if found else None
+    if location is None:
+        return None
+    return {"size": location["size"], "mtime_ns": location["mtime_ns"]}
+
+
+def archived_story_files(story_id: str) -> dict[str, int]:
+    """Get the files of an archived story (name -> original size in bytes)."""
+    found = _lookup(story_id)
+    return {name: location["size"] for name, location in found[1]["files"].items()} if found else {}
+
+
+def read_archived_file(story_id: str, filename: str, count_access: bool = True) -> bytes | None:
+    """
+    Read one file of an archived story directly from its pack.
+
+    Args:
+        story_id: Story ID
+        filename: File name in the story
+        count_access: Count the read towards promotion back to hot storage
+
+    Returns:
+        File contents, or None if the story or file is not archived
+    """
+    found = _lookup(story_id)
+    if found is None:
+        return None
+    index_path, entry = found
+    location = entry["files"].get(filename)
+    if location is None:
+        return None
+    try:
+        data = _read_entry(_pack_path(index_path), location)
+    except FileNotFoundError:
+        # Restored or expired by another process since the index was read
+        return None
+    ARCHIVE_READS_TOTAL.inc()
+    if count_access:
+        record_access(story_id)
+    return data
+
+
+def read_archived_metadata(story_id: str) -> dict[str, Any] | None:
+    """
+    Read the full story data (header plus scenes) of an archived story.
+
+    Returns:
+        Story data dictionary, or None if the story is not archived
+    """
+    raw = read_archived_file(story_id, METADATA_FILENAME)
+    if raw is None:
+        return None
+    story_data = json.loads(raw)
+    if "scenes" not in story_data:
+        scenes = read_archived_file(story_id, SCENES_FILENAME, count_access=False)
+        story_data["scenes"] = json.loads(scenes).get("scenes", []) if scenes else []
+    return story_data
+
+
+def archived_exports(story_id: str) -> dict[str, str]:
+    """Get the up-to-date exports packed with an archived story (format -> file name)."""
+    found = _lookup(story_id)
+    return dict(found[1].get("exports", {})) if found else {}
+
+
+def list_archived_stories() -> list[dict[str, Any]]:
+    """
+    List archived stories, newest first.
+
+    Returns:
+        One dict per story: id, header (metadata header), files (name ->
+        size), packed_bytes (space taken in its pack) and last_modified
+        (newest file modification time, as a timestamp)
+    """
+    stories = [
+        {
+            "id": story_id,
+            "header": entry.get("header", {}),
+            "files": archived_story_files(story_id),
+            "packed_bytes": sum(location["length"] for location in entry["files"].values()),
+            "last_modified": max((location["mtime_ns"] for location in entry["files"].values()), default=0) / 1e9,
+        }
+        for story_id, (_, entry) in _load_index().items()
+    ]
+    return sorted(stories, key=lambda story: story["id"], reverse=True)
+
+
+def is_archived_asset(filename: str) -> bool:
+    """Check whether a "<story_id>/<path>" request points into an archived story."""
+    parts = Path(filename).parts if filename else ()
+    return len(parts) > 1 and is_valid_story_id(parts[0]) and is_archived(parts[0])
+
+
+def read_archived_asset(filename: str) -> tuple[bytes, dict[str, Any]] | None:
+    """
+    Read a story file requested as "<story_id>/<file>" from the archive.
+
+    Returns:
+        Tuple of (contents, file info with name, size and mtime_ns), or None
+    """
+    parts = Path(filename).parts if filename else ()
+    if len(parts) != 2 or not is_valid_story_id(parts[0]):
+        return None
+    info = archived_file_info(parts[0], parts[1])
+    data = read_archived_file(parts[0], parts[1]) if info else None
+    return (data, {"name": parts[1], **info}) if data is not None else None
+
+
+def read_archived_export(story_id: str, file_format: str) -> tuple[bytes, dict[str, Any], dict[str, Any]] | None:
+    """
+    Read a cached export (such as the PDF) packed with an archived story.
+
+    Only exports that were up to date when the story was archived are
+    served; anything else needs the story restored and the export rebuilt.
+
+    Returns:
+        Tuple of (contents, file info with name, size and mtime_ns, metadata
+        header), or None
+    """
+    found = _lookup(story_id)
+    filename = found[1].get("exports", {}).get(file_format) if found else None
+    info = archived_file_info(story_id, filename) if filename else None
+    data = read_archived_file(story_id, filename) if info else None
+    if data is None:
+        return None
+    return data, {"name": filename, **info}, found[1].get("header", {})
+
+
+def record_access(story_id: str):
+    """Count an access to an archived story; frequent access restores it in the background."""
+    hits = int(os.getenv("ARCHIVE_PROMOTE_HITS", DEFAULT_PROMOTE_HITS))
+    if hits <= 0:
+        return
+    window = float(os.getenv("ARCHIVE_PROMOTE_WINDOW", DEFAULT_PROMOTE_WINDOW))
+    now = time.time()
+    with _access_lock:
+        recent = [t for t in _accesses.get(story_id, []) if now - t < window]
+        if recent and now - recent[-1] < ACCESS_DEDUP_SECONDS:
+            return
+        recent.append(now)
+        _accesses[story_id] = recent
+        if len(recent) < hits or story_id in _promoting:
+            return
+        _promoting.add(story_id)
+        _accesses.pop(story_id, None)
+        # Forget stories nobody has looked at within the window
+        for other in [s for s, times in _accesses.items() if now - times[-1] >= window]:
+            del _accesses[other]
+    threading.Thread(target=_promote, args=(story_id,), name=f"promote-{story_id}", daemon=True).start()
+
+
+def _promote(story_id: str):
+    try:
+        if restore_story(story_id) is not None:
+            ARCHIVE_PROMOTIONS_TOTAL.inc()
+            logger.info(f"Promoted frequently accessed story {story_id} to hot storage")
+    except Exception as e:
+        logger.error(f"Failed to promote archived story {story_id}: {e}")
+    finally:
+        with _access_lock:
+            _promoting.discard(story_id)
+
+
+def _write_index(index_path: Path, index: dict[str, Any]):
+    if index["stories"]:
+        # Fsync the directory too: story folders are deleted once this returns
+        atomic_write_bytes(index_path, json.dumps(index).encode("utf-8"), fsync_policy="full")
+    else:
+        # Every story left the pack: drop it
+        index_path.unlink(missing_ok=True)
+        _pack_path(index_path).unlink(missing_ok=True)
+    _forget_index()
+
+
+def _forget_index():
+    # Directory mtimes have clock-tick resolution, so two changes in one tick
+    # look alike: changes made by this process reload the index explicitly
+    global _index_stamp
+    with _index_lock:
+        _index_stamp = None
+
+
+def _remove_from_index(index_path: Path, story_id: str):
+    index = _read_index_file(index_path)
+    if index and index["stories"].pop(story_id, None) is not None:
+        _write_index(index_path, index)
+
+
+def restore_story(story_id: str) -> Path | None:
+    """
+    Move an archived story back to the hot tier (its story directory).
+
+    Args:
+        story_id: Story ID
+
+    Returns:
+        The story directory, or None if the story is not archived
+    """
+    with _archive_lock():
+        found = _lookup(story_id)
+        if found is None:
+            return None
+        index_path, entry = found
+        pack_path = _pack_path(index_path)
+        target = story_path(story_id)
+        staging = target.with_name(f".{story_id}.{os.getpid()}.{threading.get_ident()}.restore")
+        try:
+            staging.mkdir(parents=True)
+            for filename, location in entry["files"].items():
+                path = staging / filename
+                path.write_bytes(_read_entry(pack_path, location))
+                # Original times keep ETags and export fingerprints valid
+                os.utime(path, ns=(location["mtime_ns"], location["mtime_ns"]))
+            if target.exists():
+                logger.warning(f"{story_id} is both archived and in hot storage; keeping the hot copy")
+            else:
+                os.rename(staging, target)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        _remove_from_index(index_path, story_id)
+    logger.info(f"Restored story {story_id} from {pack_path.name}")
+    return target
+
+
+def delete_archived_story(story_id: str) -> int:
+    """
+    Delete an archived story.
+
+    Its space in the pack is reclaimed by the next compact_packs().
+
+    Returns:
+        Original size of the story in bytes (0 if it was not archived)
+    """
+    with _archive_lock():
+        found = _lookup(story_id)
+        if found is None:
+            return 0
+        index_path, entry = found
+        _remove_from_index(index_path, story_id)
+    return sum(location["size"] for location in entry["files"].values())
+
+
+def _live_bytes(index: dict[str, Any]) -> int:
+    return sum(location["length"] for entry in index["stories"].values() for location in entry["files"].values())
+
+
+def pack_usage() -> dict[str, int]:
+    """
+    Measure the disk space of the archive.
+
+    Returns:
+        pack_bytes (size of every pack file) and live_bytes (the part still
+        holding archived stories; the rest is reclaimed by compaction)
+    """
+    usage = {"pack_bytes": 0, "live_bytes": 0}
+    archive_dir = get_archive_dir()
+    for pack_path in archive_dir.glob(f"*{PACK_SUFFIX}"):
+        try:
+            usage["pack_bytes"] += pack_path.stat().st_size
+        except OSError:
+            continue
+    for index_path in archive_dir.glob(f"*{INDEX_SUFFIX}"):
+        index = _read_index_file(index_path)
+        if index:
+            usage["live_bytes"] += _live_bytes(index)
+    return usage
+
+
+def _rewrite_pack(index_path: Path, index: dict[str, Any]) -> int:
+    """Copy the live entries of a pack into a new pack; returns the new pack's size."""
+    archive_dir = index_path.parent
+    name = _new_pack_name()
+    new_pack_path = archive_dir / f"{name}{PACK_SUFFIX}"
+    with open(_pack_path(index_path), "rb") as source, open(new_pack_path, "wb") as pack:
+        for entry in index["stories"].values():
+            for location in entry["files"].values():
+                # Entries are copied still compressed; the CRC covers the original bytes
+                source.seek(location["offset"])
+                data = source.read(location["length"])
+                location["offset"] = pack.tell()
+                pack.write(data)
+        pack.flush()
+        os.fsync(pack.fileno())
+        size = pack.tell()
+    # Write the new index before deleting the old pack: a story listed in both
+    # resolves to the newer (later timestamped) index, and a reader that still
+    # holds the old pack open keeps reading it after the unlink
+    _write_index(archive_dir / f"{name}{INDEX_SUFFIX}", index)
+    index_path.unlink(missing_ok=True)
+    _pack_path(index_path).unlink(missing_ok=True)
+    return size
+
+
+def compact_packs(min_live_fraction: float = DEFAULT_COMPACT_LIVE_FRACTION, dry_run: bool = False) -> dict[str, int]:
+    """
+    Reclaim the space of restored and deleted stories in archive packs.
+
+    Packs in which less than min_live_fraction of the bytes still belong to
+    archived stories are rewritten, and pack files left without an index (by
+    an interrupted archive run) are deleted.
+
+    Args:
+        min_live_fraction: Rewrite packs with less live data than this fraction
+        dry_run: Only report what would be reclaimed
+
+    Returns:
+        Counts of compacted (or deleted) packs and bytes_freed
+    """
+    counts = {"packs": 0, "bytes_freed": 0}
+    archive_dir = get_archive_dir()
+    if not archive_dir.is_dir():
+        return counts
+    with _archive_lock():
+        for pack_path in sorted(archive_dir.glob(f"*{PACK_SUFFIX}")):
+            index_path = pack_path.with_name(pack_path.name[:-len(PACK_SUFFIX)] + INDEX_SUFFIX)
+            try:
+                pack_size = pack_path.stat().st_size
+            except OSError:
+                continue
+            index = _read_index_file(index_path)
+            live = _live_bytes(index) if index else 0
+            if live >= pack_size * min_live_fraction and live > 0:
+                continue
+            counts["packs"] += 1
+            if dry_run:
+                counts["bytes_freed"] += pack_size - live
+            elif live == 0:
+                # Only an archive run writes a pack without an index, and it
+                # holds the archive lock until the index is written
+                index_path.unlink(missing_ok=True)
+                pack_path.unlink(missing_ok=True)
+                counts["bytes_freed"] += pack_size
+            else:
+                counts["bytes_freed"] += pack_size - _rewrite_pack(index_path, index)
+    if counts["packs"] and not dry_run:
+        logger.info(f"Compacted {counts['packs']} archive packs, freeing {counts['bytes_freed']} bytes")
+    return counts
+
+
+def _is_cold(story_dir: Path, cutoff: float) -> bool:
+    if not (story_dir / METADATA_FILENAME).exists() or is_story_locked(story_dir):
+        return False
+    status = get_job_store().get(story_dir.name)
+    if status is not None and status.get("status") not in TERMINAL_STATUSES:
+        return False
+    created = story_created_at(story_dir.name)
+    created_ts = created.timestamp() if created else story_dir.stat().st_mtime
+    return created_ts < cutoff and story_last_modified(story_dir) < cutoff
+
+
+def _story_files(story_dir: Path) -> list[Path]:
+    # Stories are flat; temporary files of interrupted writes and lock files are left behind
+    return sorted(p for p in story_dir.iterdir() if p.is_file() and not p.name.endswith((".tmp", ".lock")))
+
+
+def _new_pack_name() -> str:
+    return f"pack-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{os.urandom(3).hex()}"
+
+
+def archive_stories(
+    min_age_days: float = DEFAULT_MIN_AGE_DAYS,
+    dry_run: bool = False,
+    max_pack_bytes: int = DEFAULT_MAX_PACK_MB * 1024 * 1024,
+) -> dict[str, int]:
+    """
+    Pack every story unchanged for min_age_days into archive packs.
+
+    A pack is fsynced and its index durably written before the story folders
+    are removed, so an interruption never loses a story. The web UI may write
+    to a story (regenerating a scene, building an export) while it is being
+    packed: each folder is moved aside and checked against the modification
+    time it had when it was selected, and a story that changed is put back and
+    left out of the index instead of being deleted.
+
+    Args:
+        min_age_days: Only archive stories created and last changed before this
+        dry_run: Only report what would be archived
+        max_pack_bytes: Start a new pack once one reaches this size
+
+    Returns:
+        Counts of archived stories and files, bytes_before and bytes_packed
+    """
+    counts = {"stories": 0, "files": 0, "bytes_before": 0, "bytes_packed": 0}
+    cutoff = time.time() - min_age_days * 86400
+    # (story directory, last modification when selected)
+    candidates = []
+    for story_dir in iter_story_dirs(newest_first=False):
+        try:
+            if _is_cold(story_dir, cutoff):
+                candidates.append((story_dir, story_last_modified(story_dir)))
+        except OSError as e:
+            logger.warning(f"Skipping {story_dir.name}: {e}")
+    if dry_run:
+        for story_dir, _ in candidates:
+            files = _story_files(story_dir)
+            counts["stories"] += 1
+            counts["files"] += len(files)
+            counts["bytes_before"] += sum(p.stat().st_size for p in files)
+        return counts
+    if not candidates:
+        return counts
+
+    with _archive_lock():
+        archive_dir = get_archive_dir()
+        while candidates:
+            name = _new_pack_name()
+            pack_path = archive_dir / f"{name}{PACK_SUFFIX}"
+            index_path = archive_dir / f"{name}{INDEX_SUFFIX}"
+            index = {"version": INDEX_VERSION, "created_at": datetime.now().isoformat(), "stories": {}}
+            packed = []
+            with open(pack_path, "wb") as pack:
+                while candidates and pack.tell() < max_pack_bytes:
+                    story_dir, modified = candidates.pop(0)
+                    try:
+                        index["stories"][story_dir.name] = _pack_story(pack, story_dir)
+                    except OSError as e:
+                        logger.warning(f"Could not archive {story_dir.name}: {e}")
+                        continue
+                    packed.append((story_dir, modified))
+                pack.flush()
+                os.fsync(pack.fileno())
+                counts["bytes_packed"] += pack.tell()
+
+            # Stories written to while they were being packed stay hot
+            changed = [story_dir for story_dir, modified in packed if _changed_since(story_dir, modified)]
+            for story_dir in changed:
+                index["stories"].pop(story_dir.name)
+            packed = [(story_dir, modified) for story_dir, modified in packed if story_dir not in changed]
+            _write_index(index_path, index)
+            kept = [story_dir for story_dir, modified in packed if not _remove_packed_story(story_dir, modified)]
+            if kept:
+                for story_dir in kept:
+                    index["stories"].pop(story_dir.name)
+                _write_index(index_path, index)
+            for entry in index["stories"].values():
+                counts["stories"] += 1
+                counts["files"] += len(entry["files"])
+                counts["bytes_before"] += sum(loc["size"] for loc in entry["files"].values())
+            logger.info(f"Archived {len(index['stories'])} stories into {pack_path.name}")
+    return counts
+
+
+def _changed_since(story_dir: Path, modified: float) -> bool:
+    try:
+        return story_last_modified(story_dir) != modified
+    except OSError:
+        return True
+
+
+def _remove_packed_story(story_dir: Path, modified: float) -> bool:
+    """Delete a packed story folder unless it changed; returns False if it was kept."""
+    # Moved aside first: a write that starts after this fails instead of
+    # landing in a folder about to be deleted
+    aside = story_dir.with_name(f".{story_dir.name}.{os.getpid()}.archived")
+    os.rename(story_dir, aside)
+    if _changed_since(aside, modified):
+        os.rename(aside, story_dir)
+        logger.warning(f"{story_dir.name} changed while it was being archived; kept in hot storage")
+        return False
+    shutil.rmtree(aside, ignore_errors=True)
+    return True
+
+
+def _pack_story(pack, story_dir: Path) -> dict[str, Any]:
+    """Append a story's files to an open pack; returns its index entry."""
+    files = {}
+    for path in _story_files(story_dir):
+        stat = path.stat()
+        data = path.read_bytes()
+        codec, packed = _compress(data)
+        files[path.name] = {
+            "offset": pack.tell(),
+            "length": len(packed),
+            "size": len(data),
+            "codec": codec,
+            "crc32": zlib.crc32(data),
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        pack.write(packed)
+    return {
+        "header": read_story_header(story_dir) or {},
+        "exports": current_exports(story_dir),
+        "archived_at": datetime.now().isoformat(),
+        "files": files,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Command line entry point for gemini-picturebook-archive."""
+    parser = argparse.ArgumentParser(
+        prog="gemini-picturebook-archive",
+        description="Pack cold stories into compressed archive packs, or restore them.",
+    )
+    parser.add_argument("--min-age-days", type=float,
+                        default=float(os.getenv("ARCHIVE_MIN_AGE_DAYS", DEFAULT_MIN_AGE_DAYS)),
+                        help="Archive stories unchanged for this many days (default: ARCHIVE_MIN_AGE_DAYS or 30)")
+    parser.add_argument("--max-pack-mb", type=float, default=DEFAULT_MAX_PACK_MB, help="Maximum size of one pack file")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived")
+    parser.add_argument("--restore", metavar="STORY_ID", action="append", default=[],
+                        help="Restore an archived story to hot storage (repeatable)")
+    parser.add_argument("--list", action="store_true", help="List archived stories")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for story in list_archived_stories():
+            size_mb = sum(story["files"].values()) / 1024 / 1024
+            print(f"📦 {story['id']}  {size_mb:6.1f} MB  {story['header'].get('original_prompt', '')[:50]}")
+        return 0
+
+    if args.restore:
+        for story_id in args.restore:
+            story_dir = restore_story(story_id)
+            if story_dir is None:
+                print(f"❌ {story_id} is not archived")
+                return 1
+            print(f"♻️  Restored {story_id} to {story_dir}")
+        return 0
+
+    if not ZSTD_AVAILABLE and not args.dry_run:
+        print("💡 zstandard is not installed; packing with zlib (pip install 'gemini-picturebook-generator[archive]')")
+    print(f"📦 {'Checking' if args.dry_run else 'Archiving'} stories older than {args.min_age_days:g} days in {get_stories_dir()}")
+    counts = archive_stories(args.min_age_days, dry_run=args.dry_run, max_pack_bytes=int(args.max_pack_mb * 1024 * 1024))
+    verb = "would archive" if args.dry_run else "archived"
+    summary = f"✅ {verb} {counts['stories']} stories ({counts['files']} files, {counts['bytes_before'] / 1024 / 1024:.1f} MB)"
+    if not args.dry_run and counts["stories"]:
+        summary += f" into {counts['bytes_packed'] / 1024 / 1024:.1f} MB of packs"
+    print(summary)
+    compacted = compact_packs(dry_run=args.dry_run)
+    if compacted["packs"]:
+        print(f"🗜️  {'Would compact' if args.dry_run else 'Compacted'} {compacted['packs']} packs, "
+              f"freeing {compacted['bytes_freed'] / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
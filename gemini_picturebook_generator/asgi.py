@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+ASGI Web UI for Gemini Picture Book Generator
+
+The web UI as an asyncio application, sharing one event loop with the MCP
+server: both submit to the same story scheduler (queue and concurrency limit),
+use the same model client, read the same job store and serve the same story
+catalog. It serves the same pages and JSON endpoints as the Flask UI, plus:
+
+- GET /events/<story_id>: Server-Sent Events stream of a job's progress. A
+  viewer is one queue subscribed to the job, so idle viewers cost a socket and
+  a few bytes of keep-alive, not a thread or a poll every few seconds.
+- /mcp: the MCP server's streamable HTTP endpoint (set ASGI_MOUNT_MCP=0 to
+  serve the web UI alone).
+
+Files are sent asynchronously, with ETag and Range support, and anything that
+touches the disk or the model runs in a worker thread, off the loop.
+
+Run it standalone with `gemini-picturebook-asgi` (WEB_BIND, default
+0.0.0.0:8080), any ASGI server that takes an app factory
+(`uvicorn --factory gemini_picturebook_generator.asgi:create_asgi_app`), or
+inside the stdio MCP server by setting MCP_WEB_BIND (see mcp_server.py).
+Importing this module builds nothing: the MCP server, with its signal
+handlers and log file, is only imported when an app mounting it is created.
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import mimetypes
+import os
+from email.utils import formatdate
+from pathlib import Path
+from typing import Any
+from urllib.parse import quote
+
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    select_autoescape,
+)
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+from starlette.types import Scope
+
+from .archive import is_archived_asset, read_archived_asset, read_archived_export
+from .backends import enable_server_mode, is_api_configured
+from .catalog import (
+    find_story_asset,
+    find_story_dir,
+    find_story_file,
+    get_stories_dir,
+    is_internal_path,
+    list_gallery_stories,
+    story_url_path,
+)
+from .enhanced_story_generator import regenerate_scene, setup_client
+from .exports import EXPORT_FORMATS, get_export, story_download_name
+from .job_store import TERMINAL_STATUSES, get_job_store
+from .jobs import INFLIGHT
+from .metrics import REGISTRY
+from .progress import ProgressQueue
+from .retention import start_background_gc, stop_background_gc
+from .scheduler import STATUS_POLL_INTERVAL, get_scheduler
+from .storage import story_asset_url, story_file_url
+from .story_metadata import read_story_metadata
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = Path(__file__).parent / "templates"
+
+# Cache lifetime (seconds) for downloads; revalidated cheaply via ETag
+DOWNLOAD_MAX_AGE = 3600
+
+# Idle SSE streams send a comment this often so proxies keep them open
+SSE_KEEPALIVE_SECONDS = 15
+
+
+def _create_templates() -> Jinja2Templates:
+    # Same bytecode cache as the Flask UI (JINJA_CACHE_DIR), so either app
+    # reuses templates the other already compiled
+    cache_dir = os.getenv("JINJA_CACHE_DIR")
+    if cache_dir:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=select_autoescape(["html", "xml"]),
+        bytecode_cache=FileSystemBytecodeCache(cache_dir or None),
+    )
+    return Jinja2Templates(env=env)
+
+
+templates = _create_templates()
+
+
+async def index(request: Request) -> Response:
+    """Main page with modern interface."""
+    return templates.TemplateResponse(request, "index.html", {"api_key_configured": is_api_configured()})
+
+
+async def generate_story(request: Request) -> Response:
+    """Queue a story on the shared scheduler."""
+    if not is_api_configured():
+        return JSONResponse({"error": "API key not configured"}, status_code=400)
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return JSONResponse({"error": "Invalid request data"}, status_code=400)
+
+    story_prompt = str(data.get("story_prompt", "")).strip()
+    try:
+        num_scenes = max(int(data.get("num_scenes", 6)), 1)
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "num_scenes must be a number"}, status_code=400)
+
+    try:
+        job = get_scheduler().submit(
+            story_prompt, num_scenes,
+            character_name=str(data.get("character_name", "")).strip(),
+            setting=str(data.get("setting", "")).strip(),
+            style=str(data.get("style", "cartoon")).strip() or "cartoon",
+        )
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    return JSONResponse({
+        "story_id": job["story_id"],
+        "num_scenes": num_scenes,
+        "estimated_minutes": num_scenes * 6 / 60,
+        "coalesced": job["coalesced"],
+    })
+
+
+async def get_status(request: Request) -> Response:
+    """Get detailed generation status."""
+    status = get_job_store().get(request.path_params["story_id"])
+    if status is None:
+        return JSONResponse({"status": "not_found"}, status_code=404)
+    return JSONResponse(status)
+
+
+def _sse(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _stream_job(story_id: str):
+    """Yield a job's progress as SSE messages, ending with its final status."""
+    flight = INFLIGHT.get(story_id)
+    if flight is not None:
+        events = ProgressQueue()
+        flight.subscribe(events)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.__anext__(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                except StopAsyncIteration:
+                    break
+                yield _sse("progress", event)
+        finally:
+            flight.unsubscribe(events)
+        # The generator's last event can arrive before the job's final status is stored
+        with contextlib.suppress(Exception):
+            await get_scheduler().wait(story_id)
+
+    # Jobs run by another process are followed through the job store
+    job_store = get_job_store()
+    last_update = None
+    idle = 0.0
+    while True:
+        status = job_store.get(story_id)
+        if status is None:
+            yield _sse("status", {"status": "not_found"})
+            return
+        if status.get("status") in TERMINAL_STATUSES:
+            yield _sse("status", status)
+            return
+        if status.get("updated_at") != last_update:
+            last_update = status.get("updated_at")
+            idle = 0.0
+            yield _sse("status", status)
+        elif idle >= SSE_KEEPALIVE_SECONDS:
+            idle = 0.0
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(STATUS_POLL_INTERVAL)
+        idle += STATUS_POLL_INTERVAL
+
+
+async def story_events(request: Request) -> Response:
+    """Stream a job's progress events (Server-Sent Events) until it finishes."""
+    story_id = request.path_params["story_id"]
+    if INFLIGHT.get(story_id) is None and story_id not in get_job_store():
+        return JSONResponse({"status": "not_found"}, status_code=404)
+    return StreamingResponse(
+        _stream_job(story_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def metrics(request: Request) -> Response:
+    """Expose generation metrics in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def serve_image(request: Request) -> Response:
+    """Serve generated images (or redirect to them in remote storage)."""
+    url = await run_in_threadpool(story_asset_url, request.path_params["filename"])
+    if url:
+        return RedirectResponse(url, status_code=302)
+    filename = request.path_params["filename"]
+    image_path = await run_in_threadpool(find_story_asset, filename, False)
+    if image_path is None:
+        # Archived stories are served straight from their pack
+        archived = await run_in_threadpool(read_archived_asset, filename)
+        if archived is not None:
+            return send_archived_file(request, *archived)
+        # A file the pack does not have is not worth restoring the story for
+        if not await run_in_threadpool(is_archived_asset, filename):
+            image_path = await run_in_threadpool(find_story_asset, filename)
+    if image_path is None:
+        return PlainTextResponse("Image not found", status_code=404)
+    return FileResponse(image_path)
+
+
+async def regenerate_story_scene(request: Request) -> Response:
+    """Regenerate a single scene of a finished story."""
+    if not is_api_configured():
+        return JSONResponse({"error": "API key not configured"}, status_code=400)
+
+    story_id = request.path_params["story_id"]
+    scene_number = request.path_params["scene_number"]
+    story_dir = await run_in_threadpool(find_story_dir, story_id)
+    if story_dir is None:
+        return JSONResponse({"error": "Story not found"}, status_code=404)
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    prompt_override = str((data or {}).get("prompt_override", "")).strip() or None
+
+    def run():
+        enable_server_mode()
+        return regenerate_scene(
+            setup_client(), story_dir, scene_number, prompt_override,
+            progress_callback=lambda event: None,
+        )
+
+    try:
+        story_data = await run_in_threadpool(run)
+    except (ValueError, FileNotFoundError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if not story_data:
+        return JSONResponse(
+            {"error": f"Scene {scene_number} could not be regenerated. Check your API quota."},
+            status_code=502,
+        )
+
+    return JSONResponse({
+        "story_id": story_id,
+        "scene_number": scene_number,
+        "scene": [s for s in story_data["scenes"] if s.get("scene_number") == scene_number],
+        "revision": story_data.get("scene_revisions", {}).get(str(scene_number), 1),
+    })
+
+
+def _resolve_export(story_id: str, file_format: str) -> tuple[Path | None, Path | None]:
+    story_dir = find_story_dir(story_id)
+    if story_dir is None or file_format not in EXPORT_FORMATS:
+        return story_dir, None
+    return story_dir, get_export(story_dir, file_format) or find_story_file(story_dir, file_format)
+
+
+async def download_story(request: Request) -> Response:
+    """Download story in specified format, resolved from the story catalog."""
+    story_id = request.path_params["story_id"]
+    file_format = request.path_params["format"]
+    if file_format in EXPORT_FORMATS and await run_in_threadpool(find_story_dir, story_id, False) is None:
+        # An export packed with an archived story is sent without restoring it
+        archived = await run_in_threadpool(read_archived_export, story_id, file_format)
+        if archived is not None:
+            data, info, header = archived
+            return send_archived_file(request, data, info, story_download_name(header, file_format))
+    # Exports are built on first request, which can take a while for PDFs
+    story_dir, file_path = await run_in_threadpool(_resolve_export, story_id, file_format)
+    if story_dir is None:
+        status = get_job_store().get(story_id)
+        if status is not None and status["status"] != "complete":
+            return PlainTextResponse("Story not ready", status_code=400)
+        return PlainTextResponse("Story not found", status_code=404)
+    if file_format not in EXPORT_FORMATS:
+        return PlainTextResponse("Unsupported format", status_code=404)
+    if file_path is None:
+        return PlainTextResponse("File not found", status_code=404)
+
+    story_data = await run_in_threadpool(read_story_metadata, story_dir) or {}
+    download_name = story_download_name(story_data, file_format)
+    # With remote storage the client downloads straight from the object store
+    url = await run_in_threadpool(story_file_url, story_dir, file_path, download_name)
+    if url:
+        return RedirectResponse(url, status_code=302)
+    return send_story_file(request, file_path, download_name)
+
+
+async def view_story(request: Request) -> Response:
+    """Open a story export in the browser, building it on first request."""
+    story_dir, file_path = await run_in_threadpool(
+        _resolve_export, request.path_params["story_id"], request.path_params["format"],
+    )
+    if story_dir is None or request.path_params["format"] not in EXPORT_FORMATS:
+        return PlainTextResponse("Story not found", status_code=404)
+    if file_path is None:
+        return PlainTextResponse("File not found", status_code=404)
+
+    # Redirect so relative image links in the HTML resolve against the story folder
+    return RedirectResponse(f"/generated_stories/{story_url_path(story_dir)}/{file_path.name}", status_code=302)
+
+
+def send_story_file(request: Request, file_path: Path, download_name: str) -> Response:
+    """
+    Send a story file with conditional and range request support.
+
+    Same caching contract as the Flask UI: the ETag comes from the file's size
+    and modification time, so a repeat download answers If-None-Match with a
+    304, and Range requests get 206 partial content.
+    """
+    stat = file_path.stat()
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={DOWNLOAD_MAX_AGE}"}
+    if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(file_path, filename=download_name, stat_result=stat, headers=headers)
+
+
+def send_archived_file(
+    request: Request, data: bytes, info: dict[str, Any], download_name: str | None = None,
+) -> Response:
+    """
+    Send a file read from an archive pack, with the same caching contract.
+
+    The ETag uses the file's original size and modification time, so it
+    matches the one sent before the story was archived (and after a restore).
+    A single byte range is answered with 206; without a download name the
+    file is sent inline, as an image.
+    """
+    etag = f'"{info["mtime_ns"]:x}-{info["size"]:x}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={DOWNLOAD_MAX_AGE}",
+        "Last-Modified": formatdate(info["mtime_ns"] / 1e9, usegmt=True),
+        "Accept-Ranges": "bytes",
+    }
+    if download_name:
+        # Same Content-Disposition as FileResponse
+        quoted = quote(download_name)
+        headers["Content-Disposition"] = (
+            f'attachment; filename="{download_name}"' if quoted == download_name
+            else f"attachment; filename*=utf-8''{quoted}"
+        )
+    if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+    media_type = mimetypes.guess_type(download_name or info["name"])[0] or "application/octet-stream"
+
+    range_header = request.headers.get("range", "")
+    if_range = request.headers.get("if-range")
+    if range_header.startswith("bytes=") and "," not in range_header and if_range in (None, etag):
+        start, _, end = range_header[6:].strip().partition("-")
+        try:
+            if start:
+                first, last = int(start), int(end) if end else len(data) - 1
+            else:
+                first, last = max(len(data) - int(end), 0), len(data) - 1
+        except ValueError:
+            first, last = 0, -1
+        last = min(last, len(data) - 1)
+        if not 0 <= first <= last:
+            headers["Content-Range"] = f"bytes */{len(data)}"
+            return Response(status_code=416, headers=headers)
+        headers["Content-Range"] = f"bytes {first}-{last}/{len(data)}"
+        return Response(data[first:last + 1], status_code=206, headers=headers, media_type=media_type)
+    return Response(data, headers=headers, media_type=media_type)
+
+
+async def gallery(request: Request) -> Response:
+    """Enhanced gallery with better sorting and display."""
+    stories = await run_in_threadpool(list_gallery_stories)
+    return templates.TemplateResponse(request, "gallery.html", {"stories": stories})
+
+
+class StoryFiles(StaticFiles):
+    """Static files under the stories directory, minus the server's own."""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        # Job records, caches, archive packs and lock files are not for the browser
+        if is_internal_path(path):
+            return PlainTextResponse("File not found", status_code=404)
+        return await super().get_response(path, scope)
+
+
+def _mount_mcp() -> tuple[list, Any]:
+    # Imported on demand: the MCP server module registers signal handlers and logging
+    from .mcp_server import mcp
+
+    mcp_app = mcp.streamable_http_app()
+    return list(mcp_app.routes), mcp.session_manager
+
+
+def create_asgi_app(include_mcp: bool | None = None) -> Starlette:
+    """
+    Create the ASGI web UI application.
+
+    Args:
+        include_mcp: Also serve the MCP streamable HTTP endpoint at /mcp
+            (default: ASGI_MOUNT_MCP, on unless set to 0)
+
+    Returns:
+        Starlette application
+    """
+    if include_mcp is None:
+        include_mcp = os.getenv("ASGI_MOUNT_MCP", "1") != "0"
+
+    routes = [
+        Route("/", index),
+        Route("/generate", generate_story, methods=["POST"]),
+        Route("/status/{story_id}", get_status),
+        Route("/events/{story_id}", story_events),
+        Route("/metrics", metrics),
+        Route("/images/{filename:path}", serve_image),
+        Route("/regenerate/{story_id}/{scene_number:int}", regenerate_story_scene, methods=["POST"]),
+        Route("/download/{story_id}/{format}", download_story),
+        Route("/view/{story_id}/{format}", view_story),
+        Route("/gallery", gallery),
+        Mount("/generated_stories", StoryFiles(directory=get_stories_dir(), check_dir=False)),
+    ]
+    session_manager = None
+    if include_mcp:
+        mcp_routes, session_manager = _mount_mcp()
+        routes.extend(mcp_routes)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(asgi_app):
+        enable_server_mode()
+        start_background_gc()
+        async with contextlib.AsyncExitStack() as stack:
+            if session_manager is not None:
+                await stack.enter_async_context(session_manager.run())
+            try:
+                yield
+            finally:
+                get_scheduler().cancel_all()
+                stop_background_gc()
+
+    return Starlette(routes=routes, lifespan=lifespan)
+
+
+def parse_bind(bind: str) -> tuple[str, int]:
+    """Split a HOST:PORT address (as used by WEB_BIND and MCP_WEB_BIND)."""
+    host, _, port = bind.rpartition(":")
+    return host or "0.0.0.0", int(port)
+
+
+def create_embedded_server(bind: str):
+    """
+    Build a uvicorn server for the web UI that runs on the caller's event loop.
+
+    Used by the stdio MCP server: the server leaves signal handling to its
+    host and logs to stderr only, since stdout carries the MCP protocol.
+
+    Args:
+        bind: HOST:PORT to listen on
+
+    Returns:
+        uvicorn.Server; run it with `await server.serve()`, stop it by setting
+        `server.should_exit`
+    """
+    import uvicorn
+
+    class EmbeddedServer(uvicorn.Server):
+        @contextlib.contextmanager
+        def capture_signals(self):
+            yield
+
+    host, port = parse_bind(bind)
+    config = uvicorn.Config(
+        create_asgi_app(include_mcp=False),
+        host=host,
+        port=port,
+        log_config=None,
+        access_log=False,
+    )
+    return EmbeddedServer(config)
+
+
+def main():
+    """Serve the ASGI web UI (and the MCP HTTP endpoint) with uvicorn."""
+    import uvicorn
+
+    app = create_asgi_app()
+    host, port = parse_bind(os.getenv("WEB_BIND", "0.0.0.0:8080"))
+    print(f"🚀 Serving AI Story Generator (ASGI) on http://{host}:{port}")
+    print("📡 Live progress: /events/<story_id>")
+    if any(getattr(route, "path", None) == "/mcp" for route in app.routes):
+        print(f"🔌 MCP endpoint: http://{host}:{port}/mcp")
+    uvicorn.run(app, host=host, port=port, timeout_keep_alive=int(os.getenv("WEB_KEEPALIVE", "5")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Model Backends for Gemini Picture Book Generator
+
+Every model call goes through a client object exposing
+client.models.generate_content(model=..., contents=..., config=...), the
+interface of google.genai.Client. This module selects which implementation is
+used, via the PICTUREBOOK_BACKEND environment variable:
+
+- "gemini" (default): the real Google Gemini API
+- "fake": an offline stand-in that returns synthetic story text and generated
+  PNG images, with configurable latency, error rate and 429 rate. It lets the
+  web UI, MCP server and benchmarks run under realistic load without quota.
+
+Real backend keys come from GOOGLE_API_KEY or, for several keys whose quotas
+add up, the comma-separated GOOGLE_API_KEYS (see keypool.py).
+
+Fake backend settings (all optional):
+
+- FAKE_GEMINI_LATENCY: base seconds per request (default 0.05)
+- FAKE_GEMINI_LATENCY_PER_SCENE: extra seconds per generated scene (default 0.01)
+- FAKE_GEMINI_ERROR_RATE: probability of a 503 UNAVAILABLE error (default 0)
+- FAKE_GEMINI_429_RATE: probability of a 429 RESOURCE_EXHAUSTED error (default 0)
+- FAKE_GEMINI_IMAGE_SIZE: width/height of generated images in pixels (default 256)
+- FAKE_GEMINI_SEED: seed for deterministic failures and images
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections.abc import Callable
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Any
+
+BACKEND_ENV = "PICTUREBOOK_BACKEND"
+DEFAULT_BACKEND = "gemini"
+
+PLACEHOLDER_API_KEY = "your_google_api_key_here"
+
+# Set by the web UI and MCP server, where nobody can answer an input() prompt
+_server_mode = False
+
+
+def enable_server_mode():
+    """Mark this process as a server, disabling interactive prompts."""
+    global _server_mode
+    _server_mode = True
+
+
+def allow_interactive_input() -> bool:
+    """Check whether it is safe to prompt on stdin (never in server modes)."""
+    if _server_mode or os.getenv("MCP_SERVER_MODE", "").strip().lower() in ("1", "true", "yes"):
+        return False
+    return sys.stdin is not None and sys.stdin.isatty()
+
+
+def get_api_keys() -> list[str]:
+    """
+    Get the configured API keys.
+
+    Returns:
+        Keys from GOOGLE_API_KEYS (comma-separated) and GOOGLE_API_KEY,
+        de-duplicated and without the template placeholder
+    """
+    raw = [*os.getenv("GOOGLE_API_KEYS", "").split(","), os.getenv("GOOGLE_API_KEY", "")]
+    keys = []
+    for key in (k.strip() for k in raw):
+        if key and key != PLACEHOLDER_API_KEY and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def get_backend_name() -> str:
+    """Get the configured model backend name."""
+    return os.getenv(BACKEND_ENV, DEFAULT_BACKEND).strip().lower() or DEFAULT_BACKEND
+
+
+def is_fake_backend() -> bool:
+    """Check whether the offline fake backend is selected."""
+    return get_backend_name() == "fake"
+
+
+def is_api_configured() -> bool:
+    """Check whether the selected backend can be used (fake needs no API key)."""
+    if is_fake_backend():
+        return True
+    return bool(get_api_keys())
+
+
+def _create_gemini_client(api_key: str | None) -> Any:
+    from google import genai
+
+    return genai.Client(api_key=api_key)
+
+
+def _create_fake_client(api_key: str | None) -> Any:
+    return FakeGeminiClient.from_env()
+
+
+_BACKENDS: dict[str, Callable[[str | None], Any]] = {
+    "gemini": _create_gemini_client,
+    "fake": _create_fake_client,
+}
+
+
+def register_backend(name: str, factory: Callable[[str | None], Any]):
+    """
+    Register a model backend.
+
+    Args:
+        name: Backend name selectable via PICTUREBOOK_BACKEND
+        factory: Callable taking an API key (or None) and returning a client
+    """
+    _BACKENDS[name.lower()] = factory
+
+
+def create_client(api_key: str | None = None) -> Any:
+    """
+    Create a client for the configured backend.
+
+    Args:
+        api_key: API key for backends that need one
+
+    Returns:
+        Client exposing models.generate_content()
+
+    Raises:
+        ValueError: If the configured backend is unknown
+    """
+    name = get_backend_name()
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown model backend '{name}'. Available: {', '.join(sorted(_BACKENDS))}")
+    return _BACKENDS[name](api_key)
+
+
+class FakeAPIError(Exception):
+    """Error raised by the fake backend, shaped like google.genai API errors."""
+
+    def __init__(self, code: int, status: str, message: str, retry_after: float | None = None):
+        super().__init__(f"{code} {status}. {message}")
+        self.code = code
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+
+
+@lru_cache(maxsize=64)
+def make_png(size: int, color: tuple[int, int, int]) -> bytes:
+    """
+    Encode a simple gradient PNG without needing Pillow.
+
+    Args:
+        size: Width and height in pixels
+        color: Base RGB color
+
+    Returns:
+        PNG file bytes
+    """
+    red, green, blue = color
+    rows = []
+    for y in range(size):
+        shade = y * 255 // max(size - 1, 1)
+        pixel = bytes(((red + shade) // 2, (green + shade) // 2, blue))
+        rows.append(b"\x00" + pixel * size)
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+class FakeGeminiClient:
+    """Offline stand-in for google.genai.Client."""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        latency_per_scene: float = 0.01,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        image_size: int = 256,
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.latency_per_scene = latency_per_scene
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.image_size = image_size
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.models = _FakeModels(self)
+
+    @classmethod
+    def from_env(cls) -> "FakeGeminiClient":
+        """Create a fake client configured from FAKE_GEMINI_* variables."""
+        seed = os.getenv("FAKE_GEMINI_SEED")
+        return cls(
+            latency=float(os.getenv("FAKE_GEMINI_LATENCY", "0.05")),
+            latency_per_scene=float(os.getenv("FAKE_GEMINI_LATENCY_PER_SCENE", "0.01")),
+            error_rate=float(os.getenv("FAKE_GEMINI_ERROR_RATE", "0")),
+            rate_limit_rate=float(os.getenv("FAKE_GEMINI_429_RATE", "0")),
+            image_size=int(os.getenv("FAKE_GEMINI_IMAGE_SIZE", "256")),
+            seed=int(seed) if seed else None,
+        )
+
+    def _roll(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+
+class _FakeModels:
+    """Implements client.models for the fake backend."""
+
+    def __init__(self, client: FakeGeminiClient):
+        self._client = client
+
+    def generate_content(self, model: str, contents: Any, config: Any = None) -> SimpleNamespace:
+        client = self._client
+        prompt = contents if isinstance(contents, str) else str(contents)
+        match = re.search(r"Create a (\d+)-scene story", prompt)
+        num_scenes = int(match.group(1)) if match else 1
+
+        modalities = [m.lower() for m in (getattr(config, "response_modalities", None) or [])]
+        with_images = "image" in modalities
+
+        time.sleep(client.latency + (client.latency_per_scene * num_scenes if with_images else 0))
+
+        roll = client._roll()
+        if roll < client.rate_limit_rate:
+            raise FakeAPIError(429, "RESOURCE_EXHAUSTED", "Fake quota exceeded, rate limit reached.", retry_after=1.0)
+        if roll < client.rate_limit_rate + client.error_rate:
+            raise FakeAPIError(503, "UNAVAILABLE", "The fake model is overloaded. Please try again later.")
+
+        if not with_images:
+            parts = [SimpleNamespace(text=f"Hello from the fake {model} backend! I'm working.", inline_data=None)]
+        else:
+            parts = []
+            for scene in range(1, num_scenes + 1):
+                parts.append(SimpleNamespace(
+                    text=f"**Scene {scene}:** A synthetic scene generated offline for load testing.",
+                    inline_data=None,
+                ))
+                color = (scene * 67 % 256, scene * 131 % 256, scene * 29 % 256)
+                parts.append(SimpleNamespace(
+                    text=None,
+                    inline_data=SimpleNamespace(mime_type="image/png", data=make_png(client.image_size, color)),
+                ))
+
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts))])
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Headless Batch Generation for Gemini Picture Book Generator
+
+Generates every story listed in a JSONL spec file without any prompts, so large
+catalog builds can run unattended. Each line of the spec file is one book:
+
+    {"prompt": "A fox learns to fly", "scenes": 6, "style": "watercolor",
+     "character": "Fenn", "setting": "a windy valley", "id": "fox-01"}
+
+Only "prompt" is required. Specs are generated by a bounded pool of workers
+that share the process-wide request limiter (GEMINI_RPM), so raising the
+concurrency fills the quota without exceeding it. One JSON line per finished
+spec is appended to the results file as soon as it completes; rerunning the
+same command skips every spec already recorded as "ok" and retries the rest.
+
+Usage:
+    gemini-picturebook-batch specs.jsonl --concurrency 4 --export html,pdf
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from .backends import enable_server_mode
+from .catalog import create_story_dir
+from .enhanced_story_generator import generate_custom_story_with_images, setup_client
+from .exports import EXPORT_FORMATS, get_export
+from .jobs import generation_key
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_SCENES = 6
+DEFAULT_STYLE = "cartoon"
+
+
+class SpecError(ValueError):
+    """Raised for a spec line that cannot be generated."""
+
+
+def parse_spec(line: str, line_number: int) -> dict[str, Any]:
+    """
+    Parse and normalize one line of a spec file.
+
+    Args:
+        line: JSON object text
+        line_number: 1-based line number, used in errors and default ids
+
+    Returns:
+        Spec with prompt, scenes, style, character, setting and id
+
+    Raises:
+        SpecError: If the line is not a JSON object with a prompt
+    """
+    try:
+        raw = json.loads(line)
+    except ValueError as e:
+        raise SpecError(f"line {line_number}: invalid JSON ({e})") from e
+    if not isinstance(raw, dict):
+        raise SpecError(f"line {line_number}: expected a JSON object")
+
+    prompt = str(raw.get("prompt") or raw.get("story_prompt") or "").strip()
+    if not prompt:
+        raise SpecError(f"line {line_number}: missing prompt")
+    try:
+        scenes = max(1, int(raw.get("scenes", raw.get("num_scenes", DEFAULT_SCENES))))
+    except (TypeError, ValueError) as e:
+        raise SpecError(f"line {line_number}: scenes must be a number") from e
+
+    spec = {
+        "prompt": prompt,
+        "scenes": scenes,
+        "style": str(raw.get("style") or DEFAULT_STYLE),
+        "character": str(raw.get("character") or raw.get("character_name") or ""),
+        "setting": str(raw.get("setting") or ""),
+    }
+    # Without an explicit id, identical specs share one id and are built once
+    spec["id"] = str(raw.get("id") or generation_key(
+        spec["prompt"], spec["scenes"], spec["character"], spec["setting"], spec["style"]
+    )[:16])
+    return spec
+
+
+def load_specs(spec_path: Path) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    Read a spec file.
+
+    Returns:
+        Tuple of (specs in file order without duplicate ids, invalid-line results)
+    """
+    specs: list[dict[str, Any]] = []
+    invalid: list[dict[str, Any]] = []
+    seen: set[str] = set()
+    with open(spec_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            try:
+                spec = parse_spec(line, line_number)
+            except SpecError as e:
+                invalid.append({"spec_id": f"line-{line_number}", "line": line_number, "status": "invalid", "error": str(e)})
+                continue
+            if spec["id"] in seen:
+                continue
+            seen.add(spec["id"])
+            spec["line"] = line_number
+            specs.append(spec)
+    return specs, invalid
+
+
+def _read_results(results_path: Path) -> Iterator[dict[str, Any]]:
+    # A line cut short by an interruption is skipped
+    try:
+        with open(results_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(result, dict):
+                    yield result
+    except FileNotFoundError:
+        pass
+
+
+def load_completed(results_path: Path) -> set[str]:
+    """
+    Get the ids of specs the results file already records as generated.
+
+    A line cut short by an interruption is ignored, so its spec runs again.
+    """
+    return {result.get("spec_id") for result in _read_results(results_path) if result.get("status") == "ok"}
+
+
+def load_recorded_invalid(results_path: Path) -> set[tuple[Any, Any]]:
+    """Get the (spec_id, error) pairs of invalid spec lines the results file already records."""
+    return {
+        (result.get("spec_id"), result.get("error"))
+        for result in _read_results(results_path)
+        if result.get("status") == "invalid"
+    }
+
+
+class ResultWriter:
+    """Appends result lines durably, one complete line per finished spec."""
+
+    def __init__(self, results_path: Path):
+        self.path = results_path
+        self._lock = threading.Lock()
+
+    def write(self, result: dict[str, Any]):
+        line = json.dumps(result, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _build_prompt(spec: dict[str, Any]) -> str:
+    prompt = spec["prompt"]
+    if spec["character"]:
+        prompt = f"A story about {spec['character']}: {prompt}"
+    if spec["setting"]:
+        prompt += f" The story takes place in {spec['setting']}."
+    prompt += f" Create this in {spec['style']} art style."
+    return prompt
+
+
+def _batch_progress(spec_id: str):
+    """Print a one-line update per scene, prefixed with the spec id."""
+    def callback(event: dict[str, Any]):
+        if event["event"] == "scene_image":
+            print(f"   [{spec_id}] 🖼️  scene {event['scene']} saved")
+        elif event["event"] == "failed":
+            print(f"   [{spec_id}] ❌ {event['message']}")
+    return callback
+
+
+def run_spec(client: Any, spec: dict[str, Any], export_formats: list[str]) -> dict[str, Any]:
+    """
+    Generate one spec and describe the outcome.
+
+    Args:
+        client: Model client shared by all workers
+        spec: Spec from parse_spec()
+        export_formats: Export formats to build after generation
+
+    Returns:
+        Result record for the results file
+    """
+    started = time.perf_counter()
+    result: dict[str, Any] = {"spec_id": spec["id"], "line": spec["line"], "prompt": spec["prompt"]}
+    story_id, output_dir = create_story_dir()
+    result.update(story_id=story_id, output_dir=str(output_dir))
+    try:
+        story_data = generate_custom_story_with_images(
+            client, _build_prompt(spec), spec["scenes"], output_dir,
+            extra_metadata={
+                "id": story_id,
+                "character_name": spec["character"],
+                "setting": spec["setting"],
+                "style": spec["style"],
+                "output_dir": str(output_dir),
+                "batch_spec_id": spec["id"],
+                "batch_generated": True,
+            },
+            progress_callback=_batch_progress(spec["id"]),
+        )
+        if not story_data:
+            raise RuntimeError("Story generation returned no data (check API quota and logs)")
+        exports = {}
+        for file_format in export_formats:
+            export_path = get_export(output_dir, file_format)
+            exports[file_format] = str(export_path) if export_path else None
+        result.update(
+            status="ok",
+            scenes=len([s for s in story_data["scenes"] if s["type"] == "image"]),
+            exports=exports,
+        )
+    except Exception as e:
+        result.update(status="failed", error=str(e))
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    result["finished_at"] = datetime.now().isoformat()
+    return result
+
+
+def run_batch(
+    spec_path: Path,
+    results_path: Path,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    export_formats: list[str] | None = None,
+    resume: bool = True,
+) -> dict[str, int]:
+    """
+    Generate every pending spec of a spec file.
+
+    Args:
+        spec_path: JSONL spec file
+        results_path: JSONL results file (appended to)
+        concurrency: Specs generated at the same time
+        export_formats: Export formats to build for each story
+        resume: Skip specs already recorded as "ok" in the results file
+
+    Returns:
+        Counts of ok, failed, invalid and skipped specs
+    """
+    enable_server_mode()
+    specs, invalid = load_specs(spec_path)
+    completed = load_completed(results_path) if resume else set()
+    pending = [spec for spec in specs if spec["id"] not in completed]
+    writer = ResultWriter(results_path)
+    counts = {"ok": 0, "failed": 0, "invalid": len(invalid), "skipped": len(specs) - len(pending)}
+    # A rerun reports invalid lines again but records each one only once
+    recorded = load_recorded_invalid(results_path)
+    for result in invalid:
+        print(f"⚠️  Skipping {result['error']}")
+        if (result["spec_id"], result["error"]) not in recorded:
+            writer.write(result)
+
+    print(f"📚 {len(pending)} stories to generate ({counts['skipped']} already done), {concurrency} at a time")
+    if not pending:
+        return counts
+
+    client = setup_client()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch") as executor:
+        futures = {executor.submit(run_spec, client, spec, export_formats or []): spec for spec in pending}
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                writer.write(result)
+                counts[result["status"]] += 1
+                done = counts["ok"] + counts["failed"]
+                if result["status"] == "ok":
+                    print(f"✅ [{done}/{len(pending)}] {result['spec_id']}: {result['scenes']} scenes in {result['seconds']}s")
+                else:
+                    print(f"❌ [{done}/{len(pending)}] {result['spec_id']}: {result['error']}")
+        except KeyboardInterrupt:
+            print("\n⏹️  Interrupted; waiting for running stories, then stopping. Rerun to resume.")
+            for future in futures:
+                future.cancel()
+            raise
+    return counts
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Command line entry point for gemini-picturebook-batch."""
+    parser = argparse.ArgumentParser(
+        prog="gemini-picturebook-batch",
+        description="Generate picture books from a JSONL file of specs, with resume.",
+    )
+    parser.add_argument("specs", type=Path, help="JSONL file with one spec per line")
+    parser.add_argument("-o", "--results", type=Path, help="Results JSONL (default: <specs>.results.jsonl)")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Stories generated at once")
+    parser.add_argument("--export", default="", help=f"Comma-separated formats to build: {', '.join(EXPORT_FORMATS)}")
+    parser.add_argument("--no-resume", action="store_true", help="Regenerate specs already recorded as ok")
+    args = parser.parse_args(argv)
+
+    export_formats = [fmt.strip() for fmt in args.export.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in export_formats if fmt not in EXPORT_FORMATS]
+    if unknown:
+        parser.error(f"unknown export format(s): {', '.join(unknown)}")
+    if not args.specs.is_file():
+        parser.error(f"spec file not found: {args.specs}")
+    results_path = args.results or args.specs.with_name(f"{args.specs.stem}.results.jsonl")
+
+    try:
+        counts = run_batch(args.specs, results_path, args.concurrency, export_formats, resume=not args.no_resume)
+    except KeyboardInterrupt:
+        return 130
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+    print(f"🎉 Batch finished: {counts['ok']} ok, {counts['failed']} failed, "
+          f"{counts['invalid']} invalid, {counts['skipped']} skipped")
+    print(f"📄 Results: {results_path}")
+    return 0 if counts["failed"] == 0 and counts["invalid"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Story Catalog for Gemini Picture Book Generator
+
+Resolves story IDs to the directories and exported files that live on disk, so
+the web UI and MCP server can serve stories without depending on in-memory job
+state that is lost on restart.
+
+Story IDs are time-ordered and collision-free: "story_" followed by a ULID (48
+bits of millisecond timestamp and 80 random bits, Crockford base32), so any
+number of processes can create stories at once without coordinating. Stories
+are stored in date and hash buckets instead of one flat directory:
+
+    generated_stories/2026-10-19/a7/story_01JAB3X6T3R2V8Y0Q9KZ4M5N7P/
+
+so no directory holds more than a few thousand entries even with millions of
+stories, and the newest stories are found without listing the old ones. Older
+stories named story_<YYYYmmdd_HHMMSS...> keep working, in the flat layout
+until `gemini-picturebook-migrate` moves them into their buckets.
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections.abc import Iterator
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from .story_metadata import METADATA_FILENAME, read_story_header, read_story_metadata
+
+logger = logging.getLogger(__name__)
+
+# File patterns for each downloadable format, in order of preference
+EXPORT_PATTERNS = {
+    "html": ["*_story.html", "*.html"],
+    "pdf": ["*_enhanced.pdf", "*.pdf"],
+}
+
+STORY_ID_PREFIX = "story_"
+UNDATED_BUCKET = "undated"
+
+_CROCKFORD32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ULID_ID_PATTERN = re.compile(r"^story_([0-9A-HJKMNP-TV-Z]{26})$")
+_LEGACY_ID_PATTERN = re.compile(r"^story_(\d{8})_(\d{6})")
+_DATE_BUCKET_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+_id_lock = threading.Lock()
+_last_id = (0, 0)
+
+
+def get_stories_dir() -> Path:
+    """
+    Get the root directory that holds all generated stories.
+
+    Honors the optional OUTPUT_DIR environment variable.
+
+    Returns:
+        Path to the generated_stories directory
+    """
+    output_dir = os.getenv("OUTPUT_DIR")
+    if output_dir:
+        return Path(output_dir)
+    return Path(__file__).parent.parent / "generated_stories"
+
+
+def is_valid_story_id(story_id: str) -> bool:
+    """Check that a story ID is a plain directory name (no path traversal)."""
+    return bool(story_id) and story_id not in (".", "..") and "/" not in story_id and "\\" not in story_id
+
+
+def new_story_id() -> str:
+    """
+    Create a new story ID: "story_" plus a ULID.
+
+    IDs sort by creation time. Within one process they are strictly
+    increasing, even for IDs created in the same millisecond.
+
+    Returns:
+        Story ID
+    """
+    global _last_id
+    with _id_lock:
+        millis = int(time.time() * 1000)
+        last_millis, last_random = _last_id
+        if millis <= last_millis:
+            # Same (or an earlier, after a clock step) millisecond: count up
+            millis, randomness = last_millis, last_random + 1
+        else:
+            randomness = int.from_bytes(os.urandom(10), "big")
+        _last_id = (millis, randomness)
+
+    value = (millis << 80) | (randomness & ((1 << 80) - 1))
+    chars = []
+    for _ in range(26):
+        chars.append(_CROCKFORD32[value & 31])
+        value >>= 5
+    return STORY_ID_PREFIX + "".join(reversed(chars))
+
+
+def story_created_at(story_id: str) -> datetime | None:
+    """
+    Read the creation time encoded in a story ID.
+
+    Args:
+        story_id: ULID story ID or legacy story_<YYYYmmdd_HHMMSS...> ID
+
+    Returns:
+        Creation time (UTC for ULIDs, local time for legacy IDs), or None
+    """
+    match = _ULID_ID_PATTERN.match(story_id)
+    if match:
+        millis = 0
+        for char in match.group(1)[:10]:
+            millis = millis * 32 + _CROCKFORD32.index(char)
+        return datetime.fromtimestamp(millis / 1000, tz=timezone.utc)
+    match = _LEGACY_ID_PATTERN.match(story_id)
+    if match:
+        try:
+            return datetime.strptime(match.group(1) + match.group(2), "%Y%m%d%H%M%S")
+        except ValueError:
+            return None
+    return None
+
+
+def story_bucket(story_id: str) -> str:
+    """
+    Get a story's bucket path relative to the stories directory.
+
+    Returns:
+        "<YYYY-mm-dd>/<2 hex digits>", or "undated/<2 hex digits>" for IDs
+        without a timestamp
+    """
+    created = story_created_at(story_id)
+    date_bucket = created.strftime("%Y-%m-%d") if created else UNDATED_BUCKET
+    shard = hashlib.sha256(story_id.encode("utf-8")).hexdigest()[:2]
+    return f"{date_bucket}/{shard}"
+
+
+def is_bucket_name(name: str) -> bool:
+    """Check whether a directory name below the stories directory is a date bucket."""
+    return name == UNDATED_BUCKET or bool(_DATE_BUCKET_PATTERN.match(name))
+
+
+def story_path(story_id: str, root: Path | None = None) -> Path:
+    """
+    Get where a story lives in the sharded layout (whether or not it exists).
+
+    Args:
+        story_id: Story ID
+        root: Stories directory (default: get_stories_dir())
+
+    Returns:
+        Path to the story directory
+    """
+    if not is_valid_story_id(story_id):
+        raise ValueError(f"Invalid story id: {story_id!r}")
+    return (root or get_stories_dir()) / story_bucket(story_id) / story_id
+
+
+def create_story_dir(story_id: str | None = None) -> tuple[str, Path]:
+    """
+    Create the directory of a new story.
+
+    Args:
+        story_id: ID to use (default: a new ID from new_story_id())
+
+    Returns:
+        Tuple of (story_id, story directory)
+    """
+    story_id = story_id or new_story_id()
+    story_dir = story_path(story_id)
+    story_dir.mkdir(parents=True, exist_ok=True)
+    return story_id, story_dir
+
+
+def story_url_path(story_dir: Path) -> str:
+    """
+    Get a story directory's path below the stories directory, for URLs.
+
+    Returns:
+        "<bucket>/<story_id>" (or just the folder name for legacy stories)
+    """
+    try:
+        return story_dir.relative_to(get_stories_dir()).as_posix()
+    except ValueError:
+        return story_dir.name
+
+
+def is_internal_path(filename: str) -> bool:
+    """
+    Check whether a path under the stories directory is private to the server.
+
+    Any component starting with "." is: the job store, the response cache,
+    the archive packs and lock files, a story's export manifest, and "..".
+
+    Args:
+        filename: Path relative to the stories directory or a story folder
+
+    Returns:
+        True if the path must not be served
+    """
+    return any(part.startswith(".") for part in Path(filename).parts)
+
+
+def story_last_modified(story_dir: Path) -> float:
+    """
+    Get when a story directory or any file in it last changed.
+
+    A generation touches the directory whenever it saves a scene.
+
+    Returns:
+        Newest modification time, as a timestamp
+    """
+    return max([story_dir.stat().st_mtime, *(p.stat().st_mtime for p in story_dir.iterdir())])
+
+
+def _sorted_children(directory: Path, reverse: bool) -> list[Path]:
+    # Dot directories are work in progress (e.g. a story being fetched from storage)
+    try:
+        children = (p for p in directory.iterdir() if p.is_dir() and not p.name.startswith("."))
+        return sorted(children, key=lambda p: p.name, reverse=reverse)
+    except OSError:
+        return []
+
+
+def _legacy_story_dirs(root: Path, newest_first: bool) -> list[Path]:
+    # Flat story_* directories not migrated yet, ordered by the time in their ID
+    def created(path: Path) -> float:
+        stamp = story_created_at(path.name)
+        if stamp is None:
+            return path.stat().st_mtime
+        return stamp.timestamp()
+
+    legacy = [p for p in root.glob(f"{STORY_ID_PREFIX}*") if p.is_dir()]
+    return sorted(legacy, key=created, reverse=newest_first)
+
+
+def iter_story_dirs(newest_first: bool = True, root: Path | None = None) -> Iterator[Path]:
+    """
+    Iterate over every story directory, in creation order.
+
+    Buckets are walked lazily, so taking the newest N stories only lists the
+    most recent date buckets.
+
+    Args:
+        newest_first: Newest stories first (default) or oldest first
+        root: Stories directory (default: get_stories_dir())
+
+    Yields:
+        Story directories (sharded ones, then any flat legacy ones)
+    """
+    root = root or get_stories_dir()
+    if not root.is_dir():
+        return
+    date_buckets = [p for p in _sorted_children(root, newest_first) if p.name != UNDATED_BUCKET and is_bucket_name(p.name)]
+    undated = root / UNDATED_BUCKET
+    if undated.is_dir():
+        date_buckets.append(undated)
+    for date_bucket in date_buckets:
+        stories = [
+            story_dir
+            for shard in _sorted_children(date_bucket, newest_first)
+            for story_dir in _sorted_children(shard, newest_first)
+        ]
+        # Shards split a day by hash; ULIDs restore the time order within it
+        yield from sorted(stories, key=lambda p: p.name, reverse=newest_first)
+    yield from _legacy_story_dirs(root, newest_first)
+
+
+def find_story_dir(story_id: str, fetch: bool = True) -> Path | None:
+    """
+    Resolve a story ID to its directory on disk.
+
+    The ID is the directory name: the story is looked up in its bucket, then in
+    the flat legacy layout. Older web UI jobs were saved under a
+    second-resolution folder name, so as a last resort the metadata "id" field
+    of each unmigrated legacy story is checked. An archived story is then
+    restored from its pack (see archive.py), and a story this node does not
+    have is fetched from the storage backend, if that is remote (see
+    storage.py).
+
+    Args:
+        story_id: Story ID or folder name
+        fetch: Restore or fetch the story if it is not on disk
+
+    Returns:
+        Path to the story directory, or None if not found
+    """
+    if not is_valid_story_id(story_id):
+        return None
+
+    stories_dir = get_stories_dir()
+    for story_dir in (story_path(story_id, stories_dir), stories_dir / story_id):
+        if story_dir.is_dir():
+            return story_dir
+
+    if stories_dir.exists():
+        for candidate in stories_dir.glob(f"{STORY_ID_PREFIX}*"):
+            metadata = read_story_metadata(candidate)
+            if metadata and metadata.get("id") == story_id:
+                return candidate
+
+    if fetch:
+        # Imported here: archive and storage build on this module
+        from .archive import restore_story
+        from .storage import fetch_story
+        try:
+            restored = restore_story(story_id)
+            if restored is not None:
+                return restored
+        except Exception as e:
+            logger.warning(f"Could not restore story {story_id} from the archive: {e}")
+        try:
+            return fetch_story(story_id)
+        except Exception as e:
+            logger.warning(f"Could not fetch story {story_id} from storage: {e}")
+    return None
+
+
+def find_story_file(story_dir: Path, file_format: str) -> Path | None:
+    """
+    Find the exported file of a given format in a story directory.
+
+    Args:
+        story_dir: Story directory
+        file_format: Export format ("html" or "pdf")
+
+    Returns:
+        Path to the file, or None if the story has no such export
+    """
+    for pattern in EXPORT_PATTERNS.get(file_format, []):
+        for path in sorted(story_dir.glob(pattern)):
+            if path.is_file() and not path.name.endswith("_print.html"):
+                return path
+    return None
+
+
+def find_story_asset(filename: str, fetch: bool = True) -> Path | None:
+    """
+    Find a story file (such as a scene image) by "<story_id>/<path>".
+
+    A bare path without a story ID (as older pages request images) is looked
+    up in the flat legacy stories only, newest first: pages rendered since
+    the sharded layout always include the story ID.
+
+    Args:
+        filename: "<story_id>/<path in the story>" or a bare path
+        fetch: Restore or fetch the story if it is not on disk
+
+    Returns:
+        Path to the file, or None if not found
+    """
+    parts = Path(filename).parts if filename else ()
+    if not parts or is_internal_path(filename) or Path(filename).is_absolute():
+        return None
+    if len(parts) > 1:
+        story_dir = find_story_dir(parts[0], fetch=fetch)
+        if story_dir is not None:
+            path = story_dir.joinpath(*parts[1:])
+            return path if path.is_file() else None
+    for story_dir in _legacy_story_dirs(get_stories_dir(), newest_first=True):
+        path = story_dir / filename
+        if path.is_file():
+            return path
+    return None
+
+
+def list_gallery_stories() -> list[dict[str, Any]]:
+    """
+    Collect the gallery entries of every finished story, newest first.
+
+    Each entry is the story's metadata header plus folder, html_file,
+    pdf_file, image_count and file_size (MB). Archived stories follow the
+    stories on disk, with "archived" set.
+
+    Returns:
+        List of gallery entries
+    """
+    stories = []
+    for story_dir in iter_story_dirs():
+        if not (story_dir / METADATA_FILENAME).exists():
+            continue
+        try:
+            # Only the small header record is needed for the gallery
+            metadata = read_story_header(story_dir)
+            if metadata is None:
+                raise ValueError("unreadable metadata")
+
+            html_files = list(story_dir.glob("*.html"))
+            pdf_files = list(story_dir.glob("*.pdf"))
+            if html_files:
+                metadata['html_file'] = html_files[0].name
+            if pdf_files:
+                metadata['pdf_file'] = pdf_files[0].name
+
+            metadata['folder'] = story_dir.name
+            metadata['image_count'] = len(list(story_dir.glob("scene_*.png")))
+            metadata['file_size'] = sum(f.stat().st_size for f in story_dir.iterdir()) / 1024 / 1024  # MB
+            stories.append(metadata)
+        except Exception as e:
+            logger.warning(f"Skipping story {story_dir.name} in gallery: {e}")
+
+    # Imported here: archive builds on this module
+    from .archive import list_archived_stories
+    for archived in list_archived_stories():
+        metadata = dict(archived["header"])
+        files = archived["files"]
+        for file_format in ("html", "pdf"):
+            names = sorted(name for name in files if name.endswith(f".{file_format}") and not name.endswith("_print.html"))
+            if names:
+                metadata[f"{file_format}_file"] = names[0]
+        metadata['folder'] = archived["id"]
+        metadata['image_count'] = sum(1 for name in files if name.startswith("scene_") and name.endswith(".png"))
+        metadata['file_size'] = sum(files.values()) / 1024 / 1024  # MB
+        metadata['archived'] = True
+        stories.append(metadata)
+    return stories
@@ -10,60 +10,224 @@ Date: 2025-06-07
 Version: 2.0 - Fixed API issues and improved error handling
 """
 
-import json
-import os
-import time
 from datetime import datetime
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
 
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from PIL import Image
 
-try:
-    from weasyprint import CSS, HTML
-    WEASYPRINT_AVAILABLE = True
-except ImportError:
-    WEASYPRINT_AVAILABLE = False
+from . import response_cache
+from .backends import (
+    allow_interactive_input,
+    create_client,
+    get_api_keys,
+    is_fake_backend,
+)
+from .catalog import create_story_dir
+from .keypool import create_pooled_client
+from .metrics import BYTES_WRITTEN_TOTAL, SCENES_TOTAL, time_stage, timed_stage
+from .progress import ProgressEmitter, console_subscriber
+from .ratelimit import get_shared_limiter
+from .retry import call_with_retry
+from .storage import try_publish_story
+from .story_metadata import (
+    METADATA_FILENAME,
+    SCENES_FILENAME,
+    atomic_write_bytes,
+    get_story_lock,
+    read_story_metadata,
+    write_story_metadata,
+)
+
+# Progress fractions reported once the model response arrives and reserved for
+# saving metadata; scene images fill the range in between.
+RESPONSE_PROGRESS = 0.5
+FINISH_PROGRESS = 0.05
+
+IMAGE_MODEL = "gemini-2.0-flash-preview-image-generation"
+
+
+# google.genai, PIL and WeasyPrint take most of the package's import time, so
+# they are imported where they are used; read-only entry points never pay for them.
+@lru_cache(maxsize=1)
+def load_weasyprint():
+    """
+    Import WeasyPrint on first use.
+
+    Returns:
+        module: The weasyprint module, or None if it or its system libraries
+            (Pango, Cairo) are not installed
+    """
+    try:
+        import weasyprint
+    except (ImportError, OSError):
+        return None
+    return weasyprint
+
+# Print stylesheet applied on top of the page styles when rendering PDFs;
+# every scene starts on a new page
+PDF_STYLESHEET = """
+    @page {
+        size: A4;
+        margin: 20mm;
+    }
+    .scene {
+        page-break-before: always;
+        page-break-inside: avoid;
+    }
+    .scene-image {
+        max-width: 100%;
+        max-height: 15cm;
+        page-break-inside: avoid;
+    }
+    body {
+        font-family: 'Times New Roman', serif;
+        font-size: 12pt;
+        line-height: 1.4;
+    }
+    .header {
+        page-break-after: always;
+    }
+    .story-info {
+        page-break-after: always;
+    }
+    .debug-info {
+        display: none;
+    }
+"""
+
+# Screen stylesheet embedded in every story page
+STORY_STYLESHEET = """    <style>
+        body {
+            font-family: 'Comic Sans MS', cursive, sans-serif;
+            max-width: 1000px;
+            margin: 0 auto;
+            padding: 20px;
+            background: linear-gradient(135deg, #f0f8ff, #e6e6fa, #f5deb3);
+            min-height: 100vh;
+        }
+        .header {
+            text-align: center;
+            color: #4a4a4a;
+            text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
+            margin-bottom: 30px;
+            background: rgba(255, 255, 255, 0.9);
+            padding: 20px;
+            border-radius: 15px;
+            border: 3px solid #daa520;
+        }
+        .story-info {
+            background: rgba(135, 206, 235, 0.9);
+            border: 2px solid #4169e1;
+            border-radius: 10px;
+            padding: 15px;
+            margin: 20px 0;
+            color: #2f4f4f;
+        }
+        .scene {
+            background: rgba(255, 255, 255, 0.95);
+            border-radius: 15px;
+            margin: 20px 0;
+            padding: 20px;
+            box-shadow: 0 8px 16px rgba(0,0,0,0.2);
+            border: 3px solid #daa520;
+        }
+        .scene-image {
+            width: 100%;
+            max-width: 600px;
+            height: auto;
+            border-radius: 10px;
+            border: 2px solid #8b4513;
+            margin: 15px 0;
+            display: block;
+            margin-left: auto;
+            margin-right: auto;
+        }
+        .scene-text {
+            font-size: 16px;
+            line-height: 1.6;
+            color: #2f4f4f;
+            text-align: justify;
+            margin: 10px 0;
+        }
+        .scene-number {
+            color: #b8860b;
+            font-size: 24px;
+            font-weight: bold;
+            margin-bottom: 10px;
+        }
+        .generated-info {
+            text-align: center;
+            font-size: 12px;
+            color: #696969;
+            margin-top: 30px;
+            padding: 10px;
+            background: rgba(255, 255, 255, 0.8);
+            border-radius: 10px;
+        }
+        .debug-info {
+            background: rgba(255, 255, 255, 0.9);
+            border: 1px solid #ccc;
+            border-radius: 5px;
+            padding: 10px;
+            margin: 10px 0;
+            font-size: 12px;
+            color: #666;
+        }
+    </style>
+"""
 
 
 def setup_client():
     """
-    Initialize the Google GenAI client with API key from environment or .env file.
+    Initialize the model client with API keys from environment or .env file.
+
+    The backend is chosen by PICTUREBOOK_BACKEND (see backends.py); the offline
+    "fake" backend needs no API key. With several keys in GOOGLE_API_KEYS the
+    requests are spread over a key pool (see keypool.py).
 
     Returns:
         genai.Client: Configured client instance
 
     Raises:
-        ValueError: If API key is not found
+        ValueError: If no API key is configured
     """
     # Load environment variables from .env file
     load_dotenv()
 
-    # Try to get API key from environment variable
-    api_key = os.getenv('GOOGLE_API_KEY')
+    if is_fake_backend():
+        print("🧪 Using offline fake Gemini backend")
+        return create_client()
 
-    if not api_key or api_key == 'your_google_api_key_here':
+    api_keys = get_api_keys()
+
+    if not api_keys:
+        if not allow_interactive_input():
+            raise ValueError("API key is required: set GOOGLE_API_KEY or GOOGLE_API_KEYS in the .env file")
         print("⚠️  Google API key not found or not configured properly.")
         print("Please update the .env file with your actual API key.")
         print("Get your API key from: https://aistudio.google.com/app/apikey")
         api_key = input("Or enter your Google API key now: ").strip()
+        api_keys = [api_key] if api_key else []
 
-    if not api_key:
+    if not api_keys:
         raise ValueError("API key is required to use the image generation service")
 
     try:
-        client = genai.Client(api_key=api_key)
-        print("✅ Successfully connected to Google Gemini API")
+        if len(api_keys) > 1:
+            client = create_pooled_client(api_keys)
+            print(f"✅ Successfully connected to Google Gemini API ({len(api_keys)} keys pooled)")
+        else:
+            client = create_client(api_keys[0])
+            print("✅ Successfully connected to Google Gemini API")
         return client
     except Exception as e:
         print(f"❌ Failed to initialize Gemini client: {e}")
         raise
 
 
-def generate_custom_story_with_images(client, story_prompt, num_scenes, output_dir, delay_between_requests=6):
+def generate_custom_story_with_images(client, story_prompt, num_scenes, output_dir, delay_between_requests=None, extra_metadata=None, progress_callback=None):
     """
     Generate a custom story with images based on user input.
 
@@ -72,13 +236,20 @@ def generate_custom_story_with_images(client, story_prompt, num_scenes, output_d
         story_prompt (str): User-defined story prompt
         num_scenes (int): Number of scenes to generate
         output_dir (Path): Directory to save images
-        delay_between_requests (int): Seconds to wait between requests (rate limiting)
+        delay_between_requests (int): Deprecated and ignored; model requests are
+            paced by the shared rate limiter (GEMINI_RPM, see ratelimit.py)
+        extra_metadata (dict): Caller fields (id, style, ...) saved with the story,
+            so the metadata sidecar is written exactly once
+        progress_callback (callable): Receives structured progress events
+            (see progress.py); defaults to printing them to the console
 
     Returns:
         dict: Story data with text and image paths
     """
+    progress = ProgressEmitter(progress_callback or console_subscriber)
+
     # Use the image generation model
-    model = "gemini-2.0-flash-preview-image-generation"
+    model = IMAGE_MODEL
 
     # Enhanced prompt for better story generation
     full_prompt = f"""
@@ -97,28 +268,29 @@ def generate_custom_story_with_images(client, story_prompt, num_scenes, output_d
     Structure: Scene 1: [description], Scene 2: [description], etc.
     """
 
-    print(f"🎨 Generating custom story: '{story_prompt}'")
-    print(f"📊 Scenes to generate: {num_scenes}")
-    print("⏳ This may take several minutes due to rate limiting...")
-    print("⏱️  Rate limit: ~6 seconds between requests (10/minute limit)")
-
-    try:
-        print("🔄 Making API request...")
-
-        # Create the configuration properly
-        config = types.GenerateContentConfig(
-            response_modalities=["Text", "Image"],
-            max_output_tokens=8192
-        )
+    progress.emit("started", f"Generating custom story: '{story_prompt}'", 0.0, total_scenes=num_scenes)
 
-        response = client.models.generate_content(
-            model=model,
-            contents=full_prompt,
-            config=config
-        )
+    cache_key = None
+    if response_cache.is_enabled():
+        cache_key = response_cache.make_cache_key(story_prompt, num_scenes, (extra_metadata or {}).get('style'), model)
+        story_data = response_cache.lookup(cache_key, output_dir)
+        if story_data:
+            if extra_metadata:
+                story_data.update(extra_metadata)
+            write_story_metadata(story_data, output_dir)
+            try_publish_story(Path(output_dir))
+            image_count = len([s for s in story_data['scenes'] if s.get('type') == 'image'])
+            progress.emit(
+                "cache_hit", f"Reused {image_count} cached scene images for an identical request",
+                1.0, scenes=image_count, total_scenes=num_scenes,
+            )
+            progress.emit("completed", f"Generated {image_count} scene images (from cache)", 1.0,
+                          scenes=image_count, total_scenes=num_scenes, cached=True)
+            return story_data
 
-        # Debug: Print response structure
-        print("🔍 API Response received, processing...")
+    try:
+        progress.emit("request_sent", "Making API request...", 0.02, total_scenes=num_scenes)
+        response = _generate_story_content(client, model, full_prompt, progress)
 
         if not response:
             raise ValueError("No response received from API")
@@ -147,16 +319,19 @@ def generate_custom_story_with_images(client, story_prompt, num_scenes, output_d
         scene_counter = 1
         total_parts = len(response.candidates[0].content.parts)
 
-        print(f"📦 Processing {total_parts} parts from API response...")
+        progress.emit(
+            "response_received", f"Processing {total_parts} parts from API response...",
+            RESPONSE_PROGRESS, total_scenes=num_scenes, total_parts=total_parts,
+        )
 
         for i, part in enumerate(response.candidates[0].content.parts):
-            print(f"🔄 Processing part {i+1}/{total_parts}...")
-
             if hasattr(part, 'text') and part.text is not None:
-                print(f"📖 Found text content (Scene {scene_counter})")
                 MAX_TEXT_PREVIEW_LENGTH = 200
                 text_preview = part.text[:MAX_TEXT_PREVIEW_LENGTH] + "..." if len(part.text) > MAX_TEXT_PREVIEW_LENGTH else part.text
-                print(f"   Preview: {text_preview}")
+                progress.emit(
+                    "scene_text", f"Found text content (Scene {scene_counter})",
+                    scene=scene_counter, total_scenes=num_scenes, part_index=i, preview=text_preview,
+                )
 
                 story_data['scenes'].append({
                     'type': 'text',
@@ -166,17 +341,19 @@ def generate_custom_story_with_images(client, story_prompt, num_scenes, output_d
                 })
 
             elif hasattr(part, 'inline_data') and part.inline_data is not None:
-                print(f"🖼️  Found image data (Scene {scene_counter})")
-
                 try:
-                    # Save image to file
-                    image = Image.open(BytesIO(part.inline_data.data))
-                    image_filename = f"scene_{scene_counter:02d}.png"
-                    image_path = output_dir / image_filename
+                    with time_stage("image_save"):
+                        from PIL import Image
+
+                        # Save image to file
+                        image = Image.open(BytesIO(part.inline_data.data))
+                        image_filename = f"scene_{scene_counter:02d}.png"
+                        image_path = output_dir / image_filename
 
-                    # Save image with error handling
-                    image.save(image_path, 'PNG')
-                    print(f"✅ Scene {scene_counter} image saved: {image_filename}")
+                        # Save image with error handling
+                        image.save(image_path, 'PNG')
+                    SCENES_TOTAL.inc()
+                    BYTES_WRITTEN_TOTAL.inc(image_path.stat().st_size)
 
                     story_data['scenes'].append({
                         'type': 'image',
@@ -187,143 +364,245 @@ def generate_custom_story_with_images(client, story_prompt, num_scenes, output_d
                         'image_size': image.size
                     })
 
-                    scene_counter += 1
+                    progress.emit(
+                        "scene_image", f"Scene {scene_counter} image saved: {image_filename}",
+                        RESPONSE_PROGRESS + (1 - RESPONSE_PROGRESS - FINISH_PROGRESS) * min(scene_counter / max(num_scenes, 1), 1),
+                        scene=scene_counter, total_scenes=num_scenes, filename=image_filename,
+                    )
 
-                    # Rate limiting delay (respect 10 requests per minute)
-                    if scene_counter <= num_scenes and i < total_parts - 1:
-                        print(f"⏳ Waiting {delay_between_requests} seconds (rate limiting)...")
-                        time.sleep(delay_between_requests)
+                    scene_counter += 1
 
                 except Exception as img_error:
-                    print(f"❌ Error saving image {scene_counter}: {img_error}")
+                    progress.emit(
+                        "scene_error", f"Error saving image {scene_counter}: {img_error}",
+                        scene=scene_counter, total_scenes=num_scenes, error=str(img_error),
+                    )
                     continue
             else:
-                print(f"⚠️  Unknown part type at index {i}")
-
-        # Save story metadata
-        metadata_path = output_dir / "story_metadata.json"
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(story_data, f, indent=2, ensure_ascii=False)
-
-        print(f"\n✅ Generated {scene_counter-1} scene images")
-        print(f"📊 Total parts processed: {total_parts}")
-        print(f"💾 Metadata saved: {metadata_path}")
+                progress.emit("unknown_part", f"Unknown part type at index {i}", part_index=i)
+
+        if cache_key and scene_counter > 1:
+            response_cache.store(cache_key, story_data, output_dir)
+
+        # Save story metadata sidecar (the only write for this generation)
+        if extra_metadata:
+            story_data.update(extra_metadata)
+        metadata_path = write_story_metadata(story_data, output_dir)
+        progress.emit("metadata_saved", f"Metadata saved: {metadata_path}", 1 - FINISH_PROGRESS, path=str(metadata_path))
+        # Share the finished story with other nodes (a no-op for local storage)
+        try_publish_story(Path(output_dir))
+
+        progress.emit(
+            "completed", f"Generated {scene_counter-1} scene images ({total_parts} parts processed)",
+            1.0, scenes=scene_counter - 1, total_scenes=num_scenes, total_parts=total_parts,
+        )
 
         return story_data
 
     except Exception as e:
-        print(f"❌ Error generating story: {e}")
-        print(f"🔍 Error type: {type(e).__name__}")
-
+        hint = None
         if "quota" in str(e).lower() or "rate" in str(e).lower():
-            print("💡 This might be due to rate limiting. Try again later or reduce the number of scenes.")
+            hint = "This might be due to rate limiting. Try again later or reduce the number of scenes."
         elif "401" in str(e) or "unauthorized" in str(e).lower():
-            print("💡 Check your API key - it might be invalid or expired.")
+            hint = "Check your API key - it might be invalid or expired."
         elif "model" in str(e).lower():
-            print("💡 The model might not be available. Try using 'gemini-2.0-flash-lite' instead.")
+            hint = "The model might not be available. Try using 'gemini-2.0-flash-lite' instead."
 
+        progress.emit(
+            "failed", f"Error generating story: {e}",
+            error=str(e), error_type=type(e).__name__, hint=hint,
+        )
         return None
 
 
-def create_html_display(story_data, output_dir):
+def _generate_story_content(client, model, prompt, progress):
     """
-    Create an HTML file to display the custom story with images.
+    Send one text+image request, retrying and pacing it.
 
     Args:
-        story_data (dict): Story data with text and images
-        output_dir (Path): Directory containing images
+        client (genai.Client): Configured GenAI client
+        model (str): Model name
+        prompt (str): Full prompt text
+        progress (ProgressEmitter): Receives "retrying" events
 
     Returns:
-        str: Path to HTML file
+        The model response
     """
-    html_content = f"""
+    from google.genai import types
+
+    # Create the configuration properly
+    config = types.GenerateContentConfig(
+        response_modalities=["Text", "Image"],
+        max_output_tokens=8192
+    )
+
+    def request():
+        with time_stage("api_latency"):
+            return client.models.generate_content(
+                model=model,
+                contents=prompt,
+                config=config
+            )
+
+    def on_retry(attempt, delay, error, kind):
+        progress.emit(
+            "retrying", f"Request failed ({kind}), retry {attempt} in {delay:.1f}s: {error}",
+            attempt=attempt, delay=delay, error=str(error), error_kind=kind,
+        )
+
+    # Retries 429s and transient errors; the shared limiter paces requests
+    # across all concurrent generations (a key pool paces each key itself)
+    limiter = None if getattr(client, "paces_requests", False) else get_shared_limiter()
+    return call_with_retry(request, limiter=limiter, on_retry=on_retry)
+
+
+def _scene_text(scenes, scene_number):
+    """Join the text parts stored for one scene."""
+    return "\n\n".join(
+        s.get('content', '').strip() for s in scenes
+        if s.get('type') == 'text' and s.get('scene_number') == scene_number
+    )
+
+
+def regenerate_scene(client, story_dir, scene_number, prompt_override=None, progress_callback=None):
+    """
+    Regenerate the text and image of a single scene of an existing story.
+
+    The stored story outline and the neighbouring scenes are sent as context,
+    so the new scene still fits the book. Every other scene is left untouched;
+    exports are rebuilt on their next request because the scene image and
+    metadata changed.
+
+    Args:
+        client (genai.Client): Configured GenAI client
+        story_dir (Path): Story directory
+        scene_number (int): Scene to regenerate (1-based)
+        prompt_override (str): Optional new direction for the scene
+        progress_callback (callable): Receives structured progress events
+
+    Returns:
+        dict: Updated story data, or None if generation failed
+
+    Raises:
+        FileNotFoundError: If the story has no metadata
+        ValueError: If the scene does not exist
+    """
+    progress = ProgressEmitter(progress_callback or console_subscriber)
+    story_dir = Path(story_dir)
+    story_data = read_story_metadata(story_dir)
+    if not story_data:
+        raise FileNotFoundError(f"No story metadata in {story_dir}")
+
+    scenes = story_data.get('scenes', [])
+    scene_numbers = sorted({s['scene_number'] for s in scenes if isinstance(s.get('scene_number'), int)})
+    if scene_number not in scene_numbers:
+        raise ValueError(f"Scene {scene_number} not found; the story has {len(scene_numbers)} scenes")
+
+    previous_text = _scene_text(scenes, scene_number - 1)
+    current_text = _scene_text(scenes, scene_number)
+    next_text = _scene_text(scenes, scene_number + 1)
+    direction = prompt_override.strip() if prompt_override else "Keep its role in the story, but make it fresh and vivid."
+
+    prompt = f"""
+    You are an expert storyteller and illustrator revising one page of a picture book.
+
+    The book is based on this idea: "{story_data.get('original_prompt', '')}"
+
+    Previous scene: {previous_text or "(this is the first scene)"}
+    Current scene {scene_number}: {current_text or "(no text)"}
+    Next scene: {next_text or "(this is the last scene)"}
+
+    Rewrite scene {scene_number} so it still connects the previous and next scenes.
+    Direction: {direction}
+
+    Respond with a 2-4 sentence description of the scene and exactly one accompanying image.
+    """
+
+    progress.emit("started", f"Regenerating scene {scene_number} of '{story_data.get('original_prompt', '')}'", 0.0,
+                  scene=scene_number, total_scenes=1)
+
+    try:
+        progress.emit("request_sent", "Making API request...", 0.02, scene=scene_number, total_scenes=1)
+        response = _generate_story_content(client, story_data.get('model', IMAGE_MODEL), prompt, progress)
+
+        parts = response.candidates[0].content.parts if response and response.candidates else None
+        if not parts:
+            raise ValueError("No content in API response")
+
+        texts = [part.text for part in parts if getattr(part, 'text', None)]
+        image_part = next((part for part in parts if getattr(part, 'inline_data', None) is not None), None)
+        if image_part is None:
+            raise ValueError("No image in API response")
+
+        image_filename = f"scene_{scene_number:02d}.png"
+        image_path = story_dir / image_filename
+        with time_stage("image_save"):
+            from PIL import Image
+
+            image = Image.open(BytesIO(image_part.inline_data.data))
+            buffer = BytesIO()
+            image.save(buffer, 'PNG')
+            # Replace rather than overwrite, so hard links into the response
+            # cache keep the old image
+            atomic_write_bytes(image_path, buffer.getvalue())
+        SCENES_TOTAL.inc()
+        BYTES_WRITTEN_TOTAL.inc(len(buffer.getvalue()))
+
+        regenerated_at = datetime.now().isoformat()
+        new_entries = [
+            {'type': 'text', 'content': text, 'scene_number': scene_number, 'regenerated_at': regenerated_at}
+            for text in texts
+        ]
+        new_entries.append({
+            'type': 'image',
+            'filename': image_filename,
+            'path': str(image_path),
+            'scene_number': scene_number,
+            'image_size': image.size,
+            'regenerated_at': regenerated_at
+        })
+
+        progress.emit("scene_image", f"Scene {scene_number} image saved: {image_filename}", 0.9,
+                      scene=scene_number, total_scenes=1, filename=image_filename)
+
+        # Re-read under the story lock so concurrent edits of other scenes are kept
+        with get_story_lock(story_dir):
+            story_data = read_story_metadata(story_dir)
+            scenes = story_data.get('scenes', [])
+            # Splice the new entries in where the old scene was
+            position = next(i for i, s in enumerate(scenes) if s.get('scene_number') == scene_number)
+            kept = [s for s in scenes if s.get('scene_number') != scene_number]
+            story_data['scenes'] = kept[:position] + new_entries + kept[position:]
+            revisions = story_data.setdefault('scene_revisions', {})
+            revisions[str(scene_number)] = revisions.get(str(scene_number), 0) + 1
+            metadata_path = write_story_metadata(story_data, story_dir)
+        progress.emit("metadata_saved", f"Metadata saved: {metadata_path}", 0.95, path=str(metadata_path))
+        try_publish_story(story_dir, [image_path, story_dir / METADATA_FILENAME, story_dir / SCENES_FILENAME])
+        progress.emit("completed", f"Regenerated scene {scene_number}", 1.0, scenes=1, scene=scene_number)
+        return story_data
+
+    except Exception as e:
+        progress.emit("failed", f"Error regenerating scene {scene_number}: {e}",
+                      error=str(e), error_type=type(e).__name__, hint=None)
+        return None
+
+
+def story_html_head(story_data):
+    """Build the document head shared by the HTML export and PDF sections."""
+    return f"""
 <!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Custom AI Story - {story_data.get('original_prompt', 'Adventure')}</title>
-    <style>
-        body {{
-            font-family: 'Comic Sans MS', cursive, sans-serif;
-            max-width: 1000px;
-            margin: 0 auto;
-            padding: 20px;
-            background: linear-gradient(135deg, #f0f8ff, #e6e6fa, #f5deb3);
-            min-height: 100vh;
-        }}
-        .header {{
-            text-align: center;
-            color: #4a4a4a;
-            text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-            margin-bottom: 30px;
-            background: rgba(255, 255, 255, 0.9);
-            padding: 20px;
-            border-radius: 15px;
-            border: 3px solid #daa520;
-        }}
-        .story-info {{
-            background: rgba(135, 206, 235, 0.9);
-            border: 2px solid #4169e1;
-            border-radius: 10px;
-            padding: 15px;
-            margin: 20px 0;
-            color: #2f4f4f;
-        }}
-        .scene {{
-            background: rgba(255, 255, 255, 0.95);
-            border-radius: 15px;
-            margin: 20px 0;
-            padding: 20px;
-            box-shadow: 0 8px 16px rgba(0,0,0,0.2);
-            border: 3px solid #daa520;
-        }}
-        .scene-image {{
-            width: 100%;
-            max-width: 600px;
-            height: auto;
-            border-radius: 10px;
-            border: 2px solid #8b4513;
-            margin: 15px 0;
-            display: block;
-            margin-left: auto;
-            margin-right: auto;
-        }}
-        .scene-text {{
-            font-size: 16px;
-            line-height: 1.6;
-            color: #2f4f4f;
-            text-align: justify;
-            margin: 10px 0;
-        }}
-        .scene-number {{
-            color: #b8860b;
-            font-size: 24px;
-            font-weight: bold;
-            margin-bottom: 10px;
-        }}
-        .generated-info {{
-            text-align: center;
-            font-size: 12px;
-            color: #696969;
-            margin-top: 30px;
-            padding: 10px;
-            background: rgba(255, 255, 255, 0.8);
-            border-radius: 10px;
-        }}
-        .debug-info {{
-            background: rgba(255, 255, 255, 0.9);
-            border: 1px solid #ccc;
-            border-radius: 5px;
-            padding: 10px;
-            margin: 10px 0;
-            font-size: 12px;
-            color: #666;
-        }}
-    </style>
-</head>
+""" + STORY_STYLESHEET + """</head>
 <body>
-    <div class="header">
+"""
+
+
+def _header_fragment(story_data):
+    return f"""    <div class="header">
         <h1>🎨 Custom AI Story 🎨</h1>
         <h2>"{story_data.get('original_prompt', 'Adventure Story')}"</h2>
     </div>
@@ -340,6 +619,65 @@ def create_html_display(story_data, output_dir):
     </div>
 """
 
+
+@lru_cache(maxsize=4096)
+def _scene_fragment(scene_num, texts, image_filename, image_size):
+    """
+    Render one scene's HTML.
+
+    Fragments are pure functions of their arguments and cached, so re-rendering
+    a long book after a single-scene change only formats the changed scene.
+    """
+    fragment = '    <div class="scene">\n'
+    fragment += f'        <div class="scene-number">Scene {scene_num}</div>\n'
+
+    if image_filename:
+        fragment += f'        <img src="{image_filename}" alt="Scene {scene_num}" class="scene-image">\n'
+        if image_size is not None:
+            fragment += f'        <div class="debug-info">Image size: {image_size}</div>\n'
+
+    for text_content in texts:
+        # Split text into paragraphs for better formatting
+        paragraphs = text_content.split('\n\n')
+        for paragraph in paragraphs:
+            if paragraph.strip():
+                # Simple markdown-style processing
+                processed_paragraph = paragraph.replace('**', '<strong>', 1).replace('**', '</strong>', 1)
+                fragment += f'        <div class="scene-text">{processed_paragraph.strip()}</div>\n'
+
+    fragment += '    </div>\n\n'
+    return fragment
+
+
+def _footer_fragment(story_data):
+    return f"""
+    <div class="generated-info">
+        <p>Generated on: {story_data['generated_at']}</p>
+        <p>Model: {story_data['model']}</p>
+        <p>Total Parts: {story_data.get('total_parts', 'N/A')}</p>
+        <p>✨ Created with Google Gemini AI ✨</p>
+    </div>
+"""
+
+
+HTML_TAIL = """</body>
+</html>
+"""
+
+
+def story_html_sections(story_data):
+    """
+    Split a story's HTML body into independently renderable sections.
+
+    Args:
+        story_data (dict): Story data with text and images
+
+    Returns:
+        list: (kind, html, image_filenames) tuples in document order, where kind
+            is "header", "scene", "additional" or "footer"
+    """
+    sections = [("header", _header_fragment(story_data), ())]
+
     # Group scenes by number for proper ordering
     text_scenes = {}
     image_scenes = {}
@@ -353,62 +691,75 @@ def create_html_display(story_data, output_dir):
         elif scene['type'] == 'image':
             image_scenes[scene_num] = scene
 
-    # Generate HTML for each scene
     scene_numbers = sorted(set(list(text_scenes.keys()) + list(image_scenes.keys())))
     actual_scenes = [sn for sn in scene_numbers if isinstance(sn, int)]
 
     for scene_num in actual_scenes:
-        html_content += '    <div class="scene">\n'
-        html_content += f'        <div class="scene-number">Scene {scene_num}</div>\n'
-
-        if scene_num in image_scenes:
-            image_scene = image_scenes[scene_num]
-            html_content += f'        <img src="{image_scene["filename"]}" alt="Scene {scene_num}" class="scene-image">\n'
-            if 'image_size' in image_scene:
-                html_content += f'        <div class="debug-info">Image size: {image_scene["image_size"]}</div>\n'
-
-        if scene_num in text_scenes:
-            for text_content in text_scenes[scene_num]:
-                # Split text into paragraphs for better formatting
-                paragraphs = text_content.split('\n\n')
-                for paragraph in paragraphs:
-                    if paragraph.strip():
-                        # Simple markdown-style processing
-                        processed_paragraph = paragraph.replace('**', '<strong>', 1).replace('**', '</strong>', 1)
-                        html_content += f'        <div class="scene-text">{processed_paragraph.strip()}</div>\n'
-
-        html_content += '    </div>\n\n'
+        image_scene = image_scenes.get(scene_num, {})
+        image_filename = image_scene.get("filename")
+        fragment = _scene_fragment(
+            scene_num,
+            tuple(text_scenes.get(scene_num, ())),
+            image_filename,
+            str(image_scene["image_size"]) if "image_size" in image_scene else None,
+        )
+        sections.append(("scene", fragment, (image_filename,) if image_filename else ()))
 
     # Add any additional text content
     for scene in story_data['scenes']:
         if scene['type'] == 'text' and scene['scene_number'] == 'additional':
-            html_content += '    <div class="scene">\n'
-            html_content += '        <div class="scene-number">Additional Content</div>\n'
-            html_content += f'        <div class="scene-text">{scene["content"]}</div>\n'
-            html_content += '    </div>\n\n'
+            fragment = '    <div class="scene">\n'
+            fragment += '        <div class="scene-number">Additional Content</div>\n'
+            fragment += f'        <div class="scene-text">{scene["content"]}</div>\n'
+            fragment += '    </div>\n\n'
+            sections.append(("additional", fragment, ()))
 
-    html_content += f"""
-    <div class="generated-info">
-        <p>Generated on: {story_data['generated_at']}</p>
-        <p>Model: {story_data['model']}</p>
-        <p>Total Parts: {story_data.get('total_parts', 'N/A')}</p>
-        <p>✨ Created with Google Gemini AI ✨</p>
-    </div>
-</body>
-</html>
-"""
+    sections.append(("footer", _footer_fragment(story_data), ()))
+    return sections
+
+
+def render_story_html(story_data):
+    """
+    Render the complete HTML document for a story.
 
-    # Create safe filename
+    Args:
+        story_data (dict): Story data with text and images
+
+    Returns:
+        str: HTML document
+    """
+    body = "".join(fragment for _, fragment, _ in story_html_sections(story_data))
+    return story_html_head(story_data) + body + HTML_TAIL
+
+
+def story_html_filename(story_data):
+    """Get the filename of a story's HTML export."""
     safe_prompt = "".join(c for c in story_data.get('original_prompt', 'story')[:30] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    html_filename = f"{safe_prompt.replace(' ', '_')}_story.html"
-    html_path = output_dir / html_filename
+    return f"{safe_prompt.replace(' ', '_')}_story.html"
 
-    with open(html_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+
+@timed_stage("html_render")
+def create_html_display(story_data, output_dir):
+    """
+    Create an HTML file to display the custom story with images.
+
+    Args:
+        story_data (dict): Story data with text and images
+        output_dir (Path): Directory containing images
+
+    Returns:
+        str: Path to HTML file
+    """
+    html_path = output_dir / story_html_filename(story_data)
+
+    # Replaced atomically: the export may be served while it is rebuilt, and
+    # it can be rebuilt from the metadata, so it is never worth an fsync
+    atomic_write_bytes(html_path, render_story_html(story_data).encode('utf-8'), "none")
 
     return str(html_path)
 
 
+@timed_stage("pdf_render")
 def create_pdf_from_html(html_path, output_dir):
     """
     Convert HTML story to PDF for easy sharing.
@@ -421,13 +772,12 @@ def create_pdf_from_html(html_path, output_dir):
     Returns:
         str: Path to PDF file or None if failed
     """
-    if not WEASYPRINT_AVAILABLE:
+    weasyprint = load_weasyprint()
+    if weasyprint is None:
         print("⚠️  WeasyPrint not available. PDF generation skipped.")
         print("   Install with: uv pip install weasyprint")
         return None
-
-    # Import here to avoid unbound variable error
-    from weasyprint import CSS, HTML
+    CSS, HTML = weasyprint.CSS, weasyprint.HTML
 
     try:
         html_file = Path(html_path)
@@ -443,35 +793,7 @@ def create_pdf_from_html(html_path, output_dir):
 
         # Convert HTML to PDF with improved settings
         # Enhanced CSS for better PDF formatting
-        enhanced_css = CSS(string="""
-            @page {
-                size: A4;
-                margin: 20mm;
-            }
-            .scene {
-                page-break-before: always;
-                page-break-inside: avoid;
-            }
-            .scene-image {
-                max-width: 100%;
-                max-height: 15cm;
-                page-break-inside: avoid;
-            }
-            body {
-                font-family: 'Times New Roman', serif;
-                font-size: 12pt;
-                line-height: 1.4;
-            }
-            .header {
-                page-break-after: always;
-            }
-            .story-info {
-                page-break-after: always;
-            }
-            .debug-info {
-                display: none;
-            }
-        """)
+        enhanced_css = CSS(string=PDF_STYLESHEET)
 
         html_doc = HTML(filename=str(html_file))
         html_doc.write_pdf(str(pdf_path), stylesheets=[enhanced_css])
@@ -491,11 +813,20 @@ def test_api_connection():
     try:
         client = setup_client()
 
-        # Try a simple text-only request first
-        test_response = client.models.generate_content(
-            model="gemini-2.0-flash-lite",
-            contents="Say hello and confirm you're working."
-        )
+        def request():
+            # Try a simple text-only request first
+            return client.models.generate_content(
+                model="gemini-2.0-flash-lite",
+                contents="Say hello and confirm you're working."
+            )
+
+        def on_retry(attempt, delay, error, kind):
+            print(f"⏳ API test failed ({kind}), retry {attempt} in {delay:.1f}s: {error}")
+
+        # Same retries and pacing as generation requests, so a busy quota
+        # delays the check instead of failing it
+        limiter = None if getattr(client, "paces_requests", False) else get_shared_limiter()
+        test_response = call_with_retry(request, limiter=limiter, on_retry=on_retry)
 
         if test_response and test_response.candidates:
             candidate = test_response.candidates[0]
@@ -521,10 +852,7 @@ def main():
     print("=" * 70)
 
     # Setup output directory
-    project_dir = Path(__file__).parent
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_dir = project_dir / "generated_stories" / f"story_{timestamp}"
-    output_dir.mkdir(parents=True, exist_ok=True)
+    _, output_dir = create_story_dir()
 
     try:
         # Test API connection first
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+On-Demand Story Exports for Gemini Picture Book Generator
+
+Export formats (HTML, PDF, EPUB, CBZ and a plain image ZIP) are built lazily from
+story_metadata.json the first time they are requested and cached next to the
+story. A small manifest records the source fingerprint each artifact was built
+from, so an artifact is rebuilt only after the metadata or scene images change.
+Builds and manifest updates take file locks, so every worker process of a
+multi-worker server builds an artifact once.
+Built artifacts are published to the storage backend (see storage.py).
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import contextlib
+import hashlib
+import html
+import json
+import os
+import shutil
+import threading
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from .catalog import get_stories_dir, story_url_path
+from .enhanced_story_generator import create_html_display
+from .metrics import BYTES_WRITTEN_TOTAL, time_stage
+from .render_cache import render_story_pdf
+from .storage import try_publish_story
+from .story_metadata import (
+    METADATA_FILENAME,
+    SCENES_FILENAME,
+    StoryLock,
+    atomic_write_bytes,
+    read_story_metadata,
+)
+
+EXPORT_FORMATS = ("html", "pdf", "epub", "cbz", "zip")
+MANIFEST_FILENAME = ".exports.json"
+
+# Build lock files, mirroring the story layout. They live outside the story
+# folders so taking a lock never changes a story's modification time.
+LOCKS_DIRNAME = ".export_locks"
+
+# One lock per (story directory, format) so concurrent requests, in any worker
+# process, build once; the "manifest" lock serializes manifest updates
+_build_locks: dict[tuple[str, str], StoryLock] = {}
+_build_locks_guard = threading.Lock()
+
+
+def _get_locks_dir(story_dir: Path) -> Path:
+    return get_stories_dir() / LOCKS_DIRNAME / story_url_path(story_dir)
+
+
+def _get_build_lock(story_dir: Path, name: str) -> StoryLock:
+    key = (str(story_dir), name)
+    with _build_locks_guard:
+        if key not in _build_locks:
+            _build_locks[key] = StoryLock(_get_locks_dir(story_dir) / f"{name}.lock")
+        lock = _build_locks[key]
+    lock.path.parent.mkdir(parents=True, exist_ok=True)
+    return lock
+
+
+def source_fingerprint(story_dir: Path) -> str:
+    """
+    Fingerprint the sources every export is derived from.
+
+    Uses the size and modification time of the metadata file and scene images,
+    so it is cheap to compute and changes whenever a scene is rewritten.
+
+    Args:
+        story_dir: Story directory
+
+    Returns:
+        Short hex digest
+    """
+    digest = hashlib.sha256()
+    sources = [story_dir / METADATA_FILENAME, story_dir / SCENES_FILENAME]
+    for path in [*sources, *sorted(story_dir.glob("scene_*.png"))]:
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def story_download_name(story_data: dict[str, Any], file_format: str) -> str:
+    """
+    Build the file name a story export is downloaded as, from the story prompt.
+
+    Args:
+        story_data: Story metadata (header or full story data)
+        file_format: Export format
+
+    Returns:
+        File name such as "A fox in the snow.pdf"
+    """
+    safe_name = "".join(c for c in story_data.get("original_prompt", "story")[:30] if c.isalnum() or c in (" ", "-", "_")).strip()
+    return f"{safe_name or 'story'}.{file_format}"
+
+
+def _load_manifest(story_dir: Path) -> dict[str, Any]:
+    try:
+        with open(story_dir / MANIFEST_FILENAME, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(story_dir: Path, manifest: dict[str, Any]):
+    # The manifest is a rebuildable cache, so it is never worth an fsync
+    atomic_write_bytes(story_dir / MANIFEST_FILENAME, json.dumps(manifest, indent=2).encode("utf-8"), "none")
+
+
+def get_export(story_dir: Path, file_format: str) -> Path | None:
+    """
+    Get an export of a story, building it on first request.
+
+    Args:
+        story_dir: Story directory
+        file_format: One of EXPORT_FORMATS
+
+    Returns:
+        Path to the export, or None if it cannot be built
+    """
+    if file_format not in EXPORT_FORMATS:
+        return None
+
+    with _get_build_lock(story_dir, file_format):
+        fingerprint = source_fingerprint(story_dir)
+        manifest = _load_manifest(story_dir)
+        entry = manifest.get(file_format)
+        if entry and entry.get("fingerprint") == fingerprint:
+            cached_path = story_dir / entry["file"]
+            if cached_path.exists():
+                return cached_path
+
+        story_data = read_story_metadata(story_dir)
+        if not story_data:
+            return None
+
+        if file_format in ("html", "pdf"):
+            # Timed by the html_render / pdf_render stages of the renderers
+            built = _EXPORT_BUILDERS[file_format](story_data, story_dir)
+        else:
+            with time_stage(f"{file_format}_render"):
+                built = _EXPORT_BUILDERS[file_format](story_data, story_dir)
+        if not built:
+            return None
+
+        export_path = Path(built)
+        BYTES_WRITTEN_TOTAL.inc(export_path.stat().st_size)
+        with _get_build_lock(story_dir, "manifest"):
+            manifest = _load_manifest(story_dir)
+            manifest[file_format] = {
+                "file": export_path.name,
+                "fingerprint": fingerprint,
+                "created_at": datetime.now().isoformat(),
+            }
+            _save_manifest(story_dir, manifest)
+        try_publish_story(story_dir, [export_path])
+        return export_path
+
+
+def current_exports(story_dir: Path) -> dict[str, str]:
+    """
+    List the cached exports that are up to date with the story.
+
+    Returns:
+        Mapping of format to export file name
+    """
+    fingerprint = source_fingerprint(story_dir)
+    return {
+        file_format: entry["file"]
+        for file_format, entry in _load_manifest(story_dir).items()
+        if entry.get("fingerprint") == fingerprint and entry.get("file") and (story_dir / entry["file"]).is_file()
+    }
+
+
+def prune_stale_exports(story_dir: Path, dry_run: bool = False) -> list[Path]:
+    """
+    Delete cached exports built from an older version of the story.
+
+    They would be rebuilt on their next request anyway; until then they only
+    take up space. Exports written at generation time (not in the manifest)
+    are kept, since they are the fallback when an export cannot be rebuilt.
+
+    Args:
+        story_dir: Story directory
+        dry_run: Only report what would be deleted
+
+    Returns:
+        Paths of the deleted (or deletable) files
+    """
+    removed = []
+    manifest = _load_manifest(story_dir)
+    fingerprint = source_fingerprint(story_dir)
+    if all(entry.get("fingerprint") == fingerprint for entry in manifest.values()):
+        return removed
+
+    with contextlib.ExitStack() as stack:
+        for file_format in EXPORT_FORMATS:
+            lock = _get_build_lock(story_dir, file_format)
+            if not lock.acquire(blocking=False):
+                # An export is being built right now
+                return removed
+            stack.callback(lock.release)
+        stack.enter_context(_get_build_lock(story_dir, "manifest"))
+
+        manifest = _load_manifest(story_dir)
+        stale = [fmt for fmt, entry in manifest.items() if entry.get("fingerprint") != fingerprint]
+        current = {manifest[fmt].get("file") for fmt in manifest if fmt not in stale}
+        for file_format in stale:
+            name = manifest.pop(file_format).get("file")
+            path = story_dir / name if name else None
+            if path is not None and name not in current and path.is_file():
+                removed.append(path)
+                if not dry_run:
+                    path.unlink(missing_ok=True)
+        if stale and not dry_run:
+            _save_manifest(story_dir, manifest)
+    return removed
+
+
+def forget_build_locks(story_dirs: list[Path] | None = None):
+    """
+    Drop the build locks of deleted stories, and their lock files.
+
+    Args:
+        story_dirs: Deleted story directories (default: every story directory
+            that no longer exists, including archived ones)
+    """
+    with _build_locks_guard:
+        names = {str(d) for d in story_dirs} if story_dirs is not None else None
+        for key, lock in list(_build_locks.items()):
+            gone = key[0] in names if names is not None else not Path(key[0]).is_dir()
+            if gone and not lock.locked():
+                del _build_locks[key]
+
+    root = get_stories_dir()
+    locks_root = root / LOCKS_DIRNAME
+    if story_dirs is not None:
+        lock_dirs = {_get_locks_dir(d) for d in story_dirs}
+    else:
+        lock_dirs = {
+            path.parent for path in locks_root.rglob("*.lock")
+            if not (root / path.parent.relative_to(locks_root)).is_dir()
+        }
+    for lock_dir in lock_dirs:
+        shutil.rmtree(lock_dir, ignore_errors=True)
+        # Emptied bucket directories go too (rmdir fails on the others)
+        for parent in lock_dir.parents:
+            if parent == locks_root:
+                break
+            with contextlib.suppress(OSError):
+                parent.rmdir()
+
+
+def _safe_stem(story_data: dict[str, Any]) -> str:
+    """Build the filename stem used for all exports of a story."""
+    safe_prompt = "".join(c for c in story_data.get('original_prompt', 'story')[:30] if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    return f"{safe_prompt.replace(' ', '_')}_story"
+
+
+def _collect_scenes(story_data: dict[str, Any], story_dir: Path) -> list[dict[str, Any]]:
+    """Group scene parts into ordered scenes with an image path and text."""
+    scenes: dict[int, dict[str, Any]] = {}
+    for scene in story_data.get("scenes", []):
+        scene_num = scene.get("scene_number")
+        if not isinstance(scene_num, int):
+            continue
+        entry = scenes.setdefault(scene_num, {"number": scene_num, "image": None, "texts": []})
+        if scene.get("type") == "image":
+            image_path = story_dir / scene.get("filename", "")
+            if image_path.is_file():
+                entry["image"] = image_path
+        elif scene.get("type") == "text" and scene.get("content", "").strip():
+            entry["texts"].append(scene["content"].replace("**", "").strip())
+    return [scenes[num] for num in sorted(scenes)]
+
+
+def _write_zip_atomically(target: Path, write_entries):
+    """Write a ZIP archive to a temporary file and move it into place."""
+    # Unique per writer, like atomic_write_bytes(), so concurrent builds never share one
+    tmp_path = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            write_entries(archive)
+        tmp_path.replace(target)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _build_html(story_data: dict[str, Any], story_dir: Path) -> str | None:
+    return create_html_display(story_data, story_dir)
+
+
+def _build_pdf(story_data: dict[str, Any], story_dir: Path) -> str | None:
+    # Only sections that changed since the last render are laid out again
+    return render_story_pdf(story_data, story_dir)
+
+
+def _build_epub(story_data: dict[str, Any], story_dir: Path) -> str:
+    title = html.escape(story_data.get("original_prompt", "AI Story"))
+    story_id = html.escape(str(story_data.get("id", story_dir.name)))
+    modified = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    scenes = _collect_scenes(story_data, story_dir)
+    target = story_dir / f"{_safe_stem(story_data)}.epub"
+
+    def write_entries(archive: zipfile.ZipFile):
+        # The mimetype entry must come first and be stored uncompressed
+        archive.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        archive.writestr("META-INF/container.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+            '  <rootfiles>\n'
+            '    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>\n'
+            '  </rootfiles>\n'
+            '</container>\n'
+        ))
+
+        manifest_items = ['    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>']
+        spine_items = []
+        nav_items = []
+        for scene in scenes:
+            num = scene["number"]
+            page_name = f"scene_{num:02d}.xhtml"
+            body = f"    <h2>Scene {num}</h2>\n"
+            if scene["image"]:
+                image_name = f"images/{scene['image'].name}"
+                archive.write(scene["image"], f"OEBPS/{image_name}", compress_type=zipfile.ZIP_STORED)
+                manifest_items.append(f'    <item id="img{num}" href="{image_name}" media-type="image/png"/>')
+                body += f'    <img src="{image_name}" alt="Scene {num}"/>\n'
+            for text in scene["texts"]:
+                for paragraph in text.split("\n\n"):
+                    if paragraph.strip():
+                        body += f"    <p>{html.escape(paragraph.strip())}</p>\n"
+            archive.writestr(f"OEBPS/{page_name}", (
+                '<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<html xmlns="http://www.w3.org/1999/xhtml">\n'
+                f'<head><title>Scene {num}</title></head>\n'
+                f'<body>\n{body}</body>\n</html>\n'
+            ))
+            manifest_items.append(f'    <item id="scene{num}" href="{page_name}" media-type="application/xhtml+xml"/>')
+            spine_items.append(f'    <itemref idref="scene{num}"/>')
+            nav_items.append(f'      <li><a href="{page_name}">Scene {num}</a></li>')
+
+        archive.writestr("OEBPS/nav.xhtml", (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+            f'<head><title>{title}</title></head>\n'
+            '<body>\n'
+            '  <nav epub:type="toc">\n'
+            f'    <h1>{title}</h1>\n'
+            '    <ol>\n' + "\n".join(nav_items) + '\n    </ol>\n'
+            '  </nav>\n'
+            '</body>\n</html>\n'
+        ))
+        archive.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="story-id">\n'
+            '  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+            f'    <dc:identifier id="story-id">{story_id}</dc:identifier>\n'
+            f'    <dc:title>{title}</dc:title>\n'
+            '    <dc:language>en</dc:language>\n'
+            f'    <meta property="dcterms:modified">{modified}</meta>\n'
+            '  </metadata>\n'
+            '  <manifest>\n' + "\n".join(manifest_items) + '\n  </manifest>\n'
+            '  <spine>\n' + "\n".join(spine_items) + '\n  </spine>\n'
+            '</package>\n'
+        ))
+
+    _write_zip_atomically(target, write_entries)
+    return str(target)
+
+
+def _build_cbz(story_data: dict[str, Any], story_dir: Path) -> str:
+    scenes = [scene for scene in _collect_scenes(story_data, story_dir) if scene["image"]]
+    target = story_dir / f"{_safe_stem(story_data)}.cbz"
+
+    def write_entries(archive: zipfile.ZipFile):
+        for page, scene in enumerate(scenes, 1):
+            # PNGs are already compressed, so store them as-is
+            archive.write(scene["image"], f"{page:04d}.png", compress_type=zipfile.ZIP_STORED)
+        archive.writestr("ComicInfo.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<ComicInfo>\n'
+            f'  <Title>{html.escape(story_data.get("original_prompt", "AI Story"))}</Title>\n'
+            f'  <PageCount>{len(scenes)}</PageCount>\n'
+            '</ComicInfo>\n'
+        ))
+
+    _write_zip_atomically(target, write_entries)
+    return str(target)
+
+
+def _build_zip(story_data: dict[str, Any], story_dir: Path) -> str:
+    scenes = [scene for scene in _collect_scenes(story_data, story_dir) if scene["image"]]
+    target = story_dir / f"{_safe_stem(story_data)}_images.zip"
+
+    def write_entries(archive: zipfile.ZipFile):
+        for scene in scenes:
+            archive.write(scene["image"], scene["image"].name, compress_type=zipfile.ZIP_STORED)
+        archive.writestr(METADATA_FILENAME, json.dumps(story_data, indent=2, ensure_ascii=False))
+
+    _write_zip_atomically(target, write_entries)
+    return str(target)
+
+
+_EXPORT_BUILDERS = {
+    "html": _build_html,
+    "pdf": _build_pdf,
+    "epub": _build_epub,
+    "cbz": _build_cbz,
+    "zip": _build_zip,
+}
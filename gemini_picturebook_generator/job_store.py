@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+File-Backed Job Status Store for Gemini Picture Book Generator
+
+Generation jobs report their status (progress, messages, result or error)
+through this store instead of a module-level dict, so every worker process of
+a multi-process web server sees the same jobs: the worker that answers a
+/status poll need not be the one running the generation.
+
+Each job is one small JSON file under <stories dir>/.jobs, replaced atomically
+on every update. Jobs whose worker process has exited before finishing are
+reported as failed, and finished jobs are pruned after JOB_STATUS_TTL seconds
+(default 86400).
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from .catalog import get_stories_dir
+from .story_metadata import atomic_write_bytes
+
+JOBS_DIRNAME = ".jobs"
+DEFAULT_TTL = 86400
+TERMINAL_STATUSES = ("complete", "error")
+
+_JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        # Exists but belongs to someone else, or cannot be checked here
+        return True
+    return True
+
+
+class JobStore:
+    """Job statuses shared by all processes using the same stories directory."""
+
+    def __init__(self, root: Path | None = None):
+        """
+        Args:
+            root: Directory holding the job files (default: <stories dir>/.jobs)
+        """
+        self._root = Path(root) if root else None
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    @property
+    def root(self) -> Path:
+        # Resolved on use so OUTPUT_DIR changes (tests, benchmarks) are honored
+        return self._root or get_stories_dir() / JOBS_DIRNAME
+
+    def _path(self, job_id: str) -> Path:
+        if not _JOB_ID_PATTERN.match(job_id):
+            raise KeyError(job_id)
+        return self.root / f"{job_id}.json"
+
+    def _read(self, job_id: str) -> dict[str, Any] | None:
+        try:
+            with open(self._path(job_id), "rb") as f:
+                status = json.loads(f.read())
+        except (OSError, ValueError, KeyError):
+            return None
+        return status if isinstance(status, dict) else None
+
+    def put(self, job_id: str, status: dict[str, Any]):
+        """
+        Replace a job's status.
+
+        Args:
+            job_id: Job id (letters, digits, "_", "-" and ".")
+            status: JSON-serializable status record
+        """
+        record = {**status, "job_id": job_id, "worker_pid": os.getpid(), "updated_at": time.time()}
+        path = self._path(job_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Status files are rebuilt by the next update, so never worth an fsync
+        atomic_write_bytes(path, json.dumps(record, default=str).encode("utf-8"), "none")
+        self._maybe_prune()
+
+    def update(self, job_id: str, **fields: Any) -> dict[str, Any]:
+        """
+        Merge fields into a job's status.
+
+        Only the process running a job updates it, so read-modify-write under
+        a process-local lock is sufficient.
+
+        Returns:
+            The updated status
+        """
+        with self._lock:
+            status = self._read(job_id) or {}
+            status.update(fields)
+            self.put(job_id, status)
+            return status
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        """
+        Get a job's status.
+
+        Returns:
+            Status record, or None if the job is unknown
+        """
+        status = self._read(job_id)
+        if status is None:
+            return None
+        pid = status.get("worker_pid")
+        if status.get("status") not in TERMINAL_STATUSES and isinstance(pid, int) and not _pid_alive(pid):
+            status.update(
+                status="error",
+                message="Generation stopped",
+                error="The worker running this job exited before it finished",
+            )
+        return status
+
+    def delete(self, job_id: str) -> bool:
+        """
+        Forget a job (e.g. its story was deleted).
+
+        Returns:
+            False if the job was unknown
+        """
+        try:
+            self._path(job_id).unlink()
+        except (OSError, KeyError):
+            return False
+        return True
+
+    def __contains__(self, job_id: str) -> bool:
+        return self._read(job_id) is not None
+
+    def _maybe_prune(self):
+        now = time.time()
+        if now - self._last_prune < 300:
+            return
+        self._last_prune = now
+        self.prune()
+
+    def prune(self, ttl: float | None = None) -> int:
+        """
+        Delete jobs finished (or last updated) more than ttl seconds ago.
+
+        Returns:
+            Number of job files removed
+        """
+        if ttl is None:
+            ttl = float(os.getenv("JOB_STATUS_TTL", DEFAULT_TTL))
+        cutoff = time.time() - ttl
+        removed = 0
+        try:
+            paths = list(self.root.glob("*.json"))
+        except OSError:
+            return 0
+        for path in paths:
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+
+_job_store: JobStore | None = None
+_job_store_guard = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """Get the process-wide job store."""
+    global _job_store
+    with _job_store_guard:
+        if _job_store is None:
+            _job_store = JobStore()
+        return _job_store
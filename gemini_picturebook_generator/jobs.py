@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+In-Flight Generation Coalescing for Gemini Picture Book Generator
+
+When identical generations (same normalized prompt, scene count, character,
+setting and style) are requested while one is already running, the later
+requests attach to the running job instead of starting their own: they get its
+job id, replay and follow its progress events and share its output directory.
+N identical concurrent requests therefore cost one API call.
+
+The registry is process-wide, so the web UI and the MCP server coalesce with
+each other when they run in the same process. Worker processes of a
+multi-worker server do not see each other's flights: identical requests
+routed to different workers each run their own generation.
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import hashlib
+import threading
+import time
+from typing import Any
+
+from .metrics import REGISTRY
+from .progress import ProgressCallback
+
+COALESCED_TOTAL = REGISTRY.counter("picturebook_coalesced_requests_total", "Requests attached to an identical in-flight job")
+
+
+def _normalize(text: Any) -> str:
+    return " ".join(str(text or "").split()).casefold()
+
+
+def generation_key(story_prompt: str, num_scenes: int, character_name: str = "", setting: str = "", style: str = "") -> str:
+    """
+    Build the coalescing key for a generation request.
+
+    Args:
+        story_prompt: User story prompt
+        num_scenes: Number of scenes
+        character_name: Optional main character
+        setting: Optional setting
+        style: Art style
+
+    Returns:
+        Hex digest identifying identical requests
+    """
+    material = "\x1f".join(_normalize(value) for value in (story_prompt, num_scenes, character_name, setting, style))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class Flight:
+    """One running generation that identical requests can attach to."""
+
+    def __init__(self, key: str, job_id: str):
+        self.key = key
+        self.job_id = job_id
+        self.started_at = time.time()
+        self.followers = 0
+        self.result: Any = None
+        self.error: str | None = None
+        self._events: list[dict[str, Any]] = []
+        self._subscribers: list[ProgressCallback] = []
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def publish(self, event: dict[str, Any]):
+        """Record a progress event and pass it to every follower."""
+        with self._lock:
+            self._events.append(event)
+            for callback in self._subscribers:
+                callback(event)
+
+    def subscribe(self, callback: ProgressCallback):
+        """Follow the job: replay its events so far, then receive new ones."""
+        # Replay under the lock so no live event can overtake the history
+        with self._lock:
+            for event in self._events:
+                callback(event)
+            self._subscribers.append(callback)
+        if self._done.is_set():
+            self._close(callback)
+
+    def unsubscribe(self, callback: ProgressCallback):
+        """Stop following the job (e.g. a viewer disconnected)."""
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    @staticmethod
+    def _close(callback: ProgressCallback):
+        close = getattr(callback, "close", None)
+        if close:
+            close()
+
+    def finish(self, result: Any = None, error: str | None = None):
+        """Store the outcome and release everyone waiting on the job."""
+        with self._lock:
+            self.result = result
+            self.error = error
+            subscribers = list(self._subscribers)
+            self._done.set()
+        for callback in subscribers:
+            self._close(callback)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def last_event(self) -> dict[str, Any] | None:
+        """The most recent progress event, if any."""
+        with self._lock:
+            return self._events[-1] if self._events else None
+
+    def wait(self, timeout: float | None = None) -> Any:
+        """
+        Block until the job finishes.
+
+        Returns:
+            The job result
+
+        Raises:
+            RuntimeError: If the job failed
+            TimeoutError: If the timeout expired
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Job {self.job_id} did not finish within {timeout}s")
+        if self.error:
+            raise RuntimeError(self.error)
+        return self.result
+
+
+class SingleFlight:
+    """Registry of in-flight generations keyed by generation_key()."""
+
+    def __init__(self):
+        self._flights: dict[str, Flight] = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: str, job_id: str) -> tuple[Flight, bool]:
+        """
+        Start a job for the key, or attach to the one already running.
+
+        Args:
+            key: Coalescing key
+            job_id: Id to use if this request becomes the leader
+
+        Returns:
+            Tuple of (flight, is_leader); followers must not start work
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and not flight.done:
+                flight.followers += 1
+                COALESCED_TOTAL.inc()
+                return flight, False
+            flight = Flight(key, job_id)
+            self._flights[key] = flight
+            return flight, True
+
+    def finish(self, flight: Flight, result: Any = None, error: str | None = None):
+        """Complete a leader's job and stop coalescing new requests onto it."""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        flight.finish(result, error)
+
+    def get(self, job_id: str) -> Flight | None:
+        """Find an in-flight job by id."""
+        with self._lock:
+            return next((f for f in self._flights.values() if f.job_id == job_id), None)
+
+
+# Shared by every entry point in the process
+INFLIGHT = SingleFlight()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+API Key Pool for Gemini Picture Book Generator
+
+Gemini quotas are enforced per project and model, so several API keys (from
+separate projects) multiply the achievable throughput. When GOOGLE_API_KEYS
+lists more than one key, setup_client() returns a PooledClient that routes
+every request to the key with the most headroom:
+
+- each (key, model) pair has its own token bucket (GEMINI_RPM per key)
+- a 429 puts the key on cooldown for Retry-After (or GEMINI_KEY_COOLDOWN)
+  seconds and the request fails over to another key immediately
+- repeated transient errors cool a key down; auth errors disable it
+- among usable keys the one with the most tokens and fewest in-flight
+  requests wins
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import os
+import threading
+import time
+from typing import Any
+
+from .metrics import RATE_LIMITED_TOTAL, REGISTRY, time_stage
+from .ratelimit import DEFAULT_BURST, DEFAULT_RPM, TokenBucket
+from .retry import FATAL, RATE_LIMITED, classify_error, get_retry_after
+
+DEFAULT_KEY_COOLDOWN = 30.0
+# Consecutive transient failures before a key is cooled down
+MAX_CONSECUTIVE_FAILURES = 3
+
+AUTH_ERROR_MARKERS = ("401", "403", "API_KEY_INVALID", "PERMISSION_DENIED", "UNAUTHENTICATED")
+
+KEY_REQUESTS_TOTAL = REGISTRY.counter("picturebook_key_requests_total", "Model requests sent per API key")
+
+
+class NoUsableKeyError(RuntimeError):
+    """Raised when every key in the pool is disabled."""
+
+
+def mask_key(api_key: str) -> str:
+    """Shorten an API key to a loggable identifier."""
+    return f"…{api_key[-4:]}" if len(api_key) > 4 else "…"
+
+
+class _KeyState:
+    """Health and load of one API key."""
+
+    def __init__(self, api_key: str, client: Any, rate_per_minute: float, burst: int):
+        self.api_key = api_key
+        self.name = mask_key(api_key)
+        self.client = client
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.buckets: dict[str, TokenBucket] = {}
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.disabled = False
+        self.last_error: str | None = None
+
+    def bucket(self, model: str) -> TokenBucket:
+        if model not in self.buckets:
+            self.buckets[model] = TokenBucket(self.rate_per_minute, self.burst)
+        return self.buckets[model]
+
+
+class KeyPool:
+    """Thread-safe pool of API keys with per-key pacing and health tracking."""
+
+    def __init__(
+        self,
+        clients: dict[str, Any],
+        rate_per_minute: float = DEFAULT_RPM,
+        burst: int = DEFAULT_BURST,
+        cooldown: float = DEFAULT_KEY_COOLDOWN,
+    ):
+        """
+        Args:
+            clients: Mapping of API key to a client created for that key
+            rate_per_minute: Requests per minute allowed per key and model
+            burst: Back-to-back requests allowed per key and model
+            cooldown: Seconds a key rests after a 429 without Retry-After
+        """
+        if not clients:
+            raise ValueError("A key pool needs at least one API key")
+        self.cooldown = cooldown
+        self._keys = [_KeyState(key, client, rate_per_minute, burst) for key, client in clients.items()]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _try_lease(self, model: str) -> tuple[_KeyState | None, float]:
+        """Lease the least-loaded usable key, or report how long to wait."""
+        with self._lock:
+            now = time.monotonic()
+            usable = [k for k in self._keys if not k.disabled]
+            if not usable:
+                raise NoUsableKeyError("All API keys are disabled; check GOOGLE_API_KEYS")
+
+            ready = [k for k in usable if k.cooldown_until <= now]
+            ready.sort(key=lambda k: (-k.bucket(model).available(), k.in_flight))
+            waits = [k.cooldown_until - now for k in usable if k.cooldown_until > now]
+            for key in ready:
+                wait = key.bucket(model).try_acquire()
+                if wait <= 0:
+                    key.in_flight += 1
+                    key.requests += 1
+                    return key, 0.0
+                waits.append(wait)
+            return None, min(waits)
+
+    def acquire(self, model: str) -> _KeyState:
+        """
+        Block until a key has headroom for the model, and lease it.
+
+        Raises:
+            NoUsableKeyError: If every key is disabled
+        """
+        with time_stage("rate_limit_wait"):
+            while True:
+                key, wait = self._try_lease(model)
+                if key is not None:
+                    KEY_REQUESTS_TOTAL.inc(key=key.name)
+                    return key
+                time.sleep(wait)
+
+    def release(self, key: _KeyState, error: Exception | None = None):
+        """
+        Return a leased key and record the outcome of its request.
+
+        Args:
+            key: Key returned by acquire()
+            error: Exception raised by the request, if it failed
+        """
+        with self._lock:
+            key.in_flight -= 1
+            if error is None:
+                key.consecutive_failures = 0
+                return
+
+            key.failures += 1
+            key.last_error = str(error)[:200]
+            message = str(error).upper()
+            kind = classify_error(error)
+            if kind == FATAL and any(marker in message for marker in AUTH_ERROR_MARKERS):
+                key.disabled = True
+            elif kind == RATE_LIMITED:
+                cooldown = get_retry_after(error) or self.cooldown
+                key.cooldown_until = max(key.cooldown_until, time.monotonic() + cooldown)
+            elif kind != FATAL:
+                key.consecutive_failures += 1
+                if key.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                    key.cooldown_until = time.monotonic() + self.cooldown
+                    key.consecutive_failures = 0
+
+    def has_ready_key(self) -> bool:
+        """Check whether any key is currently neither disabled nor cooling down."""
+        with self._lock:
+            now = time.monotonic()
+            return any(not k.disabled and k.cooldown_until <= now for k in self._keys)
+
+    def status(self) -> list[dict[str, Any]]:
+        """Get a per-key health summary (keys are masked)."""
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    "key": k.name,
+                    "disabled": k.disabled,
+                    "cooldown_seconds": round(max(0.0, k.cooldown_until - now), 1),
+                    "in_flight": k.in_flight,
+                    "requests": k.requests,
+                    "failures": k.failures,
+                    "last_error": k.last_error,
+                }
+                for k in self._keys
+            ]
+
+
+class _PooledModels:
+    """Implements client.models by dispatching to pooled keys."""
+
+    def __init__(self, pool: KeyPool):
+        self._pool = pool
+
+    def generate_content(self, model: str, contents: Any, config: Any = None) -> Any:
+        while True:
+            key = self._pool.acquire(model)
+            try:
+                response = key.client.models.generate_content(model=model, contents=contents, config=config)
+            except Exception as error:
+                self._pool.release(key, error)
+                # Fail over right away while another key has headroom; otherwise
+                # let the caller's retry policy back off
+                rate_limited = classify_error(error) == RATE_LIMITED
+                if (rate_limited or key.disabled) and self._pool.has_ready_key():
+                    if rate_limited:
+                        RATE_LIMITED_TOTAL.inc()
+                    continue
+                raise
+            self._pool.release(key)
+            return response
+
+
+class PooledClient:
+    """Client that spreads model requests over a KeyPool."""
+
+    # Requests are paced per key, so callers must not add a shared limiter
+    paces_requests = True
+
+    def __init__(self, pool: KeyPool):
+        self.pool = pool
+        self.models = _PooledModels(pool)
+
+
+_pooled_clients: dict[tuple[str, ...], PooledClient] = {}
+_pooled_clients_guard = threading.Lock()
+
+
+def create_pooled_client(api_keys: list[str]) -> PooledClient:
+    """
+    Get the pooled client for a set of keys, creating it on first use.
+
+    The client is shared by every caller in the process, so all concurrent
+    generations draw on the same per-key buckets and health state.
+
+    Args:
+        api_keys: API keys, ideally from separate projects
+
+    Returns:
+        PooledClient configured from GEMINI_RPM, GEMINI_BURST and GEMINI_KEY_COOLDOWN
+    """
+    from .backends import create_client
+
+    pool_id = tuple(api_keys)
+    with _pooled_clients_guard:
+        if pool_id not in _pooled_clients:
+            clients = {key: create_client(key) for key in api_keys}
+            pool = KeyPool(
+                clients,
+                rate_per_minute=float(os.getenv("GEMINI_RPM", DEFAULT_RPM)),
+                burst=int(os.getenv("GEMINI_BURST", DEFAULT_BURST)),
+                cooldown=float(os.getenv("GEMINI_KEY_COOLDOWN", DEFAULT_KEY_COOLDOWN)),
+            )
+            _pooled_clients[pool_id] = PooledClient(pool)
+        return _pooled_clients[pool_id]
@@ -31,17 +31,42 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any
 
-import aiofiles
 from mcp.server.fastmcp import Context, FastMCP
 
+from .archive import archived_story_files, list_archived_stories, read_archived_metadata
+from .backends import (
+    enable_server_mode,
+    get_api_keys,
+    get_backend_name,
+    is_api_configured,
+)
+from .catalog import (
+    find_story_dir,
+    find_story_file,
+    get_stories_dir,
+    iter_story_dirs,
+    story_path,
+)
+
 # Import our existing story generation functions
 from .enhanced_story_generator import (
-    create_html_display,
-    create_pdf_from_html,
-    generate_custom_story_with_images,
+    regenerate_scene as regenerate_story_scene,
+)
+from .enhanced_story_generator import (
     setup_client,
     test_api_connection,
 )
+from .exports import EXPORT_FORMATS, get_export
+from .job_store import get_job_store
+from .metrics import REGISTRY
+from .progress import logging_subscriber
+from .retention import set_story_pinned, start_background_gc, stop_background_gc
+from .scheduler import get_scheduler
+from .story_metadata import (
+    METADATA_FILENAME,
+    read_story_header,
+    read_story_metadata,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -57,7 +82,6 @@ logger = logging.getLogger(__name__)
 # Global tracking for cleanup
 running_processes: dict[str, Any] = {}
 background_tasks: set[asyncio.Task] = set()
-generation_status: dict[str, dict[str, Any]] = {}
 
 
 def cleanup_processes():
@@ -71,7 +95,6 @@ def cleanup_processes():
 
     background_tasks.clear()
     running_processes.clear()
-    generation_status.clear()
     logger.info("Cleanup completed")
 
 
@@ -189,24 +212,58 @@ async def open_file_in_browser(file_path: str) -> dict[str, Any]:
         }
 
 
-@asynccontextmanager
-async def app_lifespan(server: FastMCP):
-    """Manage application lifecycle with cleanup."""
-    logger.info("Starting Enhanced Gemini Picture Book Generator MCP Server...")
-
-    # Test API connection on startup
+async def _verify_api_connection():
     try:
-        if test_api_connection():
+        if await asyncio.to_thread(test_api_connection):
             logger.info("✅ Gemini API connection verified")
         else:
             logger.warning("⚠️ Could not verify Gemini API connection")
     except Exception as e:
         logger.error(f"❌ API connection test failed: {e}")
 
+
+_web_ui_server: Any = None
+
+
+def _start_web_ui(bind: str) -> asyncio.Task:
+    """Serve the ASGI web UI on this server's event loop, sharing its scheduler."""
+    global _web_ui_server
+    from .asgi import create_embedded_server
+
+    _web_ui_server = create_embedded_server(bind)
+    logger.info(f"🌐 Web UI on http://{bind}")
+    task = asyncio.create_task(_web_ui_server.serve())
+    track_background_task(task)
+    return task
+
+
+async def _stop_web_ui(task: asyncio.Task):
+    _web_ui_server.should_exit = True
+    await asyncio.wait([task], timeout=10)
+
+
+@asynccontextmanager
+async def app_lifespan(server: FastMCP):
+    """Manage application lifecycle with cleanup."""
+    logger.info("Starting Enhanced Gemini Picture Book Generator MCP Server...")
+
+    # Test the API connection in the background, so tools answer right after
+    # spawn instead of waiting for the client import and a model round trip
+    track_background_task(asyncio.create_task(_verify_api_connection()))
+
+    # MCP_WEB_BIND serves the web UI from this process, on the same loop and scheduler
+    web_bind = os.getenv("MCP_WEB_BIND")
+    web_ui_task = _start_web_ui(web_bind) if web_bind and _web_ui_server is None else None
+    # Retention and cleanup of orphaned stories (RETENTION_* settings)
+    start_background_gc()
+
     try:
         yield {"initialized_at": datetime.now().isoformat()}
     finally:
         logger.info("Shutting down MCP server...")
+        if web_ui_task is not None:
+            await _stop_web_ui(web_ui_task)
+        stop_background_gc()
         cleanup_processes()
 
 
@@ -248,105 +305,186 @@ async def generate_story(
     Returns:
         JSON string with story data and file paths
     """
-    story_id = f"story_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    story_id = None
     try:
         await _story_generation_log_start(ctx, story_prompt, num_scenes, style, auto_open)
-        _validate_story_inputs(story_prompt)
         num_scenes = max(num_scenes, 1)
-        output_dir = _create_output_dir(story_id)
-        await _story_generation_log_dir(ctx, output_dir)
-        _track_generation_status(story_id, story_prompt, num_scenes)
-        client = _setup_gemini_client(ctx)
-        enhanced_prompt = _build_enhanced_prompt(story_prompt, character_name, setting, style)
+
+        # Runs on the shared scheduler; identical requests already running are joined
+        scheduler = get_scheduler()
+        job = scheduler.submit(
+            story_prompt, num_scenes, character_name, setting, style,
+            extra_metadata={"mcp_generated": True},
+            notify=_progress_notifier(ctx, num_scenes),
+        )
+        story_id = job["story_id"]
+        if job["coalesced"] and ctx:
+            await ctx.info(f"🔗 Identical story already generating; following job {story_id}")
         await _story_generation_log_estimate(ctx, num_scenes)
         await _story_generation_log_progress(ctx, 1, num_scenes + 3)
-        story_data = await _run_story_generation(client, enhanced_prompt, num_scenes, output_dir)
+
+        story_data = await scheduler.wait(story_id)
+        output_dir = Path(story_data["output_dir"])
         await _story_generation_log_generated(ctx, story_data, num_scenes)
-        _add_story_metadata(story_data, story_id, character_name, setting, style, output_dir)
-        html_path, pdf_path = await _export_story(ctx, story_data, output_dir)
-        await _save_story_metadata(story_data, output_dir)
+        html_path, pdf_path = await _export_story(ctx, auto_open, output_dir)
         await _story_generation_log_progress(ctx, num_scenes + 2, num_scenes + 3)
         browser_result = await _maybe_open_in_browser(ctx, auto_open, html_path)
-        _update_generation_status_complete(story_id, story_data, browser_result)
         await _story_generation_log_complete(ctx, output_dir, num_scenes + 3)
-        logger.info(f"Successfully generated story {story_id} with {num_scenes} scenes")
-        return _story_success_json(story_id, story_data, output_dir, html_path, pdf_path, browser_result)
+        return _story_success_json(
+            story_id, story_data, output_dir, html_path, pdf_path, browser_result, job["coalesced"],
+        )
     except Exception as e:
         return await _handle_story_generation_error(e, story_id)
 
-# --- Helper functions for generate_story ---
+@mcp.tool()
+async def submit_story(
+    story_prompt: str,
+    num_scenes: int = 6,
+    character_name: str = "",
+    setting: str = "",
+    style: str = "cartoon",
+    ctx: Context | None = None,
+) -> str:
+    """
+    Queue a picture book for generation and return its job id immediately.
 
-def _validate_story_inputs(story_prompt: str):
-    if not story_prompt.strip():
-        raise ValueError("Story prompt is required")
-
-def _create_output_dir(story_id: str) -> Path:
-    project_dir = Path(__file__).parent.parent
-    output_dir = project_dir / "generated_stories" / story_id
-    output_dir.mkdir(parents=True, exist_ok=True)
-    return output_dir
-
-def _track_generation_status(story_id: str, story_prompt: str, num_scenes: int):
-    generation_status[story_id] = {
-        "status": "initializing",
-        "progress": 0,
-        "message": "Setting up story generation...",
-        "story_prompt": story_prompt,
-        "num_scenes": num_scenes,
-        "start_time": datetime.now().isoformat(),
-    }
+    Unlike generate_story this does not wait for the book: poll
+    get_generation_status with the returned story_id (status goes queued ->
+    generating -> complete or error), or follow the progress notifications.
 
-def _setup_gemini_client(ctx):
-    if ctx:
-        task = asyncio.create_task(ctx.info("🔌 Connecting to Gemini API..."))
-        track_background_task(task)
+    Args:
+        story_prompt: The main story idea (required)
+        num_scenes: Number of scenes to generate
+        character_name: Optional main character name
+        setting: Optional story setting/location
+        style: Art style (cartoon, anime, realistic, watercolor, digital art, oil painting, sketch, fantasy art)
+
+    Returns:
+        JSON string with the job's story_id and status
+    """
+    try:
+        job = _submit_story_job(ctx, story_prompt, num_scenes, character_name, setting, style)
+    except ValueError as e:
+        return json.dumps({"success": False, "error": str(e)}, indent=2)
+    return json.dumps({"success": True, **job}, indent=2)
+
+
+@mcp.tool()
+async def submit_story_batch(
+    story_prompts: list[str],
+    num_scenes: int = 6,
+    character_name: str = "",
+    setting: str = "",
+    style: str = "cartoon",
+    ctx: Context | None = None,
+) -> str:
+    """
+    Queue several picture books at once and return their job ids immediately.
+
+    Every prompt becomes its own job with the shared options; at most
+    MAX_CONCURRENT_STORIES of them generate at a time and the rest wait
+    in the queue. Track each job with get_generation_status.
+
+    Args:
+        story_prompts: Story ideas, one book per prompt
+        num_scenes: Number of scenes per book
+        character_name: Optional main character name
+        setting: Optional story setting/location
+        style: Art style applied to every book
+
+    Returns:
+        JSON string with one job entry (or error) per prompt, in order
+    """
+    jobs = []
+    for story_prompt in story_prompts:
+        try:
+            jobs.append(_submit_story_job(ctx, story_prompt, num_scenes, character_name, setting, style))
+        except ValueError as e:
+            jobs.append({"story_prompt": story_prompt, "error": str(e)})
+    return json.dumps({
+        "success": True,
+        "submitted": len([job for job in jobs if "story_id" in job]),
+        "jobs": jobs,
+    }, indent=2)
+
+
+def _submit_story_job(ctx, story_prompt, num_scenes, character_name, setting, style) -> dict[str, Any]:
+    """Queue a generation on the shared scheduler (or attach to an identical one)."""
+    num_scenes = max(num_scenes, 1)
+    job = get_scheduler().submit(
+        story_prompt, num_scenes, character_name, setting, style,
+        extra_metadata={"mcp_generated": True},
+        notify=_progress_notifier(_BackgroundContext(ctx) if ctx else None, num_scenes, announce_outcome=True),
+    )
+    return {"story_prompt": story_prompt, **job}
+
+
+def _progress_notifier(ctx, num_scenes, announce_outcome=False):
+    """Forward a job's progress events to the MCP client as progress notifications."""
+    if ctx is None:
+        return None
+
+    async def notify(event):
+        if event["event"] == "scene_image":
+            # Steps 2..num_scenes + 1 of num_scenes + 3 are the scenes
+            await ctx.report_progress(1 + min(event["scene"], num_scenes), num_scenes + 3)
+        elif announce_outcome and event["event"] == "completed":
+            await ctx.info(f"🎉 {event['message']}")
+            await ctx.report_progress(num_scenes + 3, num_scenes + 3)
+        elif announce_outcome and event["event"] == "failed":
+            await ctx.error(f"❌ {event['message']}")
+    return notify
+
+
+class _BackgroundContext:
+    """
+    Forwards a submitted job's notifications to the client that submitted it.
+
+    The submitting tool call has already returned, so a transport may refuse
+    notifications tied to it; they are best effort and never fail the job.
+    """
+
+    def __init__(self, ctx: Context):
+        self._ctx = ctx
+
+    async def _send(self, method: str, *args):
+        try:
+            await getattr(self._ctx, method)(*args)
+        except Exception as e:
+            logger.debug(f"Dropped {method} notification for a submitted job: {e}")
+
+    async def info(self, message: str):
+        await self._send("info", message)
+
+    async def warning(self, message: str):
+        await self._send("warning", message)
+
+    async def error(self, message: str):
+        await self._send("error", message)
+
+    async def report_progress(self, progress: float, total: float | None = None):
+        await self._send("report_progress", progress, total)
+
+
+# --- Helper functions for generate_story ---
+
+def _setup_gemini_client():
+    # Blocking (client import, key checks): call it from an executor thread
+    enable_server_mode()
     client = setup_client()
     if not client:
         raise RuntimeError("Failed to initialize Gemini API client")
     return client
 
-def _build_enhanced_prompt(story_prompt, character_name, setting, style):
-    enhanced_prompt = story_prompt
-    if character_name:
-        enhanced_prompt = f"A story about {character_name}: {story_prompt}"
-    if setting:
-        enhanced_prompt += f" The story takes place in {setting}."
-    enhanced_prompt += f" Create this in {style} art style."
-    return enhanced_prompt
-
-async def _run_story_generation(client, enhanced_prompt, num_scenes, output_dir):
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(
-        None,
-        lambda: generate_custom_story_with_images(
-            client, enhanced_prompt, num_scenes, output_dir
-        ),
-    )
-
-def _add_story_metadata(story_data, story_id, character_name, setting, style, output_dir):
-    story_data.update({
-        "id": story_id,
-        "character_name": character_name,
-        "setting": setting,
-        "style": style,
-        "output_dir": str(output_dir),
-        "mcp_generated": True,
-    })
-
-async def _export_story(ctx, story_data, output_dir):
+async def _export_story(ctx, auto_open, output_dir):
+    # Exports are built lazily; only the HTML is needed up front to auto-open it
+    if not auto_open:
+        return None, None
     if ctx:
-        await ctx.info("📄 Creating HTML and PDF exports...")
-    html_path = create_html_display(story_data, output_dir)
-    story_data["html_path"] = html_path
-    pdf_path = create_pdf_from_html(html_path, output_dir)
-    if pdf_path:
-        story_data["pdf_path"] = pdf_path
-    return html_path, pdf_path
-
-async def _save_story_metadata(story_data, output_dir):
-    metadata_path = output_dir / "story_metadata.json"
-    async with aiofiles.open(metadata_path, "w", encoding="utf-8") as f:
-        await f.write(json.dumps(story_data, indent=2, ensure_ascii=False))
+        await ctx.info("📄 Creating HTML export...")
+    loop = asyncio.get_event_loop()
+    html_path = await loop.run_in_executor(None, get_export, output_dir, "html")
+    return (str(html_path) if html_path else None), None
 
 async def _maybe_open_in_browser(ctx, auto_open, html_path):
     browser_result = {"success": False, "message": "Auto-open disabled"}
@@ -361,16 +499,7 @@ async def _maybe_open_in_browser(ctx, auto_open, html_path):
                 await ctx.warning(f"⚠️ Could not auto-open browser: {browser_result.get('error', 'Unknown error')}")
     return browser_result
 
-def _update_generation_status_complete(story_id, story_data, browser_result):
-    generation_status[story_id].update({
-        "status": "complete",
-        "progress": 100,
-        "data": story_data,
-        "browser_opened": browser_result["success"],
-        "end_time": datetime.now().isoformat(),
-    })
-
-def _story_success_json(story_id, story_data, output_dir, html_path, pdf_path, browser_result):
+def _story_success_json(story_id, story_data, output_dir, html_path, pdf_path, browser_result, coalesced=False):
     return json.dumps({
         "success": True,
         "story_id": story_id,
@@ -378,24 +507,20 @@ def _story_success_json(story_id, story_data, output_dir, html_path, pdf_path, b
         "output_directory": str(output_dir),
         "html_path": html_path,
         "pdf_path": pdf_path,
+        "export_formats": list(EXPORT_FORMATS),
         "scenes_generated": len([s for s in story_data["scenes"] if s["type"] == "image"]),
         "browser_opened": browser_result["success"],
         "browser_message": browser_result.get("message", ""),
+        "coalesced": coalesced,
     }, indent=2)
 
 async def _handle_story_generation_error(e, story_id):
     error_msg = f"Story generation failed: {e!s}"
     logger.error(error_msg, exc_info=True)
-    if story_id in generation_status:
-        generation_status[story_id].update({
-            "status": "error",
-            "error": error_msg,
-            "end_time": datetime.now().isoformat(),
-        })
     return json.dumps({
         "success": False,
         "error": error_msg,
-        "story_id": story_id if "story_id" in locals() else None,
+        "story_id": story_id,
     }, indent=2)
 
 async def _story_generation_log_start(ctx, story_prompt, num_scenes, style, auto_open):
@@ -403,10 +528,6 @@ async def _story_generation_log_start(ctx, story_prompt, num_scenes, style, auto
         await ctx.info(f"🎨 Starting story generation: '{story_prompt}'")
         await ctx.info(f"📊 Scenes: {num_scenes}, Style: {style}, Auto-open: {auto_open}")
 
-async def _story_generation_log_dir(ctx, output_dir):
-    if ctx:
-        await ctx.info(f"📁 Created output directory: {output_dir}")
-
 async def _story_generation_log_estimate(ctx, num_scenes):
     if ctx:
         await ctx.info(f"⏱️ Estimated time: ~{num_scenes * 6 / 60:.1f} minutes (rate limiting)")
@@ -452,23 +573,24 @@ async def open_story_in_browser(story_id: str, ctx: Context | None = None) -> st
             })
 
         story_data = story_info["story_data"]
+        loop = asyncio.get_event_loop()
+        if story_data.get("archived"):
+            # Opening needs real files: restore the story from the archive
+            story_dir = await loop.run_in_executor(None, find_story_dir, story_id)
+            if story_dir is None:
+                return json.dumps({"success": False, "error": f"Story {story_id} could not be restored"})
+        else:
+            story_dir = Path(story_data["output_directory"])
 
-        # Find HTML file
-        html_files = story_data.get("html_files", [])
-        if not html_files:
-            return json.dumps({
-                "success": False,
-                "error": "No HTML file found for this story"
-            })
-
-        # Use the first HTML file
-        html_filename = html_files[0]
-        html_path = Path(story_data["output_directory"]) / html_filename
+        # Build the HTML export on first use, falling back to any legacy HTML file
+        html_path = await loop.run_in_executor(None, get_export, story_dir, "html")
+        if not html_path:
+            html_path = find_story_file(story_dir, "html")
 
-        if not html_path.exists():
+        if not html_path or not html_path.exists():
             return json.dumps({
                 "success": False,
-                "error": f"HTML file not found: {html_path}"
+                "error": "No HTML file found for this story"
             })
 
         # Open in browser
@@ -510,8 +632,7 @@ async def list_generated_stories(limit: int = 20) -> str:
         JSON string with list of stories and their metadata
     """
     try:
-        project_dir = Path(__file__).parent.parent
-        stories_dir = project_dir / "generated_stories"
+        stories_dir = get_stories_dir()
 
         if not stories_dir.exists():
             return json.dumps({
@@ -522,19 +643,17 @@ async def list_generated_stories(limit: int = 20) -> str:
             })
 
         stories = []
-        story_dirs = sorted(
-            stories_dir.glob("story_*"),
-            key=lambda x: x.stat().st_mtime,
-            reverse=True,
-        )[:limit]
-
-        for story_dir in story_dirs:
-            metadata_file = story_dir / "story_metadata.json"
+        # Newest first; only the most recent buckets are listed to fill a page
+        for story_dir in iter_story_dirs():
+            if len(stories) >= limit:
+                break
+            metadata_file = story_dir / METADATA_FILENAME
             if metadata_file.exists():
                 try:
-                    async with aiofiles.open(metadata_file, encoding="utf-8") as f:
-                        content = await f.read()
-                        metadata = json.loads(content)
+                    # Only the small header record is needed for listings
+                    metadata = read_story_header(story_dir)
+                    if metadata is None:
+                        raise ValueError(f"unreadable metadata in {story_dir.name}")
 
                     # Find files
                     html_files = list(story_dir.glob("*.html"))
@@ -569,6 +688,29 @@ async def list_generated_stories(limit: int = 20) -> str:
                     logger.warning(f"Could not process story metadata: {e}")
                     continue
 
+        # Archived stories are older than anything still on disk
+        for archived in list_archived_stories()[:max(limit - len(stories), 0)]:
+            metadata, files = archived["header"], archived["files"]
+            html_files = sorted(name for name in files if name.endswith(".html"))
+            pdf_files = sorted(name for name in files if name.endswith(".pdf"))
+            stories.append({
+                "id": archived["id"],
+                "folder": archived["id"],
+                "original_prompt": metadata.get("original_prompt", "Unknown"),
+                "num_scenes": metadata.get("num_scenes", 0),
+                "character_name": metadata.get("character_name", ""),
+                "setting": metadata.get("setting", ""),
+                "style": metadata.get("style", "cartoon"),
+                "generated_at": metadata.get("generated_at", ""),
+                "image_count": sum(1 for name in files if name.startswith("scene_") and name.endswith(".png")),
+                "file_size_mb": round(sum(files.values()) / 1024 / 1024, 2),
+                "has_html": bool(html_files),
+                "has_pdf": bool(pdf_files),
+                "html_file": html_files[0] if html_files else None,
+                "pdf_file": pdf_files[0] if pdf_files else None,
+                "archived": True,
+            })
+
         total_scenes = sum(s.get("num_scenes", 0) for s in stories)
         total_size = sum(s.get("file_size_mb", 0) for s in stories)
 
@@ -599,26 +741,36 @@ async def get_story_details(story_id: str) -> str:
         JSON string with complete story details and metadata
     """
     try:
-        project_dir = Path(__file__).parent.parent
-        story_dir = project_dir / "generated_stories" / story_id
+        # Archived stories are read straight from their pack, without restoring
+        story_data = read_archived_metadata(story_id)
+        if story_data is not None:
+            files = archived_story_files(story_id)
+            story_data.update({
+                "output_directory": str(story_path(story_id)),
+                "archived": True,
+                "html_files": sorted(name for name in files if name.endswith(".html")),
+                "pdf_files": sorted(name for name in files if name.endswith(".pdf")),
+                "image_files": sorted(name for name in files if name.startswith("scene_") and name.endswith(".png")),
+                "total_files": len(files),
+                "file_size_mb": round(sum(files.values()) / 1024 / 1024, 2),
+            })
+            return json.dumps({"success": True, "story_data": story_data}, indent=2)
 
-        if not story_dir.exists():
+        story_dir = find_story_dir(story_id)
+
+        if story_dir is None:
             return json.dumps({
                 "success": False,
                 "error": f"Story {story_id} not found",
             })
 
-        metadata_file = story_dir / "story_metadata.json"
-        if not metadata_file.exists():
+        story_data = read_story_metadata(story_dir)
+        if story_data is None:
             return json.dumps({
                 "success": False,
                 "error": f"Story metadata not found for {story_id}",
             })
 
-        async with aiofiles.open(metadata_file, encoding="utf-8") as f:
-            content = await f.read()
-            story_data = json.loads(content)
-
         # Add file information
         html_files = list(story_dir.glob("*.html"))
         pdf_files = list(story_dir.glob("*.pdf"))
@@ -646,6 +798,153 @@ async def get_story_details(story_id: str) -> str:
         return json.dumps({"success": False, "error": error_msg})
 
 
+@mcp.tool()
+async def export_story(story_id: str, format: str = "pdf", ctx: Context | None = None) -> str:
+    """
+    Export a story to HTML, PDF, EPUB, CBZ or an image ZIP.
+
+    Exports are built on first request from the story metadata and cached, so
+    repeat exports of an unchanged story return immediately.
+
+    Args:
+        story_id: The ID of the story to export
+        format: Export format (html, pdf, epub, cbz, zip)
+
+    Returns:
+        JSON string with the path of the exported file
+    """
+    try:
+        if format not in EXPORT_FORMATS:
+            return json.dumps({
+                "success": False,
+                "error": f"Unsupported format: {format}",
+                "supported_formats": list(EXPORT_FORMATS),
+            })
+
+        story_dir = find_story_dir(story_id)
+        if story_dir is None:
+            return json.dumps({
+                "success": False,
+                "error": f"Story {story_id} not found",
+            })
+
+        if ctx:
+            await ctx.info(f"📦 Exporting story {story_id} as {format.upper()}...")
+
+        loop = asyncio.get_event_loop()
+        export_path = await loop.run_in_executor(None, get_export, story_dir, format)
+        if not export_path:
+            return json.dumps({
+                "success": False,
+                "error": f"Could not create {format.upper()} export for {story_id}",
+            })
+
+        return json.dumps({
+            "success": True,
+            "story_id": story_id,
+            "format": format,
+            "path": str(export_path),
+            "file_size_mb": round(export_path.stat().st_size / 1024 / 1024, 2),
+        }, indent=2)
+
+    except Exception as e:
+        error_msg = f"Failed to export story: {e!s}"
+        logger.error(error_msg, exc_info=True)
+        return json.dumps({"success": False, "error": error_msg})
+
+
+@mcp.tool()
+async def regenerate_scene(
+    story_id: str,
+    scene_number: int,
+    prompt_override: str = "",
+    ctx: Context | None = None,
+) -> str:
+    """
+    Regenerate the text and image of one scene, keeping the rest of the story.
+
+    Costs a single image request instead of regenerating the whole book. The
+    neighbouring scenes are sent as context so the new scene still fits.
+
+    Args:
+        story_id: The ID of the story
+        scene_number: Scene to regenerate (1-based)
+        prompt_override: Optional direction for the new scene
+
+    Returns:
+        JSON string with the updated scene
+    """
+    try:
+        loop = asyncio.get_event_loop()
+        # May restore the story from the archive or fetch it from storage
+        story_dir = await loop.run_in_executor(None, find_story_dir, story_id)
+        if story_dir is None:
+            return json.dumps({
+                "success": False,
+                "error": f"Story {story_id} not found",
+            })
+
+        if ctx:
+            await ctx.info(f"🔁 Regenerating scene {scene_number} of {story_id}...")
+
+        log_event = logging_subscriber(logger, logging.DEBUG)
+
+        def regenerate():
+            client = _setup_gemini_client()
+            return regenerate_story_scene(client, story_dir, scene_number, prompt_override or None, log_event)
+
+        story_data = await loop.run_in_executor(None, regenerate)
+        if not story_data:
+            return json.dumps({
+                "success": False,
+                "error": f"Scene {scene_number} could not be regenerated (check API quota and logs)",
+            })
+
+        scene = [s for s in story_data["scenes"] if s.get("scene_number") == scene_number]
+        return json.dumps({
+            "success": True,
+            "story_id": story_id,
+            "scene_number": scene_number,
+            "scene": scene,
+            "revision": story_data.get("scene_revisions", {}).get(str(scene_number), 1),
+        }, indent=2)
+
+    except (ValueError, FileNotFoundError) as e:
+        return json.dumps({"success": False, "error": str(e)})
+    except Exception as e:
+        error_msg = f"Failed to regenerate scene: {e!s}"
+        logger.error(error_msg, exc_info=True)
+        return json.dumps({"success": False, "error": error_msg})
+
+
+@mcp.tool()
+async def pin_story(story_id: str, pinned: bool = True) -> str:
+    """
+    Pin a story so retention never deletes it, or unpin it again.
+
+    Args:
+        story_id: The ID of the story
+        pinned: True to pin, False to unpin
+
+    Returns:
+        JSON string with the new pinned state
+    """
+    try:
+        loop = asyncio.get_event_loop()
+        header = await loop.run_in_executor(None, set_story_pinned, story_id, pinned)
+        if header is None:
+            return json.dumps({
+                "success": False,
+                "error": f"Story {story_id} not found",
+            })
+        return json.dumps({"success": True, "story_id": story_id, "pinned": pinned}, indent=2)
+
+    except Exception as e:
+        error_msg = f"Failed to update story: {e!s}"
+        logger.error(error_msg, exc_info=True)
+        return json.dumps({"success": False, "error": error_msg})
+
+
 @mcp.tool()
 async def display_story_as_artifact(story_id: str, ctx: Context | None = None) -> str:
     """
@@ -952,21 +1251,21 @@ def _artifact_footer(story_id: str, story_data: dict) -> str:
 @mcp.tool()
 async def get_generation_status(story_id: str) -> str:
     """
-    Check the status of an ongoing story generation.
+    Check the status of a story generation or submitted job.
+
+    Status is one of queued, initializing, generating, complete or error.
 
     Args:
-        story_id: The ID of the story being generated
+        story_id: The ID returned by generate_story, submit_story or submit_story_batch
 
     Returns:
         JSON string with current generation status
     """
-    if story_id in generation_status:
-        return json.dumps(generation_status[story_id], indent=2)
-    else:
-        return json.dumps({
-            "error": f"Generation {story_id} not found",
-            "available_ids": list(generation_status.keys()),
-        })
+    # Shared with the web UI, so jobs submitted there are found here too
+    status = get_job_store().get(story_id)
+    if status is None:
+        return json.dumps({"error": f"Generation {story_id} not found"})
+    return json.dumps(status, indent=2)
 
 
 @mcp.tool()
@@ -980,13 +1279,12 @@ async def test_gemini_connection() -> str:
     try:
         logger.info("Testing Gemini API connection...")
 
-        # Check if API key is configured
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key or api_key == "your_google_api_key_here":
+        # Check if API key is configured (the offline fake backend needs none)
+        if not is_api_configured():
             return json.dumps({
                 "success": False,
                 "error": "Google API key not configured properly",
-                "help": "Set GOOGLE_API_KEY environment variable or update .env file",
+                "help": "Set GOOGLE_API_KEY (or GOOGLE_API_KEYS for a key pool) in the environment or .env file",
                 "get_key_url": "https://aistudio.google.com/app/apikey",
             })
 
@@ -997,7 +1295,9 @@ async def test_gemini_connection() -> str:
             return json.dumps({
                 "success": True,
                 "message": "✅ Gemini API connection successful",
+                "backend": get_backend_name(),
                 "api_key_configured": True,
+                "api_keys": len(get_api_keys()),
                 "timestamp": datetime.now().isoformat(),
             })
         else:
@@ -1017,6 +1317,13 @@ async def test_gemini_connection() -> str:
         })
 
 
+# Resource exposing generation metrics
+@mcp.resource("metrics://picturebook")
+def get_metrics() -> str:
+    """Per-stage timings and counters in the Prometheus text format."""
+    return REGISTRY.render_prometheus()
+
+
 # Resource for providing story generation guidance
 @mcp.resource("guidance://enhanced-story-generation")
 def get_enhanced_story_guidance() -> str:
@@ -1095,7 +1402,15 @@ display_story_as_artifact(story_id="story_20250607_143022_123456")
 ### Export Formats
 - HTML with embedded images (auto-opens!)
 - PDF for easy sharing
+- EPUB for e-readers, CBZ for comic readers, ZIP of all images
 - JSON metadata for programmatic access
+- Exports are built on first request with `export_story(story_id, format)` and cached
+- Fix a single page with `regenerate_scene(story_id, scene_number, prompt_override)`;
+  only that scene is regenerated and exports are refreshed on their next request
+- For long books or many books, `submit_story` / `submit_story_batch` return job ids
+  at once; poll `get_generation_status(story_id)` until the status is complete
+- Old stories may be deleted by the host's retention policy; `pin_story(story_id)`
+  keeps a story forever
 
 ## ⏱️ Generation Times
 - **3 scenes**: ~18 seconds + auto-open
@@ -1114,12 +1429,14 @@ display_story_as_artifact(story_id="story_20250607_143022_123456")
 ## 📁 File Structure
 ```
 generated_stories/
-├── story_20250607_143022_123456/
-│   ├── scene_01.png
-│   ├── scene_02.png
-│   ├── story.html  ← Auto-opens in browser!
-│   ├── story.pdf
-│   └── story_metadata.json
+└── 2026-10-19/                        ← creation date bucket
+    └── a7/                            ← hash shard
+        └── story_01JAB3X6T3R2V8Y0Q9KZ4M5N7P/
+            ├── scene_01.png
+            ├── scene_02.png
+            ├── story.html  ← Auto-opens in browser!
+            ├── story.pdf
+            └── story_metadata.json
 ```
 
 ## 🎯 Best Practices
@@ -1365,6 +1682,8 @@ def main():
     """Main entry point for the enhanced MCP server."""
     try:
         logger.info("🚀 Starting Enhanced Gemini Picture Book Generator MCP Server...")
+        # stdin carries the MCP protocol; never read an API key from it
+        enable_server_mode()
         mcp.run()
     except KeyboardInterrupt:
         logger.info("Server interrupted by user")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Metrics for Gemini Picture Book Generator
+
+A small, dependency-free metrics registry with counters and histograms that
+renders the Prometheus text exposition format. The web UI serves it at
+/metrics and the MCP server as the metrics://picturebook resource.
+
+Generation stages are timed with time_stage() / @timed_stage():
+
+- queue_wait: job submitted until its worker starts
+- api_latency: one model request
+- image_save: decoding and saving one scene image
+- metadata_write: writing the metadata sidecar
+- html_render / pdf_render: building an export
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import functools
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: tuple[tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{value.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """Monotonically increasing counter, optionally split by labels."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: Any):
+        """Increase the counter."""
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        """Get the current value for a label set."""
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            return {_format_labels(key) or "total": value for key, value in self._values.items()}
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets."""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[LabelKey, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any):
+        """Record one observation."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"], strict=True):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, (('le', f'{bound:g}'),))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {
+                _format_labels(key) or "total": {
+                    "count": series["count"],
+                    "sum": round(series["sum"], 6),
+                    "avg": round(series["sum"] / series["count"], 6) if series["count"] else 0.0,
+                }
+                for key, series in self._series.items()
+            }
+
+
+class MetricsRegistry:
+    """Collection of named metrics."""
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        """Get or create a counter."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help_text)
+            return self._metrics[name]
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, buckets)
+            return self._metrics[name]
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict[str, Any]:
+        """Get a JSON-friendly summary of all metrics."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "picturebook_stage_seconds", "Wall time spent in each generation and export stage"
+)
+SCENES_TOTAL = REGISTRY.counter("picturebook_scenes_total", "Scene images generated")
+RETRIES_TOTAL = REGISTRY.counter("picturebook_retries_total", "Model requests retried")
+RATE_LIMITED_TOTAL = REGISTRY.counter("picturebook_rate_limited_total", "Model requests rejected with 429")
+API_ERRORS_TOTAL = REGISTRY.counter("picturebook_api_errors_total", "Model requests that failed")
+BYTES_WRITTEN_TOTAL = REGISTRY.counter("picturebook_bytes_written_total", "Bytes written to story directories")
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    """Time a block of code as one observation of a stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def timed_stage(stage: str):
+    """Decorator form of time_stage()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with time_stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Story Layout Migration for Gemini Picture Book Generator
+
+Moves stories from the old flat layout (generated_stories/story_*) into the
+sharded date/hash buckets used by the catalog (see catalog.py). Each story is
+moved with a single rename, so its files, modification times and cached
+exports are untouched, and the story keeps its ID: links and bookmarks keep
+resolving. The migration can be interrupted and rerun at any time.
+
+Stories modified in the last few minutes may still be generating and are left
+for a later run.
+
+Usage:
+    gemini-picturebook-migrate --dry-run
+    gemini-picturebook-migrate
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+from .catalog import STORY_ID_PREFIX, get_stories_dir, story_path
+
+# Directories changed more recently than this (seconds) are left alone
+DEFAULT_MIN_AGE = 600
+
+
+def migrate_story_layout(root: Path | None = None, dry_run: bool = False, min_age: float = DEFAULT_MIN_AGE) -> dict[str, int]:
+    """
+    Move every flat story directory into its bucket.
+
+    Args:
+        root: Stories directory (default: get_stories_dir())
+        dry_run: Only report what would be moved
+        min_age: Skip stories modified less than this many seconds ago
+
+    Returns:
+        Counts of moved, busy (recently modified), conflict and failed stories
+    """
+    root = Path(root) if root else get_stories_dir()
+    counts = {"moved": 0, "busy": 0, "conflict": 0, "failed": 0}
+    if not root.is_dir():
+        return counts
+
+    cutoff = time.time() - min_age
+    for story_dir in sorted(root.glob(f"{STORY_ID_PREFIX}*")):
+        if not story_dir.is_dir():
+            continue
+        try:
+            if story_dir.stat().st_mtime > cutoff:
+                counts["busy"] += 1
+                continue
+            target = story_path(story_dir.name, root)
+            if target.exists():
+                print(f"⚠️  {story_dir.name}: {target.relative_to(root)} already exists, left in place")
+                counts["conflict"] += 1
+                continue
+            if not dry_run:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.rename(story_dir, target)
+            counts["moved"] += 1
+        except (OSError, ValueError) as e:
+            print(f"❌ {story_dir.name}: {e}")
+            counts["failed"] += 1
+    return counts
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Command line entry point for gemini-picturebook-migrate."""
+    parser = argparse.ArgumentParser(
+        prog="gemini-picturebook-migrate",
+        description="Move stories from the flat story_* layout into date/hash buckets.",
+    )
+    parser.add_argument("--root", type=Path, help="Stories directory (default: OUTPUT_DIR or generated_stories)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be moved")
+    parser.add_argument("--min-age", type=float, default=DEFAULT_MIN_AGE,
+                        help="Skip stories modified less than this many seconds ago")
+    args = parser.parse_args(argv)
+
+    root = args.root or get_stories_dir()
+    print(f"📦 {'Checking' if args.dry_run else 'Migrating'} stories in {root}")
+    counts = migrate_story_layout(root, dry_run=args.dry_run, min_age=args.min_age)
+    verb = "would move" if args.dry_run else "moved"
+    print(f"✅ {verb} {counts['moved']}, skipped {counts['busy']} in use, "
+          f"{counts['conflict']} conflicts, {counts['failed']} failed")
+    return 0 if counts["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
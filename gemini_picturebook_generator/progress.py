@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Progress Events for Gemini Picture Book Generator
+
+Story generation reports its progress as structured events instead of printing.
+An event is a plain dictionary:
+
+    {"event": "scene_image", "message": "Scene 3 image saved: scene_03.png",
+     "progress": 0.72, "scene": 3, "total_scenes": 6, "timestamp": 1760870000.0, ...}
+
+"progress" is the fraction (0.0-1.0) of the generation that is done. Callers
+subscribe with any callable taking an event: console_subscriber() reproduces the
+classic emoji output for the command line, the web UI updates its job status,
+and ProgressQueue turns events from a worker thread into an async iterator for
+the MCP server.
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+from typing import Any
+
+ProgressCallback = Callable[[dict[str, Any]], None]
+
+# Event types, in the order a generation emits them
+EVENT_TYPES = (
+    "started",
+    "cache_hit",
+    "request_sent",
+    "retrying",
+    "response_received",
+    "scene_text",
+    "scene_image",
+    "scene_error",
+    "unknown_part",
+    "metadata_saved",
+    "completed",
+    "failed",
+)
+TERMINAL_EVENTS = ("completed", "failed")
+
+_CONSOLE_ICONS = {
+    "started": "🎨",
+    "cache_hit": "⚡",
+    "request_sent": "🔄",
+    "retrying": "🔁",
+    "response_received": "📦",
+    "scene_text": "📖",
+    "scene_image": "✅",
+    "scene_error": "❌",
+    "unknown_part": "⚠️ ",
+    "metadata_saved": "💾",
+    "completed": "✅",
+    "failed": "❌",
+}
+
+logger = logging.getLogger(__name__)
+
+
+def make_event(event: str, message: str, progress: float | None = None, **fields: Any) -> dict[str, Any]:
+    """
+    Build a progress event.
+
+    Args:
+        event: One of EVENT_TYPES
+        message: Human-readable status line
+        progress: Fraction of the generation completed, if known
+        **fields: Extra event fields (scene, total_scenes, filename, ...)
+
+    Returns:
+        Event dictionary
+    """
+    record = {"event": event, "message": message, "timestamp": time.time()}
+    if progress is not None:
+        record["progress"] = max(0.0, min(1.0, progress))
+    record.update(fields)
+    return record
+
+
+class ProgressEmitter:
+    """Fans progress events out to subscribers."""
+
+    def __init__(self, *subscribers: ProgressCallback | None):
+        self._subscribers = [s for s in subscribers if s is not None]
+
+    def subscribe(self, callback: ProgressCallback):
+        """Add a subscriber."""
+        self._subscribers.append(callback)
+
+    def emit(self, event: str, message: str, progress: float | None = None, **fields: Any) -> dict[str, Any]:
+        """
+        Build an event and deliver it to every subscriber.
+
+        A failing subscriber is logged and skipped; it never interrupts the
+        generation it is observing.
+
+        Returns:
+            The emitted event
+        """
+        record = make_event(event, message, progress, **fields)
+        for callback in self._subscribers:
+            try:
+                callback(record)
+            except Exception:
+                logger.exception("Progress subscriber failed for %s event", event)
+        return record
+
+
+def console_subscriber(event: dict[str, Any]):
+    """Print an event as a classic emoji status line."""
+    icon = _CONSOLE_ICONS.get(event["event"], "•")
+    print(f"{icon} {event['message']}")
+    if event["event"] == "started":
+        print(f"📊 Scenes to generate: {event.get('total_scenes')}")
+    elif event["event"] == "scene_text" and event.get("preview"):
+        print(f"   Preview: {event['preview']}")
+    elif event["event"] == "failed":
+        print(f"🔍 Error type: {event.get('error_type')}")
+        if event.get("hint"):
+            print(f"💡 {event['hint']}")
+
+
+def logging_subscriber(log: logging.Logger, level: int = logging.INFO) -> ProgressCallback:
+    """
+    Create a subscriber that writes events to a logger.
+
+    Args:
+        log: Logger to write to
+        level: Log level for non-error events
+
+    Returns:
+        Progress callback
+    """
+    def callback(event: dict[str, Any]):
+        event_level = logging.ERROR if event["event"] in ("failed", "scene_error") else level
+        log.log(event_level, event["message"])
+    return callback
+
+
+class ProgressQueue:
+    """
+    Progress callback that can be consumed as an async iterator.
+
+    Events may be emitted from any thread; iteration happens on the event loop
+    the queue was created on and stops after a terminal event or close().
+
+    Example:
+        events = ProgressQueue()
+        future = loop.run_in_executor(None, lambda: generate(..., progress_callback=events))
+        async for event in events:
+            ...
+    """
+
+    _CLOSED = object()
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None):
+        self._loop = loop or asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def __call__(self, event: dict[str, Any]):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+
+    def close(self):
+        """Stop iteration once queued events are consumed."""
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, self._CLOSED)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict[str, Any]:
+        item = await self._queue.get()
+        if item is self._CLOSED:
+            raise StopAsyncIteration
+        if item["event"] in TERMINAL_EVENTS:
+            # Deliver the terminal event, then end on the next call
+            self._queue.put_nowait(self._CLOSED)
+        return item
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Request Rate Limiting for Gemini Picture Book Generator
+
+Every model request takes a token from a shared token bucket before it is sent,
+so concurrent generations (web UI jobs, MCP calls, batch runs) together stay
+under the API's per-minute quota instead of each pacing itself. When the API
+answers 429 with a Retry-After hint, the bucket is paused for everyone, so
+retries do not stampede a quota that is already exhausted.
+
+Settings (environment variables):
+
+- GEMINI_RPM: requests per minute for the shared bucket (default 10, 0 = unlimited)
+- GEMINI_BURST: requests that may be sent back-to-back (default 1)
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import os
+import threading
+import time
+
+from .metrics import time_stage
+
+DEFAULT_RPM = 10.0
+DEFAULT_BURST = 1
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a token could not be acquired within the timeout."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket with a shared pause for 429 back-off."""
+
+    def __init__(self, rate_per_minute: float, burst: int = DEFAULT_BURST):
+        """
+        Args:
+            rate_per_minute: Sustained requests per minute (0 or less = unlimited)
+            burst: Maximum tokens that can accumulate
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if one is available.
+
+        Returns:
+            0.0 if a token was taken, otherwise seconds until one may be
+        """
+        if self.unlimited and self._paused_until <= time.monotonic():
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.unlimited:
+                return 0.0
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout: float | None = None):
+        """
+        Block until a token is available.
+
+        Args:
+            timeout: Maximum seconds to wait (None = wait as long as needed)
+
+        Raises:
+            RateLimitTimeout: If no token became available in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with time_stage("rate_limit_wait"):
+            while True:
+                wait = self.try_acquire()
+                if wait <= 0:
+                    return
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise RateLimitTimeout(f"No request slot available within {timeout}s")
+                    wait = min(wait, remaining)
+                time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold back all requests for the given number of seconds (e.g. Retry-After)."""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            # Allow a single request when the pause ends, then refill normally
+            self._tokens = 1.0
+            self._updated = self._paused_until
+
+    def available(self) -> float:
+        """Tokens currently available (for load balancing and status)."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return 0.0
+            if self.unlimited:
+                return float(self.capacity)
+            self._refill(now)
+            return self._tokens
+
+
+_shared_limiter: TokenBucket | None = None
+_shared_limiter_guard = threading.Lock()
+
+
+def get_shared_limiter() -> TokenBucket:
+    """Get the process-wide request limiter configured from the environment."""
+    global _shared_limiter
+    with _shared_limiter_guard:
+        if _shared_limiter is None:
+            _shared_limiter = TokenBucket(
+                float(os.getenv("GEMINI_RPM", DEFAULT_RPM)),
+                int(os.getenv("GEMINI_BURST", DEFAULT_BURST)),
+            )
+        return _shared_limiter
+
+
+def reset_shared_limiter():
+    """Drop the shared limiter so it is rebuilt from the current environment."""
+    global _shared_limiter
+    with _shared_limiter_guard:
+        _shared_limiter = None
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Incremental PDF Rendering for Gemini Picture Book Generator
+
+Laying out a whole book with WeasyPrint takes time roughly proportional to its
+length, and every edit used to pay for the entire book again. Because every
+scene starts on a new page, a book can instead be laid out one section at a
+time (the title pages, each scene, any additional content) and the pages
+joined afterwards. The laid-out pages of each section are kept in memory,
+keyed by a hash of the section's HTML, the stylesheets and the size and
+modification time of the images it shows. After a single-scene edit or
+regeneration only that scene is laid out again; every other section's pages
+are reused and the book is reassembled in one pass.
+
+The cache lives in the process, so the first PDF after a restart is a full
+render. Settings (environment variables):
+
+- PDF_PAGE_CACHE_PAGES: laid-out pages kept in memory (default 2000, 0 = off)
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from .enhanced_story_generator import (
+    HTML_TAIL,
+    PDF_STYLESHEET,
+    STORY_STYLESHEET,
+    load_weasyprint,
+    story_html_filename,
+    story_html_head,
+    story_html_sections,
+)
+from .metrics import REGISTRY, timed_stage
+from .story_metadata import atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PAGES = 2000
+
+SECTION_CACHE_TOTAL = REGISTRY.counter("picturebook_pdf_section_cache_total", "PDF section layouts by cache result")
+
+_documents: OrderedDict[str, Any] = OrderedDict()
+_cached_pages = 0
+_cache_lock = threading.Lock()
+_font_config = None
+
+
+def _get_font_config():
+    # One font configuration for every section, kept alive as long as the
+    # cached pages that reference its fonts
+    global _font_config
+    with _cache_lock:
+        if _font_config is None:
+            try:
+                from weasyprint.text.fonts import FontConfiguration
+            except ImportError:
+                from weasyprint.fonts import FontConfiguration
+            _font_config = FontConfiguration()
+        return _font_config
+
+
+def _group_sections(story_data: dict[str, Any]) -> list[tuple[str, tuple[str, ...]]]:
+    """Group the HTML sections into units that each start on a new page."""
+    units: list[tuple[str, tuple[str, ...]]] = []
+    for kind, fragment, images in story_html_sections(story_data):
+        if kind == "footer" and units:
+            # The closing note flows on the last page rather than a page of its own
+            body, unit_images = units[-1]
+            units[-1] = (body + fragment, unit_images)
+        else:
+            units.append((fragment, tuple(images)))
+    return units
+
+
+def _section_key(head: str, body: str, images: tuple[str, ...], story_dir: Path) -> str:
+    digest = hashlib.sha256()
+    for part in (PDF_STYLESHEET, STORY_STYLESHEET, head, body, str(story_dir)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x1f")
+    for filename in images:
+        try:
+            stat = (story_dir / filename).stat()
+            digest.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        except OSError:
+            digest.update(f"{filename}:missing;".encode())
+    return digest.hexdigest()
+
+
+def _get_cached(key: str) -> Any:
+    with _cache_lock:
+        document = _documents.get(key)
+        if document is not None:
+            _documents.move_to_end(key)
+        return document
+
+
+def _put_cached(key: str, document: Any):
+    global _cached_pages
+    max_pages = int(os.getenv("PDF_PAGE_CACHE_PAGES", DEFAULT_MAX_PAGES))
+    if max_pages <= 0:
+        return
+    with _cache_lock:
+        if key in _documents:
+            return
+        _documents[key] = document
+        _cached_pages += len(document.pages)
+        while _cached_pages > max_pages and len(_documents) > 1:
+            _, evicted = _documents.popitem(last=False)
+            _cached_pages -= len(evicted.pages)
+
+
+def clear_page_cache():
+    """Drop every cached section layout."""
+    global _cached_pages
+    with _cache_lock:
+        _documents.clear()
+        _cached_pages = 0
+
+
+def _layout_section(head: str, body: str, images: tuple[str, ...], story_dir: Path, stylesheet: Any) -> Any:
+    """Get the laid-out pages of one section, from the cache when unchanged."""
+    key = _section_key(head, body, images, story_dir)
+    document = _get_cached(key)
+    if document is not None:
+        SECTION_CACHE_TOTAL.inc(result="hit")
+        return document
+
+    SECTION_CACHE_TOTAL.inc(result="miss")
+    font_config = _get_font_config()
+    document = load_weasyprint().HTML(string=head + body + HTML_TAIL, base_url=str(story_dir)).render(
+        stylesheets=[stylesheet], font_config=font_config
+    )
+    _put_cached(key, document)
+    return document
+
+
+@timed_stage("pdf_render")
+def render_story_pdf(story_data: dict[str, Any], story_dir: Path) -> str | None:
+    """
+    Render a story's PDF, laying out only the sections that changed.
+
+    Args:
+        story_data: Story data with text and images
+        story_dir: Story directory holding the scene images
+
+    Returns:
+        Path to the PDF, or None if WeasyPrint is unavailable or rendering failed
+    """
+    weasyprint = load_weasyprint()
+    if weasyprint is None:
+        # Logged, not printed: the MCP server's stdout carries the stdio protocol
+        logger.warning("WeasyPrint not available, PDF generation skipped (install with: uv pip install weasyprint)")
+        return None
+
+    story_dir = Path(story_dir)
+    pdf_path = story_dir / (Path(story_html_filename(story_data)).stem + ".pdf")
+    try:
+        head = story_html_head(story_data)
+        stylesheet = weasyprint.CSS(string=PDF_STYLESHEET, font_config=_get_font_config())
+        documents = [
+            _layout_section(head, body, images, story_dir, stylesheet)
+            for body, images in _group_sections(story_data)
+        ]
+        pages = [page for document in documents for page in document.pages]
+        # The first section carries the title used for the PDF metadata
+        atomic_write_bytes(pdf_path, documents[0].copy(pages).write_pdf(), "none")
+    except Exception as e:
+        logger.error(f"PDF generation failed: {e}")
+        return None
+    return str(pdf_path)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Response Cache for Gemini Picture Book Generator
+
+Opt-in, content-addressed cache of generated story packages. Identical requests
+(same normalized prompt, scene count, style and model) are answered from the
+cache in milliseconds instead of spending image-generation quota. Each entry
+holds the scene images plus the story data they belong to; a hit links or
+copies the images into the new story directory.
+
+Settings (environment variables):
+
+- RESPONSE_CACHE: "true" to enable the cache (default off)
+- RESPONSE_CACHE_DIR: cache location (default: <stories dir>/.response_cache)
+- RESPONSE_CACHE_TTL: seconds an entry stays valid (default 86400)
+- RESPONSE_CACHE_MAX_MB: total size before least recently used entries are
+  evicted (default 500)
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import copy
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from .catalog import get_stories_dir
+from .metrics import REGISTRY
+from .story_metadata import atomic_write_bytes
+
+ENTRY_FILENAME = "entry.json"
+DEFAULT_TTL = 86400
+DEFAULT_MAX_MB = 500
+
+CACHE_LOOKUPS_TOTAL = REGISTRY.counter("picturebook_response_cache_total", "Response cache lookups by result")
+
+_evict_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    """Check whether the response cache is switched on."""
+    return os.getenv("RESPONSE_CACHE", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_cache_dir() -> Path:
+    """Get the directory holding cache entries."""
+    configured = os.getenv("RESPONSE_CACHE_DIR")
+    return Path(configured) if configured else get_stories_dir() / ".response_cache"
+
+
+def _normalize(text: str) -> str:
+    return " ".join(str(text or "").split()).casefold()
+
+
+def make_cache_key(prompt: str, num_scenes: int, style: str | None, model: str) -> str:
+    """
+    Build the content address of a request.
+
+    Args:
+        prompt: Story prompt as sent to the generator
+        num_scenes: Number of scenes requested
+        style: Art style, if any
+        model: Model name
+
+    Returns:
+        Hex digest identifying the request
+    """
+    material = "\x1f".join((_normalize(prompt), str(num_scenes), _normalize(style or ""), model))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _read_entry(path: Path) -> dict[str, Any] | None:
+    try:
+        entry = json.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+def _entry_size(entry_dir: Path) -> int:
+    return sum(path.stat().st_size for path in entry_dir.iterdir() if path.is_file())
+
+
+def lookup(key: str, output_dir: Path) -> dict[str, Any] | None:
+    """
+    Restore a cached story package into a new story directory.
+
+    Args:
+        key: Cache key from make_cache_key()
+        output_dir: Story directory to populate with the scene images
+
+    Returns:
+        Story data (with fresh scene paths), or None on a miss
+    """
+    entry_dir = get_cache_dir() / key
+    entry = _read_entry(entry_dir / ENTRY_FILENAME)
+    if entry is None:
+        CACHE_LOOKUPS_TOTAL.inc(result="miss")
+        return None
+
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL", DEFAULT_TTL))
+    if time.time() - entry.get("stored_at", 0) > ttl:
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        CACHE_LOOKUPS_TOTAL.inc(result="expired")
+        return None
+
+    story_data = entry["story_data"]
+    output_dir = Path(output_dir)
+    try:
+        for scene in story_data.get("scenes", []):
+            if scene.get("type") != "image":
+                continue
+            source = entry_dir / scene["filename"]
+            target = output_dir / scene["filename"]
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copy2(source, target)
+            scene["path"] = str(target)
+    except (OSError, KeyError):
+        # Damaged entry: drop it and generate normally
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        CACHE_LOOKUPS_TOTAL.inc(result="miss")
+        return None
+
+    # The entry's modification time doubles as its last-used time for LRU
+    os.utime(entry_dir / ENTRY_FILENAME)
+    CACHE_LOOKUPS_TOTAL.inc(result="hit")
+    story_data["generated_at"] = datetime.now().isoformat()
+    story_data["cached_from"] = entry.get("stored_at")
+    return story_data
+
+
+def store(key: str, story_data: dict[str, Any], story_dir: Path):
+    """
+    Add a generated story package to the cache.
+
+    Args:
+        key: Cache key from make_cache_key()
+        story_data: Story data as returned by the generator
+        story_dir: Directory holding the story's scene images
+    """
+    cache_dir = get_cache_dir()
+    entry_dir = cache_dir / key
+    tmp_dir = cache_dir / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        scenes = copy.deepcopy(story_data.get("scenes", []))
+        for scene in scenes:
+            scene.pop("path", None)
+            if scene.get("type") == "image":
+                source = Path(story_dir) / scene["filename"]
+                try:
+                    os.link(source, tmp_dir / scene["filename"])
+                except OSError:
+                    shutil.copy2(source, tmp_dir / scene["filename"])
+        entry = {
+            "key": key,
+            "stored_at": time.time(),
+            "story_data": {**story_data, "scenes": scenes},
+        }
+        atomic_write_bytes(tmp_dir / ENTRY_FILENAME, json.dumps(entry).encode("utf-8"), "none")
+        if entry_dir.exists():
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        tmp_dir.rename(entry_dir)
+    except OSError:
+        # Caching is best effort; a failed store never fails a generation
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+    evict()
+
+
+def evict(max_bytes: int | None = None) -> int:
+    """
+    Remove expired entries and least recently used ones beyond the size cap.
+
+    Args:
+        max_bytes: Size cap (default: RESPONSE_CACHE_MAX_MB)
+
+    Returns:
+        Number of entries removed
+    """
+    if max_bytes is None:
+        max_bytes = int(float(os.getenv("RESPONSE_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL", DEFAULT_TTL))
+    cache_dir = get_cache_dir()
+    if not cache_dir.is_dir():
+        return 0
+
+    with _evict_lock:
+        now = time.time()
+        entries = []
+        removed = 0
+        for entry_dir in cache_dir.iterdir():
+            marker = entry_dir / ENTRY_FILENAME
+            if entry_dir.name.startswith(".") or not marker.exists():
+                continue
+            last_used = marker.stat().st_mtime
+            entry = _read_entry(marker)
+            if entry is None or now - entry.get("stored_at", 0) > ttl:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                removed += 1
+                continue
+            entries.append((last_used, _entry_size(entry_dir), entry_dir))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries, key=lambda item: item[0]):
+            if total <= max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
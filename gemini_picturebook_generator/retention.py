@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Retention and Garbage Collection for Gemini Picture Book Generator
+
+Keeps the stories directory, the job store and the in-process lock tables
+bounded on long-running hosts. Each garbage collection pass:
+
+- removes orphaned story directories: generations that failed or were killed
+  before writing their metadata, once untouched for RETENTION_ORPHAN_HOURS
+  and no longer running
+- removes stale derived files: cached exports built from an older version of
+  a story, legacy *_print.html duplicates and leftover temporary files
+- enforces the retention policy, oldest stories first, never touching pinned
+  stories (see set_story_pinned() and the pin_story MCP tool)
+- compacts the job store and the response cache, and forgets the metadata
+  and export locks of stories that no longer exist
+
+Retention settings (0 = unlimited, the default):
+
+- RETENTION_MAX_AGE_DAYS: delete stories older than this many days
+- RETENTION_MAX_STORIES: keep at most this many unpinned stories
+- RETENTION_MAX_MB: keep the stories directory below this size; pinned
+  stories count towards it but are never deleted
+
+With a remote storage backend (see storage.py), stories past the maximum age
+are deleted from the backend too, while the count and size limits only evict
+this node's working copy: the story is fetched again when next requested.
+Archived stories (see archive.py) are subject to the same limits, after the
+stories on disk, and count with the space they take in their pack. Dead space
+in packs counts towards RETENTION_MAX_MB too: the space of a deleted archived
+story is only freed when its pack is compacted, at the end of the pass.
+
+The web UI and MCP server run a pass every RETENTION_GC_INTERVAL seconds
+(default 3600, 0 disables it) in a background thread; a lock file makes sure
+only one process per stories directory collects at a time. Run
+`gemini-picturebook-gc` to collect by hand or from cron.
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager, suppress
+from pathlib import Path
+
+from . import response_cache
+from .archive import (
+    compact_packs,
+    delete_archived_story,
+    list_archived_stories,
+    pack_usage,
+)
+from .catalog import (
+    find_story_dir,
+    get_stories_dir,
+    is_bucket_name,
+    iter_story_dirs,
+    story_created_at,
+    story_last_modified,
+    story_path,
+)
+from .exports import forget_build_locks, prune_stale_exports
+from .job_store import TERMINAL_STATUSES, JobStore, get_job_store
+from .metrics import REGISTRY
+from .storage import get_storage, try_publish_story, unpublish_story
+from .story_metadata import (
+    METADATA_FILENAME,
+    forget_story_locks,
+    get_story_lock,
+    is_story_locked,
+)
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    fcntl = None
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Marker file of a pinned story. Kept out of the metadata header, whose
+# modification time feeds the export fingerprint: pinning must not make a
+# story's cached exports stale
+PIN_FILENAME = "pinned"
+GC_LOCK_FILENAME = ".gc.lock"
+
+DEFAULT_GC_INTERVAL = 3600
+DEFAULT_ORPHAN_HOURS = 24
+
+# Delay before the first background pass, so it does not compete with startup
+GC_STARTUP_DELAY = 60
+
+GC_REMOVED_TOTAL = REGISTRY.counter("picturebook_gc_removed_total", "Stories and files removed by garbage collection")
+GC_BYTES_FREED_TOTAL = REGISTRY.counter("picturebook_gc_bytes_freed_total", "Bytes freed by garbage collection")
+
+
+class RetentionPolicy:
+    """Limits enforced by garbage collection (0 means unlimited)."""
+
+    def __init__(
+        self,
+        max_age_days: float = 0,
+        max_stories: int = 0,
+        max_bytes: int = 0,
+        orphan_hours: float = DEFAULT_ORPHAN_HOURS,
+    ):
+        """
+        Args:
+            max_age_days: Delete stories older than this
+            max_stories: Keep at most this many unpinned stories
+            max_bytes: Keep the stories directory below this size
+            orphan_hours: Remove incomplete story directories untouched this long
+        """
+        self.max_age_days = max_age_days
+        self.max_stories = max_stories
+        self.max_bytes = max_bytes
+        self.orphan_hours = orphan_hours
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        """Create the policy configured by the RETENTION_* variables."""
+        return cls(
+            max_age_days=float(os.getenv("RETENTION_MAX_AGE_DAYS", "0")),
+            max_stories=int(os.getenv("RETENTION_MAX_STORIES", "0")),
+            max_bytes=int(float(os.getenv("RETENTION_MAX_MB", "0")) * 1024 * 1024),
+            orphan_hours=float(os.getenv("RETENTION_ORPHAN_HOURS", str(DEFAULT_ORPHAN_HOURS))),
+        )
+
+
+def _story_size(story_dir: Path) -> int:
+    total = 0
+    for path in story_dir.rglob("*"):
+        try:
+            if path.is_file():
+                total += path.stat().st_size
+        except OSError:
+            continue
+    return total
+
+
+def _created_timestamp(story_dir: Path) -> float:
+    created = story_created_at(story_dir.name)
+    if created is not None:
+        return created.timestamp()
+    return story_dir.stat().st_mtime
+
+
+def _is_running(story_id: str, job_store: JobStore) -> bool:
+    # get() reports jobs of exited workers as failed, so crashed jobs are not protected
+    status = job_store.get(story_id)
+    return status is not None and status.get("status") not in TERMINAL_STATUSES
+
+
+def is_story_pinned(story_dir: Path) -> bool:
+    """Check whether a story is pinned."""
+    return (story_dir / PIN_FILENAME).exists()
+
+
+def set_story_pinned(story_id: str, pinned: bool = True) -> Path | None:
+    """
+    Pin a story, so retention never deletes it, or unpin it.
+
+    Args:
+        story_id: Story ID
+        pinned: New pinned state
+
+    Returns:
+        The story directory, or None if the story was not found
+    """
+    story_dir = find_story_dir(story_id)
+    if story_dir is None:
+        return None
+    marker = story_dir / PIN_FILENAME
+    with get_story_lock(story_dir):
+        if pinned:
+            marker.touch()
+        else:
+            marker.unlink(missing_ok=True)
+    if pinned:
+        try_publish_story(story_dir, [marker])
+    else:
+        try:
+            unpublish_story(story_dir, [marker])
+        except Exception as e:
+            logger.error(f"Failed to unpin {story_dir.name} in storage: {e}")
+    return story_dir
+
+
+def delete_story(story_dir: Path, remote: bool = True) -> int:
+    """
+    Delete a story from this node, and its job record.
+
+    Args:
+        story_dir: Story directory
+        remote: Also delete it from a remote storage backend
+
+    Returns:
+        Bytes freed on this node
+    """
+    size = _story_size(story_dir)
+    shutil.rmtree(story_dir, ignore_errors=True)
+    if remote:
+        try:
+            unpublish_story(story_dir)
+        except Exception as e:
+            logger.error(f"Failed to delete {story_dir.name} from storage: {e}")
+    get_job_store().delete(story_dir.name)
+    forget_story_locks([story_dir])
+    forget_build_locks([story_dir])
+    return size
+
+
+def _stale_files(story_dir: Path, cutoff: float, dry_run: bool) -> tuple[int, int]:
+    """Remove stale derived files from a complete story; returns (files, bytes)."""
+    # Print copies of the HTML export written by older versions
+    leftovers = list(story_dir.glob("*_print.html"))
+    # Temporary files of writes that were interrupted
+    leftovers += [p for p in story_dir.glob("*.tmp") if p.stat().st_mtime < cutoff]
+    candidates = prune_stale_exports(story_dir, dry_run=True) + leftovers
+    sizes = {path: path.stat().st_size for path in candidates}
+    if candidates and not dry_run:
+        # The prune is skipped while an export of the story is being built
+        candidates = prune_stale_exports(story_dir) + leftovers
+        for path in leftovers:
+            path.unlink(missing_ok=True)
+        try:
+            unpublish_story(story_dir, candidates)
+        except Exception as e:
+            logger.error(f"Failed to delete stale files of {story_dir.name} from storage: {e}")
+    return len(candidates), sum(sizes.get(path, 0) for path in candidates)
+
+
+def _prune_empty_buckets(root: Path, cutoff: float):
+    """Remove emptied bucket directories and abandoned fetch staging directories."""
+    for date_bucket in [p for p in root.iterdir() if p.is_dir() and is_bucket_name(p.name)]:
+        for shard in [p for p in date_bucket.iterdir() if p.is_dir()]:
+            for staging in shard.glob(".*"):
+                if staging.is_dir() and staging.stat().st_mtime < cutoff:
+                    shutil.rmtree(staging, ignore_errors=True)
+            with suppress(OSError):
+                shard.rmdir()
+        with suppress(OSError):
+            date_bucket.rmdir()
+
+
+@contextmanager
+def _gc_lock(root: Path) -> Iterator[bool]:
+    """Hold the collection lock of a stories directory; yields False if another process has it."""
+    if not FCNTL_AVAILABLE:
+        yield True
+        return
+    root.mkdir(parents=True, exist_ok=True)
+    with open(root / GC_LOCK_FILENAME, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def collect_garbage(policy: RetentionPolicy | None = None, dry_run: bool = False) -> dict[str, int] | None:
+    """
+    Run one garbage collection pass over the stories directory.
+
+    Args:
+        policy: Retention limits (default: RetentionPolicy.from_env())
+        dry_run: Only count what would be removed
+
+    Returns:
+        Counts of expired, evicted and orphaned stories, stale files, pruned
+        jobs and cache entries, compacted archive packs and bytes_freed; None
+        if another process is collecting right now
+    """
+    policy = policy or RetentionPolicy.from_env()
+    root = get_stories_dir()
+    counts = {
+        "expired": 0, "evicted": 0, "orphans": 0, "files": 0, "jobs": 0, "cache_entries": 0,
+        "packs_compacted": 0, "bytes_freed": 0,
+    }
+    if not root.is_dir():
+        return counts
+
+    with _gc_lock(root) as acquired:
+        if not acquired:
+            return None
+
+        now = time.time()
+        orphan_cutoff = now - policy.orphan_hours * 3600
+        age_cutoff = now - policy.max_age_days * 86400 if policy.max_age_days > 0 else None
+        remote = get_storage().remote
+        job_store = get_job_store()
+
+        def remove(story_dir: Path, kind: str, from_storage: bool, size: int, archived: bool = False):
+            if not dry_run:
+                if archived:
+                    delete_archived_story(story_dir.name)
+                    if from_storage:
+                        unpublish_story(story_dir)
+                    job_store.delete(story_dir.name)
+                else:
+                    delete_story(story_dir, remote=from_storage)
+            counts[kind] += 1
+            # Freed archive space is measured on the packs below
+            if not archived:
+                counts["bytes_freed"] += size
+
+        # Complete, unpinned stories, newest first, with their sizes
+        candidates = []
+        pinned_bytes = 0
+        for story_dir in list(iter_story_dirs(newest_first=True)):
+            try:
+                if is_story_locked(story_dir) or _is_running(story_dir.name, job_store):
+                    continue
+                if not (story_dir / METADATA_FILENAME).exists():
+                    if story_last_modified(story_dir) < orphan_cutoff:
+                        remove(story_dir, "orphans", False, _story_size(story_dir))
+                    continue
+
+                files, stale_bytes = _stale_files(story_dir, orphan_cutoff, dry_run)
+                counts["files"] += files
+                counts["bytes_freed"] += stale_bytes
+                # In a dry run the stale files are still there
+                size = _story_size(story_dir) - (stale_bytes if dry_run else 0)
+
+                if is_story_pinned(story_dir):
+                    pinned_bytes += size
+                elif age_cutoff is not None and _created_timestamp(story_dir) < age_cutoff:
+                    remove(story_dir, "expired", True, size)
+                else:
+                    candidates.append((story_dir, size, False))
+            except OSError as e:
+                logger.warning(f"Skipping {story_dir.name} during garbage collection: {e}")
+
+        # Archived stories are older than any on disk. Space not yet
+        # reclaimed by compaction counts towards the quota as well
+        usage = pack_usage()
+        dead_pack_bytes = usage["pack_bytes"] - usage["live_bytes"]
+        for archived in list_archived_stories():
+            story_dir, size = story_path(archived["id"], root), archived["packed_bytes"]
+            created = story_created_at(archived["id"])
+            created_ts = created.timestamp() if created else archived["last_modified"]
+            if PIN_FILENAME in archived["files"]:
+                pinned_bytes += size
+            elif age_cutoff is not None and created_ts < age_cutoff:
+                remove(story_dir, "expired", True, size, archived=True)
+            else:
+                candidates.append((story_dir, size, True))
+
+        # Pinned stories and dead pack space use their share of the quota first
+        kept_bytes = pinned_bytes + dead_pack_bytes
+        for kept_stories, (story_dir, size, archived) in enumerate(candidates):
+            over_count = policy.max_stories > 0 and kept_stories >= policy.max_stories
+            over_quota = policy.max_bytes > 0 and kept_bytes + size > policy.max_bytes
+            if over_count or over_quota:
+                # A remote backend keeps the story; only this node's copy goes
+                remove(story_dir, "evicted", not remote, size, archived)
+            else:
+                kept_bytes += size
+
+        compacted = compact_packs(dry_run=dry_run)
+        counts["packs_compacted"] = compacted["packs"]
+        if dry_run:
+            counts["bytes_freed"] += compacted["bytes_freed"]
+        else:
+            # Packs emptied by deletions are removed right away, the rest by compaction
+            counts["bytes_freed"] += max(usage["pack_bytes"] - pack_usage()["pack_bytes"], 0)
+
+        if not dry_run:
+            _prune_empty_buckets(root, orphan_cutoff)
+            counts["jobs"] = job_store.prune()
+            counts["cache_entries"] = response_cache.evict()
+            forget_story_locks()
+            forget_build_locks()
+
+    removed = counts["expired"] + counts["evicted"] + counts["orphans"] + counts["files"]
+    if not dry_run:
+        GC_REMOVED_TOTAL.inc(removed)
+        GC_BYTES_FREED_TOTAL.inc(counts["bytes_freed"])
+    if removed:
+        logger.info(f"Garbage collection {'would free' if dry_run else 'freed'} {counts['bytes_freed']} bytes: {counts}")
+    return counts
+
+
+_gc_thread: threading.Thread | None = None
+_gc_stop = threading.Event()
+_gc_guard = threading.Lock()
+
+
+def _gc_loop(interval: float):
+    delay = min(interval, GC_STARTUP_DELAY)
+    while not _gc_stop.wait(delay):
+        try:
+            collect_garbage()
+        except Exception as e:
+            logger.error(f"Garbage collection failed: {e}", exc_info=True)
+        delay = interval
+
+
+def start_background_gc(interval: float | None = None) -> bool:
+    """
+    Start the background garbage collector of this process (once).
+
+    Args:
+        interval: Seconds between passes (default: RETENTION_GC_INTERVAL)
+
+    Returns:
+        True if the collector is running
+    """
+    global _gc_thread
+    if interval is None:
+        interval = float(os.getenv("RETENTION_GC_INTERVAL", DEFAULT_GC_INTERVAL))
+    if interval <= 0:
+        return False
+    with _gc_guard:
+        if _gc_thread is None or not _gc_thread.is_alive():
+            _gc_stop.clear()
+            _gc_thread = threading.Thread(target=_gc_loop, args=(interval,), name="picturebook-gc", daemon=True)
+            _gc_thread.start()
+    return True
+
+
+def stop_background_gc():
+    """Stop the background garbage collector (a running pass finishes first)."""
+    _gc_stop.set()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Command line entry point for gemini-picturebook-gc."""
+    parser = argparse.ArgumentParser(
+        prog="gemini-picturebook-gc",
+        description="Apply the retention policy and remove orphaned and stale story files.",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    parser.add_argument("--max-age-days", type=float, help="Override RETENTION_MAX_AGE_DAYS")
+    parser.add_argument("--max-stories", type=int, help="Override RETENTION_MAX_STORIES")
+    parser.add_argument("--max-mb", type=float, help="Override RETENTION_MAX_MB")
+    parser.add_argument("--orphan-hours", type=float, help="Override RETENTION_ORPHAN_HOURS")
+    parser.add_argument("--pin", metavar="STORY_ID", action="append", default=[], help="Pin a story (repeatable)")
+    parser.add_argument("--unpin", metavar="STORY_ID", action="append", default=[], help="Unpin a story (repeatable)")
+    args = parser.parse_args(argv)
+
+    for story_id, pinned in [*((s, True) for s in args.pin), *((s, False) for s in args.unpin)]:
+        if set_story_pinned(story_id, pinned) is None:
+            print(f"❌ Story {story_id} not found")
+            return 1
+        print(f"{'📌 Pinned' if pinned else '📍 Unpinned'} {story_id}")
+    if args.pin or args.unpin:
+        return 0
+
+    policy = RetentionPolicy.from_env()
+    if args.max_age_days is not None:
+        policy.max_age_days = args.max_age_days
+    if args.max_stories is not None:
+        policy.max_stories = args.max_stories
+    if args.max_mb is not None:
+        policy.max_bytes = int(args.max_mb * 1024 * 1024)
+    if args.orphan_hours is not None:
+        policy.orphan_hours = args.orphan_hours
+
+    print(f"🧹 {'Checking' if args.dry_run else 'Collecting'} {get_stories_dir()}")
+    counts = collect_garbage(policy, dry_run=args.dry_run)
+    if counts is None:
+        print("⏳ Another process is collecting garbage right now; try again later")
+        return 1
+    verb = "would remove" if args.dry_run else "removed"
+    print(f"✅ {verb} {counts['expired']} expired, {counts['evicted']} over-limit and "
+          f"{counts['orphans']} orphaned stories, {counts['files']} stale files "
+          f"and {counts['packs_compacted']} archive packs ({counts['bytes_freed'] / 1024 / 1024:.1f} MB)")
+    if not args.dry_run:
+        print(f"🗂️  pruned {counts['jobs']} job records and {counts['cache_entries']} cache entries")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Retry Policy for Gemini Picture Book Generator
+
+Model calls are retried on rate limiting (429) and transient server errors
+(500/502/503/504, timeouts, dropped connections) with exponential backoff and
+full jitter. A Retry-After hint from the API takes precedence over the computed
+delay and also pauses the shared rate limiter, so other requests wait too.
+
+Retries are bounded twice: per call (GEMINI_MAX_RETRIES) and process-wide by a
+retry budget that only refills as requests succeed, so a persistent outage
+fails fast instead of multiplying load.
+
+Settings (environment variables):
+
+- GEMINI_MAX_RETRIES: retries per call (default 5)
+- GEMINI_RETRY_BASE_DELAY: first backoff in seconds (default 2)
+- GEMINI_RETRY_MAX_DELAY: backoff ceiling in seconds (default 60)
+- GEMINI_RETRY_BUDGET: retries earned per successful request (default 0.2)
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import os
+import random
+import re
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+from .metrics import API_ERRORS_TOTAL, RATE_LIMITED_TOTAL, RETRIES_TOTAL
+
+RATE_LIMITED = "rate_limited"
+TRANSIENT = "transient"
+FATAL = "fatal"
+
+TRANSIENT_CODES = (408, 500, 502, 503, 504)
+TRANSIENT_STATUSES = ("UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL", "ABORTED")
+
+_RETRY_DELAY_PATTERN = re.compile(r"retry[_ ]?delay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", re.IGNORECASE)
+_CODE_PATTERN = re.compile(r"^\s*(\d{3})\b")
+
+
+def _error_code(error: Exception) -> int | None:
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code
+    match = _CODE_PATTERN.match(str(error))
+    return int(match.group(1)) if match else None
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Classify a model error for retrying.
+
+    Args:
+        error: Exception raised by a model call
+
+    Returns:
+        RATE_LIMITED, TRANSIENT or FATAL
+    """
+    code = _error_code(error)
+    message = str(error).upper()
+    if code == 429 or "RESOURCE_EXHAUSTED" in message:
+        return RATE_LIMITED
+    if code in TRANSIENT_CODES or any(status in message for status in TRANSIENT_STATUSES):
+        return TRANSIENT
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return TRANSIENT
+    return FATAL
+
+
+def get_retry_after(error: Exception) -> float | None:
+    """
+    Extract the server's requested delay from a model error, if any.
+
+    Looks at a retry_after attribute, a Retry-After response header and the
+    RetryInfo retryDelay ("23s") embedded in Gemini error details.
+
+    Args:
+        error: Exception raised by a model call
+
+    Returns:
+        Seconds to wait, or None
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return float(retry_after)
+
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is not None:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+
+    match = _RETRY_DELAY_PATTERN.search(str(error))
+    if match:
+        return float(match.group(1))
+    return None
+
+
+class RetryBudget:
+    """
+    Process-wide cap on retries.
+
+    Every successful request deposits `ratio` tokens (up to `max_tokens`) and
+    every retry withdraws one, so retries can add at most about `ratio` extra
+    load on top of successful traffic.
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def record_success(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class RetryPolicy:
+    """Backoff settings for retrying model calls."""
+
+    def __init__(
+        self,
+        max_retries: int = 5,
+        base_delay: float = 2.0,
+        max_delay: float = 60.0,
+        budget: RetryBudget | None = None,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+
+    @classmethod
+    def from_env(cls, budget: RetryBudget | None = None) -> "RetryPolicy":
+        """Create a policy configured from GEMINI_RETRY_* variables."""
+        return cls(
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "5")),
+            base_delay=float(os.getenv("GEMINI_RETRY_BASE_DELAY", "2")),
+            max_delay=float(os.getenv("GEMINI_RETRY_MAX_DELAY", "60")),
+            budget=budget,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry number (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+_shared_budget = RetryBudget(float(os.getenv("GEMINI_RETRY_BUDGET", "0.2")))
+
+
+def get_default_policy() -> RetryPolicy:
+    """Get a policy from the environment that draws on the shared retry budget."""
+    return RetryPolicy.from_env(budget=_shared_budget)
+
+
+def call_with_retry(
+    func: Callable[[], Any],
+    policy: RetryPolicy | None = None,
+    limiter: Any = None,
+    on_retry: Callable[[int, float, Exception, str], None] | None = None,
+) -> Any:
+    """
+    Call a model function, retrying retryable errors.
+
+    Args:
+        func: Zero-argument callable performing one request
+        policy: Retry policy (default: get_default_policy())
+        limiter: Optional TokenBucket; a token is taken before every attempt
+            and the bucket is paused when the server sends Retry-After
+        on_retry: Called as on_retry(attempt, delay, error, kind) before each retry
+
+    Returns:
+        The result of func()
+
+    Raises:
+        Exception: The last error, once it is fatal or retries are exhausted
+    """
+    policy = policy or get_default_policy()
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            result = func()
+        except Exception as error:
+            kind = classify_error(error)
+            API_ERRORS_TOTAL.inc(kind=kind)
+            if kind == RATE_LIMITED:
+                RATE_LIMITED_TOTAL.inc()
+
+            attempt += 1
+            if kind == FATAL or attempt > policy.max_retries:
+                raise
+            if policy.budget is not None and not policy.budget.try_spend():
+                raise
+
+            retry_after = get_retry_after(error)
+            delay = policy.backoff(attempt)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+                if limiter is not None:
+                    limiter.pause(retry_after)
+
+            RETRIES_TOTAL.inc(kind=kind)
+            if on_retry:
+                on_retry(attempt, delay, error, kind)
+            time.sleep(delay)
+            continue
+
+        if policy.budget is not None:
+            policy.budget.record_success()
+        return result
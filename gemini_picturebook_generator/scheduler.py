@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Asyncio Story Scheduler for Gemini Picture Book Generator
+
+One scheduler per process runs every asynchronous generation job, whichever
+front end submitted it: the MCP tools and the ASGI web UI share its queue,
+its concurrency limit, the process-wide model client and the story catalog
+when they run on the same event loop.
+
+Jobs are registered with the in-flight registry, so identical requests attach
+to the running job instead of repeating it, and their status is written to the
+file-backed job store, where every front end (and every worker process of the
+WSGI server) reads it. Progress events are published to the job's flight, so
+any number of viewers can follow a job without polling.
+
+At most MAX_CONCURRENT_STORIES jobs (default 4) generate at a time; the rest
+wait in the queue with status "queued".
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from .backends import enable_server_mode
+from .catalog import create_story_dir, new_story_id
+from .enhanced_story_generator import generate_custom_story_with_images, setup_client
+from .job_store import JobStore, get_job_store
+from .jobs import INFLIGHT, Flight, generation_key
+from .metrics import STAGE_SECONDS
+from .progress import TERMINAL_EVENTS, ProgressQueue, logging_subscriber, make_event
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT_STORIES = 4
+
+# How often wait() re-reads a job running in another process
+STATUS_POLL_INTERVAL = 1.0
+
+# Async callback receiving every progress event of a job
+Notifier = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+def build_story_prompt(story_prompt: str, character_name: str = "", setting: str = "", style: str = "cartoon") -> str:
+    """
+    Fold the optional character, setting and style into the story prompt.
+
+    Returns:
+        Prompt sent to the model
+    """
+    enhanced_prompt = story_prompt
+    if character_name:
+        enhanced_prompt = f"A story about {character_name}: {story_prompt}"
+    if setting:
+        enhanced_prompt += f" The story takes place in {setting}."
+    enhanced_prompt += f" Create this in {style} art style."
+    return enhanced_prompt
+
+
+async def _notify(notify: Notifier | None, event: dict[str, Any]):
+    if notify is None:
+        return
+    try:
+        await notify(event)
+    except Exception as e:
+        # Observers never fail the job they are watching
+        logger.debug(f"Progress notification failed: {e}")
+
+
+def _generate_in_thread(client, prompt, num_scenes, output_dir: Path, metadata, events: ProgressQueue):
+    try:
+        return generate_custom_story_with_images(
+            client, prompt, num_scenes, output_dir,
+            extra_metadata=metadata,
+            progress_callback=events,
+        )
+    finally:
+        events.close()
+
+
+class StoryScheduler:
+    """Queues, runs and tracks generation jobs on the running event loop."""
+
+    def __init__(self, max_concurrent: int | None = None, job_store: JobStore | None = None):
+        """
+        Args:
+            max_concurrent: Jobs generating at once (default: MAX_CONCURRENT_STORIES)
+            job_store: Status store (default: the process-wide job store)
+        """
+        if max_concurrent is None:
+            max_concurrent = int(os.getenv(
+                "MAX_CONCURRENT_STORIES",
+                os.getenv("MCP_MAX_CONCURRENT_STORIES", DEFAULT_MAX_CONCURRENT_STORIES),
+            ))
+        self.max_concurrent = max(1, max_concurrent)
+        self._job_store = job_store
+        self._slots: asyncio.Semaphore | None = None
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._followers: set[asyncio.Task] = set()
+
+    @property
+    def job_store(self) -> JobStore:
+        return self._job_store or get_job_store()
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # Created on first use so it belongs to the loop running the jobs
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        return self._slots
+
+    def submit(
+        self,
+        story_prompt: str,
+        num_scenes: int = 6,
+        character_name: str = "",
+        setting: str = "",
+        style: str = "cartoon",
+        extra_metadata: dict[str, Any] | None = None,
+        notify: Notifier | None = None,
+    ) -> dict[str, Any]:
+        """
+        Queue a story, or attach to an identical one already generating.
+
+        Must be called on the event loop that runs the jobs; it returns at once.
+
+        Args:
+            story_prompt: The main story idea
+            num_scenes: Number of scenes (at least 1)
+            character_name: Optional main character name
+            setting: Optional story setting
+            style: Art style
+            extra_metadata: Extra fields saved in the story metadata
+            notify: Async callback receiving the job's progress events
+
+        Returns:
+            Dict with story_id, status ("queued" or "coalesced") and coalesced
+
+        Raises:
+            ValueError: If the story prompt is empty
+        """
+        if not story_prompt.strip():
+            raise ValueError("Story prompt is required")
+        num_scenes = max(int(num_scenes), 1)
+
+        story_id = new_story_id()
+        key = generation_key(story_prompt, num_scenes, character_name, setting, style)
+        flight, is_leader = INFLIGHT.join(key, story_id)
+        if not is_leader:
+            logger.info(f"Attaching to in-flight generation {flight.job_id}")
+            if notify is not None:
+                task = asyncio.create_task(self._follow(flight, notify))
+                self._followers.add(task)
+                task.add_done_callback(self._followers.discard)
+            return {"story_id": flight.job_id, "status": "coalesced", "coalesced": True}
+
+        self.job_store.put(story_id, {
+            "status": "queued",
+            "progress": 0,
+            "message": "Waiting for a free generation slot...",
+            "story_prompt": story_prompt,
+            "num_scenes": num_scenes,
+            "current_scene": 0,
+            "total_scenes": num_scenes,
+            "scenes_completed": [],
+            "start_time": datetime.now().isoformat(),
+        })
+        metadata = {
+            "id": story_id,
+            "character_name": character_name,
+            "setting": setting,
+            "style": style,
+            **(extra_metadata or {}),
+        }
+        prompt = build_story_prompt(story_prompt, character_name, setting, style)
+        task = asyncio.create_task(self._run(story_id, flight, prompt, num_scenes, metadata, notify))
+        self._tasks[story_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(story_id, None))
+        logger.info(f"Queued story {story_id} ({num_scenes} scenes)")
+        return {"story_id": story_id, "status": "queued", "coalesced": False}
+
+    async def _follow(self, flight: Flight, notify: Notifier):
+        events = ProgressQueue()
+        flight.subscribe(events)
+        try:
+            async for event in events:
+                await _notify(notify, event)
+        finally:
+            flight.unsubscribe(events)
+
+    async def _run(self, story_id, flight, prompt, num_scenes, metadata, notify) -> dict[str, Any] | None:
+        queued_at = time.perf_counter()
+        status = self.job_store.get(story_id) or {}
+        terminal_sent = False
+        log_event = logging_subscriber(logger, logging.DEBUG)
+
+        def record(**fields):
+            status.update(fields)
+            self.job_store.put(story_id, status)
+
+        try:
+            async with self._get_slots():
+                STAGE_SECONDS.observe(time.perf_counter() - queued_at, stage="queue_wait")
+                record(status="initializing", message="Setting up story generation...")
+                _, output_dir = create_story_dir(story_id)
+                metadata["output_dir"] = str(output_dir)
+
+                enable_server_mode()
+                # The first call imports and builds the shared client; keep it off the loop
+                client = await asyncio.to_thread(setup_client)
+                if not client:
+                    raise RuntimeError("Failed to initialize Gemini API client")
+
+                record(status="generating", message="Starting story generation...")
+                loop = asyncio.get_running_loop()
+                events = ProgressQueue(loop)
+                future = loop.run_in_executor(
+                    None, _generate_in_thread, client, prompt, num_scenes, output_dir, metadata, events,
+                )
+                async for event in events:
+                    log_event(event)
+                    self._apply_event(status, event)
+                    self.job_store.put(story_id, status)
+                    flight.publish(event)
+                    terminal_sent = terminal_sent or event["event"] in TERMINAL_EVENTS
+                    await _notify(notify, event)
+                story_data = await future
+                if not story_data:
+                    raise RuntimeError(status.get("error") or "Story generation returned no data (check API quota and logs)")
+
+            scenes = len([s for s in story_data["scenes"] if s["type"] == "image"])
+            record(
+                status="complete",
+                progress=100,
+                message=f"Story generation complete! Created {scenes} scenes.",
+                data=story_data,
+                output_dir=str(output_dir),
+                current_scene=num_scenes,
+                end_time=datetime.now().isoformat(),
+            )
+            INFLIGHT.finish(flight, result=story_data)
+            logger.info(f"Successfully generated story {story_id} with {num_scenes} scenes")
+            return story_data
+        except asyncio.CancelledError:
+            record(status="error", message="Generation cancelled", error="Generation cancelled",
+                   end_time=datetime.now().isoformat())
+            INFLIGHT.finish(flight, error="Generation cancelled")
+            raise
+        except Exception as e:
+            error_msg = f"Story generation failed: {e!s}"
+            logger.error(error_msg, exc_info=True)
+            record(status="error", message=error_msg, error=error_msg, end_time=datetime.now().isoformat())
+            if not terminal_sent:
+                # Failures before the generator started emit no event of their own
+                event = make_event("failed", error_msg, error=str(e), error_type=type(e).__name__)
+                flight.publish(event)
+                await _notify(notify, event)
+            INFLIGHT.finish(flight, error=error_msg)
+            return None
+
+    @staticmethod
+    def _apply_event(status: dict[str, Any], event: dict[str, Any]):
+        status["message"] = event["message"]
+        if "progress" in event:
+            status["progress"] = max(status.get("progress", 0), round(event["progress"] * 100))
+        if event["event"] == "scene_image":
+            status["current_scene"] = event["scene"]
+            status.setdefault("scenes_completed", []).append(event["scene"])
+        elif event["event"] == "failed":
+            status["error"] = event["error"]
+
+    async def wait(self, job_id: str) -> dict[str, Any]:
+        """
+        Wait for a job to finish.
+
+        Works for jobs queued here, jobs led by another entry point of this
+        process and jobs running in another process that shares the job store.
+
+        Returns:
+            The generated story data
+
+        Raises:
+            KeyError: If the job is unknown
+            RuntimeError: If the job failed
+        """
+        while True:
+            task = self._tasks.get(job_id)
+            if task is not None:
+                # Shielded: a waiter giving up must not cancel the job
+                await asyncio.shield(task)
+            else:
+                flight = INFLIGHT.get(job_id)
+                if flight is not None:
+                    return await asyncio.to_thread(flight.wait)
+
+            status = self.job_store.get(job_id)
+            if status is None:
+                raise KeyError(job_id)
+            if status["status"] == "complete":
+                return status["data"]
+            if status["status"] == "error":
+                raise RuntimeError(status.get("error") or status.get("message") or "Story generation failed")
+            await asyncio.sleep(STATUS_POLL_INTERVAL)
+
+    def is_running(self, job_id: str) -> bool:
+        """Check whether a job is queued or generating in this scheduler."""
+        return job_id in self._tasks
+
+    def cancel_all(self):
+        """Cancel every queued and running job (on shutdown)."""
+        for task in [*self._tasks.values(), *self._followers]:
+            if not task.done():
+                task.cancel()
+
+
+_scheduler: StoryScheduler | None = None
+_scheduler_guard = threading.Lock()
+
+
+def get_scheduler() -> StoryScheduler:
+    """Get the process-wide story scheduler."""
+    global _scheduler
+    with _scheduler_guard:
+        if _scheduler is None:
+            _scheduler = StoryScheduler()
+        return _scheduler
+
@@ -0,0 +1,588 @@
+#!/usr/bin/env python3
+"""
+Story Storage Backends for Gemini Picture Book Generator
+
+Stories are always generated and rendered in the local stories directory (the
+working copy: WeasyPrint and the export builders need real files). A storage
+backend is where finished stories are kept so that every node can serve them:
+
+- "local" (default): the stories directory itself, or with STORAGE_ROOT set,
+  another directory such as a shared network mount
+- "s3": any S3-compatible object store (AWS S3, MinIO, Ceph, R2, ...)
+
+Scene images, metadata and exports are published to the backend under
+"<bucket>/<story_id>/<file>", the same relative paths as in the working copy
+(see catalog.py). A node asked for a story it does not have locally fetches it
+from the backend first. Large files are streamed in multipart chunks, the
+files of a story are transferred in parallel, and with the S3 backend the web
+UI answers image and download requests with a redirect to a short-lived
+presigned URL, so web nodes never proxy image bytes. A file the backend does
+not have (a story from before the backend was set up, or a failed upload) is
+served from the working copy instead and published again in the background.
+
+Settings (all optional):
+
+- STORAGE_BACKEND: "local" or "s3" (default "local")
+- STORAGE_ROOT: directory of the local backend (default: the stories directory)
+- STORAGE_TRANSFER_CONCURRENCY: parallel transfers per story (default 8)
+- S3_BUCKET, S3_PREFIX: bucket and key prefix of the s3 backend
+- S3_ENDPOINT_URL: endpoint of an S3-compatible server (e.g. http://minio:9000)
+- S3_REGION: bucket region
+- S3_PRESIGN_SECONDS: lifetime of presigned URLs (default 3600)
+- S3_MULTIPART_THRESHOLD_MB: files larger than this are uploaded in parts of
+  this size (default 8)
+
+Credentials for S3 come from the usual AWS variables and config files.
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import logging
+import mimetypes
+import os
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from .catalog import (
+    find_story_dir,
+    get_stories_dir,
+    is_internal_path,
+    is_valid_story_id,
+    story_bucket,
+    story_path,
+)
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+STORAGE_ENV = "STORAGE_BACKEND"
+DEFAULT_STORAGE = "local"
+
+DEFAULT_TRANSFER_CONCURRENCY = 8
+DEFAULT_PRESIGN_SECONDS = 3600
+DEFAULT_MULTIPART_THRESHOLD_MB = 8
+
+STORAGE_BYTES_TOTAL = REGISTRY.counter("picturebook_storage_bytes_total", "Bytes transferred to and from story storage")
+
+
+@lru_cache(maxsize=1)
+def load_boto3():
+    """
+    Import boto3 on first use (it is slow to import and only needed for S3).
+
+    Returns:
+        module: The boto3 module, or None if it is not installed
+    """
+    try:
+        import boto3
+    except ImportError:
+        return None
+    return boto3
+
+
+def content_type(key: str) -> str:
+    """Guess the MIME type of a stored file from its name."""
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+class StorageBackend(ABC):
+    """Where finished stories are kept; keys are "/"-separated relative paths."""
+
+    # False when the backend is the working copy itself, so nothing is copied
+    remote = True
+
+    @abstractmethod
+    def put_file(self, key: str, path: Path):
+        """Store a local file under a key, replacing any previous version."""
+
+    @abstractmethod
+    def get_file(self, key: str, path: Path) -> bool:
+        """
+        Copy a stored file to a local path.
+
+        Returns:
+            False if the key does not exist
+        """
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Check whether a key exists."""
+
+    @abstractmethod
+    def list_keys(self, prefix: str) -> list[str]:
+        """List every key below a prefix ("<dir>/")."""
+
+    @abstractmethod
+    def delete(self, keys: Iterable[str]):
+        """Delete keys; missing keys are ignored."""
+
+    def url(self, key: str, download_name: str | None = None) -> str | None:
+        """
+        Get a URL clients can fetch the key from directly.
+
+        Args:
+            key: Stored file
+            download_name: Offer the file as a download with this name
+
+        Returns:
+            The URL, or None if the web UI has to serve the file itself
+        """
+        return None
+
+
+class LocalStorage(StorageBackend):
+    """Stories kept in a directory: the working copy or a shared mount."""
+
+    def __init__(self, root: Path | None = None):
+        """
+        Args:
+            root: Storage directory (default: the stories directory)
+        """
+        self._root = Path(root) if root else None
+
+    @property
+    def root(self) -> Path:
+        return self._root or get_stories_dir()
+
+    @property
+    def remote(self) -> bool:
+        return self.root.resolve() != get_stories_dir().resolve()
+
+    def _path(self, key: str) -> Path:
+        parts = Path(key).parts
+        if not parts or ".." in parts or Path(key).is_absolute():
+            raise ValueError(f"Invalid storage key: {key!r}")
+        return self.root.joinpath(*parts)
+
+    def put_file(self, key: str, path: Path):
+        target = self._path(key)
+        if target.resolve() == Path(path).resolve():
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Copy next to the target and rename, so readers never see a partial file
+        tmp_path = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, target)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    def get_file(self, key: str, path: Path) -> bool:
+        source = self._path(key)
+        if not source.is_file():
+            return False
+        if source.resolve() != Path(path).resolve():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(source, path)
+        return True
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).is_file()
+
+    def list_keys(self, prefix: str) -> list[str]:
+        directory = self._path(prefix)
+        if not directory.is_dir():
+            return []
+        return sorted(
+            path.relative_to(self.root).as_posix()
+            for path in directory.rglob("*")
+            if path.is_file() and not path.name.startswith(".")
+        )
+
+    def delete(self, keys: Iterable[str]):
+        for key in keys:
+            self._path(key).unlink(missing_ok=True)
+
+
+class S3Storage(StorageBackend):
+    """Stories kept in an S3-compatible bucket."""
+
+    remote = True
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        client: Any = None,
+        endpoint_url: str | None = None,
+        region: str | None = None,
+        presign_seconds: int = DEFAULT_PRESIGN_SECONDS,
+        concurrency: int = DEFAULT_TRANSFER_CONCURRENCY,
+        multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+    ):
+        """
+        Args:
+            bucket: Bucket name
+            prefix: Key prefix, to share a bucket with other data
+            client: boto3 S3 client, or a stand-in with the same methods
+                (default: one built from the arguments)
+            endpoint_url: Endpoint of an S3-compatible server
+            region: Bucket region
+            presign_seconds: Lifetime of presigned URLs
+            concurrency: Parallel part transfers per file
+            multipart_threshold: Files larger than this are transferred in
+                parts of this size
+
+        Raises:
+            ImportError: If boto3 is not installed and no client is given
+        """
+        boto3 = load_boto3()
+        if boto3 is None and client is None:
+            raise ImportError("The s3 storage backend requires boto3: pip install 'gemini-picturebook-generator[s3]'")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.presign_seconds = presign_seconds
+        # Without boto3 (an injected client) the client's own transfer defaults apply
+        self.transfer_config = None
+        if boto3 is not None:
+            from boto3.s3.transfer import TransferConfig
+            self.transfer_config = TransferConfig(
+                multipart_threshold=multipart_threshold,
+                multipart_chunksize=multipart_threshold,
+                max_concurrency=concurrency,
+            )
+        if client is None:
+            from botocore.config import Config
+            client = boto3.client(
+                "s3",
+                endpoint_url=endpoint_url,
+                region_name=region,
+                # Path-style addressing works with every S3-compatible server
+                config=Config(
+                    max_pool_connections=max(10, concurrency * 2),
+                    s3={"addressing_style": "path"} if endpoint_url else {},
+                ),
+            )
+        self.client = client
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    @staticmethod
+    def _is_missing(error: Exception) -> bool:
+        # botocore's ClientError carries the S3 error code in .response
+        code = str((getattr(error, "response", None) or {}).get("Error", {}).get("Code", ""))
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def put_file(self, key: str, path: Path):
+        # upload_file streams from disk and switches to a parallel multipart
+        # upload above the threshold
+        self.client.upload_file(
+            str(path), self.bucket, self._key(key),
+            ExtraArgs={"ContentType": content_type(key)},
+            Config=self.transfer_config,
+        )
+        STORAGE_BYTES_TOTAL.inc(Path(path).stat().st_size, direction="upload")
+
+    def get_file(self, key: str, path: Path) -> bool:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.client.download_file(self.bucket, self._key(key), str(tmp_path), Config=self.transfer_config)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            if self._is_missing(e):
+                return False
+            raise
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        STORAGE_BYTES_TOTAL.inc(path.stat().st_size, direction="download")
+        return True
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            if self._is_missing(e):
+                return False
+            raise
+        return True
+
+    def list_keys(self, prefix: str) -> list[str]:
+        keys = []
+        strip = len(self._key(""))
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            keys.extend(item["Key"][strip:] for item in page.get("Contents", []))
+        return keys
+
+    def delete(self, keys: Iterable[str]):
+        keys = [self._key(key) for key in keys]
+        # DeleteObjects takes at most 1000 keys per request
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+
+    def url(self, key: str, download_name: str | None = None) -> str | None:
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if download_name:
+            params["ResponseContentDisposition"] = f'attachment; filename="{download_name}"'
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=self.presign_seconds)
+
+
+def _create_local() -> StorageBackend:
+    root = os.getenv("STORAGE_ROOT")
+    return LocalStorage(Path(root) if root else None)
+
+
+def _create_s3() -> StorageBackend:
+    bucket = os.getenv("S3_BUCKET")
+    if not bucket:
+        raise ValueError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+    return S3Storage(
+        bucket,
+        prefix=os.getenv("S3_PREFIX", ""),
+        endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+        region=os.getenv("S3_REGION") or None,
+        presign_seconds=int(os.getenv("S3_PRESIGN_SECONDS", DEFAULT_PRESIGN_SECONDS)),
+        concurrency=get_transfer_concurrency(),
+        multipart_threshold=int(float(os.getenv("S3_MULTIPART_THRESHOLD_MB", DEFAULT_MULTIPART_THRESHOLD_MB)) * 1024 * 1024),
+    )
+
+
+# Factories for every storage backend, keyed by STORAGE_BACKEND value
+_STORAGE_BACKENDS: dict[str, Callable[[], StorageBackend]] = {
+    "local": _create_local,
+    "s3": _create_s3,
+}
+
+
+def register_storage_backend(name: str, factory: Callable[[], StorageBackend]):
+    """
+    Register an additional storage backend selectable via STORAGE_BACKEND.
+
+    Args:
+        name: Backend name
+        factory: Callable returning the storage backend
+    """
+    _STORAGE_BACKENDS[name.strip().lower()] = factory
+
+
+def create_storage(name: str | None = None) -> StorageBackend:
+    """
+    Create a storage backend.
+
+    Args:
+        name: Backend name (default: STORAGE_BACKEND or "local")
+
+    Returns:
+        Storage backend
+
+    Raises:
+        ValueError: If the backend is unknown or misconfigured
+    """
+    name = (name or os.getenv(STORAGE_ENV) or DEFAULT_STORAGE).strip().lower()
+    factory = _STORAGE_BACKENDS.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown storage backend {name!r} (choose from {', '.join(sorted(_STORAGE_BACKENDS))})")
+    return factory()
+
+
+_storage: StorageBackend | None = None
+_storage_guard = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """Get the process-wide storage backend."""
+    global _storage
+    with _storage_guard:
+        if _storage is None:
+            _storage = create_storage()
+        return _storage
+
+
+def set_storage(storage: StorageBackend | None):
+    """Replace the process-wide storage backend (None: rebuild from the environment)."""
+    global _storage
+    with _storage_guard:
+        _storage = storage
+
+
+def get_transfer_concurrency() -> int:
+    """Get how many files of a story are transferred at once."""
+    return max(1, int(os.getenv("STORAGE_TRANSFER_CONCURRENCY", DEFAULT_TRANSFER_CONCURRENCY)))
+
+
+def story_key(story_id: str) -> str:
+    """Get the key prefix of a story: "<bucket>/<story_id>"."""
+    return f"{story_bucket(story_id)}/{story_id}"
+
+
+def file_key(story_dir: Path, path: Path) -> str:
+    """Get the key of a file in a story directory."""
+    return f"{story_key(story_dir.name)}/{Path(path).relative_to(story_dir).as_posix()}"
+
+
+def _story_files(story_dir: Path) -> list[Path]:
+    # Dotfiles are temporary files and per-node caches such as the export manifest
+    return sorted(
+        path for path in story_dir.rglob("*")
+        if path.is_file() and not any(part.startswith(".") for part in path.relative_to(story_dir).parts)
+    )
+
+
+def _transfer_all(transfer: Callable[[Any], Any], items: list[Any]) -> list[Any]:
+    if len(items) <= 1:
+        return [transfer(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(get_transfer_concurrency(), len(items))) as pool:
+        return list(pool.map(transfer, items))
+
+
+def publish_story(story_dir: Path, paths: Iterable[Path] | None = None) -> int:
+    """
+    Upload a story (or some of its files) to the storage backend.
+
+    Does nothing when the backend is the working copy itself.
+
+    Args:
+        story_dir: Story directory in the working copy
+        paths: Files to upload (default: every file of the story)
+
+    Returns:
+        Number of files uploaded
+    """
+    storage = get_storage()
+    if not storage.remote:
+        return 0
+    files = _story_files(story_dir) if paths is None else [Path(p) for p in paths if Path(p).is_file()]
+    _transfer_all(lambda path: storage.put_file(file_key(story_dir, path), path), files)
+    return len(files)
+
+
+def try_publish_story(story_dir: Path, paths: Iterable[Path] | None = None) -> int:
+    """Like publish_story(), but log failures instead of raising (the story is safe locally)."""
+    try:
+        return publish_story(story_dir, paths)
+    except Exception as e:
+        logger.error(f"Failed to publish {story_dir.name} to storage: {e}")
+        return 0
+
+
+def unpublish_story(story_dir: Path, paths: Iterable[Path] | None = None) -> int:
+    """
+    Delete a story (or some of its files) from the storage backend.
+
+    Does nothing when the backend is the working copy itself.
+
+    Args:
+        story_dir: Story directory in the working copy (it may be gone already)
+        paths: Files to delete (default: the whole story)
+
+    Returns:
+        Number of keys deleted
+    """
+    storage = get_storage()
+    if not storage.remote:
+        return 0
+    if paths is None:
+        keys = storage.list_keys(story_key(story_dir.name) + "/")
+    else:
+        keys = [file_key(story_dir, path) for path in paths]
+    storage.delete(keys)
+    return len(keys)
+
+
+def fetch_story(story_id: str) -> Path | None:
+    """
+    Download a story that is not in the working copy from the storage backend.
+
+    Args:
+        story_id: Story ID
+
+    Returns:
+        The story directory, or None if the backend does not have the story
+    """
+    storage = get_storage()
+    if not storage.remote or not is_valid_story_id(story_id):
+        return None
+    prefix = story_key(story_id) + "/"
+    keys = storage.list_keys(prefix)
+    if not keys:
+        return None
+
+    story_dir = story_path(story_id)
+    # Download next to the final directory and rename, so a story never
+    # appears half-fetched to other requests
+    staging = story_dir.with_name(f".{story_id}.{os.getpid()}.{threading.get_ident()}.fetch")
+    try:
+        _transfer_all(lambda key: storage.get_file(key, staging / key[len(prefix):]), keys)
+        try:
+            os.rename(staging, story_dir)
+        except OSError:
+            # Another request fetched it first
+            if not story_dir.is_dir():
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    logger.info(f"Fetched story {story_id} from storage ({len(keys)} files)")
+    return story_dir
+
+
+def _checked_url(storage: StorageBackend, story_dir: Path, path: Path, download_name: str | None = None) -> str | None:
+    """Presign a story file's URL, but only if the backend really has the file."""
+    key = file_key(story_dir, path)
+    url = storage.url(key, download_name)
+    if url is None or storage.exists(key):
+        return url
+    # Published before this backend was set up, or the upload failed: serve
+    # the working copy and publish the file for next time
+    if path.is_file():
+        threading.Thread(
+            target=try_publish_story, args=(story_dir, [path]), name=f"publish-{story_dir.name}", daemon=True,
+        ).start()
+    return None
+
+
+def story_file_url(story_dir: Path, path: Path, download_name: str | None = None) -> str | None:
+    """
+    Get a direct URL to a story file, for redirecting clients to the backend.
+
+    Args:
+        story_dir: Story directory
+        path: File in the story directory
+        download_name: Offer the file as a download with this name
+
+    Returns:
+        The URL, or None if the file has to be served from the working copy
+        (including when the backend does not have it)
+    """
+    storage = get_storage()
+    if not storage.remote:
+        return None
+    return _checked_url(storage, story_dir, Path(path), download_name)
+
+
+def story_asset_url(filename: str) -> str | None:
+    """
+    Get a direct URL to a story file requested as "<story_id>/<path>".
+
+    Unlike find_story_asset(), the story does not have to be on this node.
+
+    Args:
+        filename: "<story_id>/<path in the story>"
+
+    Returns:
+        The URL, or None if the file has to be served from the working copy
+        (including when the backend does not have it)
+    """
+    storage = get_storage()
+    parts = Path(filename).parts if filename else ()
+    if not storage.remote or len(parts) < 2 or is_internal_path(filename) or not is_valid_story_id(parts[0]):
+        return None
+    # Legacy stories may be known by another ID than their folder name
+    story_dir = find_story_dir(parts[0], fetch=False)
+    if story_dir is None:
+        story_dir = story_path(parts[0])
+    return _checked_url(storage, story_dir, story_dir.joinpath(*parts[1:]))
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Story Metadata Sidecar for Gemini Picture Book Generator
+
+Every story directory carries a canonical, schema-versioned metadata sidecar so
+tools can regenerate HTML/PDF exports from structured data instead of parsing
+the rendered HTML. The sidecar is split in two:
+
+- story_metadata.json: a small header record (prompt, style, counts, ...) that
+  is all gallery and listing views need
+- story_scenes.json: the scene list with the full story text, loaded only when
+  a story is actually displayed or exported
+
+Both files are compact JSON, serialized with orjson when it is installed, and
+are replaced atomically (write to a temporary file, then rename) so readers
+never observe a half-written sidecar. How hard each write is pushed to disk is
+controlled by the METADATA_FSYNC environment variable:
+
+- "none": rely on the OS to flush (fastest)
+- "file": fsync the file before renaming it into place (default)
+- "full": also fsync the directory so the rename itself survives a power loss
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+from .metrics import BYTES_WRITTEN_TOTAL, time_stage
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    fcntl = None
+    FCNTL_AVAILABLE = False
+
+METADATA_FILENAME = "story_metadata.json"
+SCENES_FILENAME = "story_scenes.json"
+
+# Bump when the sidecar layout changes; files without a version are legacy (0).
+# Version 1 kept the scenes inline; version 2 splits them into SCENES_FILENAME.
+SCHEMA_VERSION = 2
+
+FSYNC_POLICIES = ("none", "file", "full")
+DEFAULT_FSYNC_POLICY = "file"
+
+# Scene fields that are derived from the story directory and never persisted
+_DERIVED_SCENE_FIELDS = ("path",)
+
+# Lock file in the story directory that worker processes serialize on
+LOCK_FILENAME = ".metadata.lock"
+
+# Serializes metadata updates per story directory
+_story_locks: dict[str, "StoryLock"] = {}
+_story_locks_guard = threading.Lock()
+
+
+def _dumps(obj: Any) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(data: bytes) -> Any:
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _read_json(path: Path) -> Any:
+    try:
+        return _loads(path.read_bytes())
+    except (OSError, ValueError):
+        return None
+
+
+def get_fsync_policy() -> str:
+    """Get the configured fsync policy for metadata writes."""
+    policy = os.getenv("METADATA_FSYNC", DEFAULT_FSYNC_POLICY).strip().lower()
+    return policy if policy in FSYNC_POLICIES else DEFAULT_FSYNC_POLICY
+
+
+def atomic_write_bytes(path: Path, data: bytes, fsync_policy: str | None = None):
+    """
+    Atomically replace a file's contents.
+
+    The data is written to a temporary file in the same directory and renamed
+    over the target, so concurrent readers see either the old or the new file.
+
+    Args:
+        path: File to write
+        data: New file contents
+        fsync_policy: One of FSYNC_POLICIES (default: METADATA_FSYNC setting)
+    """
+    path = Path(path)
+    policy = fsync_policy or get_fsync_policy()
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            if policy != "none":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    if policy == "full" and hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class StoryLock:
+    """
+    Lock on a story held across threads and processes.
+
+    A threading lock serializes the threads of this process and an flock on
+    a dot file in the story directory the worker processes sharing it (where
+    fcntl is available). Use it as a context manager.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: Lock file (created on first use)
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._file = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Take the lock.
+
+        Args:
+            blocking: Wait for the lock instead of giving up if it is held
+
+        Returns:
+            True if the lock was taken
+        """
+        if not self._lock.acquire(blocking):
+            return False
+        if not FCNTL_AVAILABLE:
+            return True
+        try:
+            lock_file = open(self.path, "a")
+        except OSError:
+            # The story is gone, so there is nothing left to serialize on disk
+            return True
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BaseException as e:
+            lock_file.close()
+            self._lock.release()
+            if isinstance(e, BlockingIOError):
+                return False
+            raise
+        self._file = lock_file
+        return True
+
+    def release(self):
+        """Release the lock."""
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+    def locked(self) -> bool:
+        """Check whether any thread or process holds the lock."""
+        if self._lock.locked():
+            return True
+        if not FCNTL_AVAILABLE:
+            return False
+        try:
+            probe = open(self.path, "rb")
+        except OSError:
+            return False
+        with probe:
+            try:
+                fcntl.flock(probe, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+            fcntl.flock(probe, fcntl.LOCK_UN)
+        return False
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def get_story_lock(story_dir: Path) -> StoryLock:
+    """Get the lock that serializes read-modify-write updates of a story's metadata."""
+    with _story_locks_guard:
+        key = str(story_dir)
+        if key not in _story_locks:
+            _story_locks[key] = StoryLock(Path(story_dir) / LOCK_FILENAME)
+        return _story_locks[key]
+
+
+def is_story_locked(story_dir: Path) -> bool:
+    """Check whether a story's metadata is being updated right now, by any process."""
+    with _story_locks_guard:
+        lock = _story_locks.get(str(story_dir))
+    return (lock or StoryLock(Path(story_dir) / LOCK_FILENAME)).locked()
+
+
+def forget_story_locks(story_dirs: list[Path] | None = None):
+    """
+    Drop the metadata locks of deleted stories, so the lock table stays small.
+
+    Args:
+        story_dirs: Deleted story directories (default: every story directory
+            that no longer exists)
+    """
+    with _story_locks_guard:
+        keys = [str(d) for d in story_dirs] if story_dirs is not None else [
+            key for key in _story_locks if not Path(key).is_dir()
+        ]
+        for key in keys:
+            lock = _story_locks.get(key)
+            if lock is not None and not lock.locked():
+                del _story_locks[key]
+
+
+def split_story_metadata(story_data: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    """
+    Split story data into its header record and scenes record.
+
+    Args:
+        story_data: Full story data dictionary
+
+    Returns:
+        Tuple of (header, scenes record), both tagged with the schema version
+    """
+    scenes = [
+        {key: value for key, value in scene.items() if key not in _DERIVED_SCENE_FIELDS}
+        for scene in story_data.get("scenes", [])
+    ]
+    header = {"schema_version": SCHEMA_VERSION}
+    header.update(
+        (key, value) for key, value in story_data.items()
+        if key not in ("schema_version", "scenes")
+    )
+    header["image_count"] = len([s for s in scenes if s.get("type") == "image"])
+    header["scenes_file"] = SCENES_FILENAME
+    return header, {"schema_version": SCHEMA_VERSION, "scenes": scenes}
+
+
+def write_story_metadata(story_data: dict[str, Any], story_dir: Path) -> Path:
+    """
+    Write the metadata sidecar for a story.
+
+    Both files are replaced atomically, and the scenes file is written before
+    the header, so a header on disk always points at a complete scenes file.
+
+    Args:
+        story_data: Full story data dictionary
+        story_dir: Story directory
+
+    Returns:
+        Path to the written header file
+    """
+    story_dir = Path(story_dir)
+    with time_stage("metadata_write"):
+        header, scenes_record = split_story_metadata(story_data)
+        scenes_bytes = _dumps(scenes_record)
+        header_bytes = _dumps(header)
+        atomic_write_bytes(story_dir / SCENES_FILENAME, scenes_bytes)
+        metadata_path = story_dir / METADATA_FILENAME
+        atomic_write_bytes(metadata_path, header_bytes)
+    BYTES_WRITTEN_TOTAL.inc(len(scenes_bytes) + len(header_bytes))
+    return metadata_path
+
+
+def update_story_header(story_dir: Path, **fields: Any) -> dict[str, Any] | None:
+    """
+    Change fields of a story's header record without rewriting its scenes.
+
+    Callers updating a story that others may edit hold get_story_lock().
+
+    Args:
+        story_dir: Story directory
+        **fields: Header fields to set
+
+    Returns:
+        The updated header, or None if the story has no readable metadata
+    """
+    story_dir = Path(story_dir)
+    if not has_current_sidecar(story_dir):
+        # Legacy sidecar: rewrite it in the current schema
+        story_data = read_story_metadata(story_dir)
+        if story_data is None:
+            return None
+        story_data.update(fields)
+        write_story_metadata(story_data, story_dir)
+        return read_story_header(story_dir)
+
+    header = read_story_header(story_dir)
+    if header is None:
+        # Removed or replaced with something unreadable since the check above
+        return None
+    header.update(fields)
+    header_bytes = _dumps(header)
+    with time_stage("metadata_write"):
+        atomic_write_bytes(story_dir / METADATA_FILENAME, header_bytes)
+    BYTES_WRITTEN_TOTAL.inc(len(header_bytes))
+    return header
+
+
+def read_story_header(story_dir: Path) -> dict[str, Any] | None:
+    """
+    Read only the header record of a story, without its scene text.
+
+    Args:
+        story_dir: Story directory
+
+    Returns:
+        Header dictionary, or None if missing or unreadable
+    """
+    header = _read_json(Path(story_dir) / METADATA_FILENAME)
+    if not isinstance(header, dict):
+        return None
+    if "scenes" in header:
+        # Legacy sidecar with inline scenes
+        scenes = header.pop("scenes") or []
+        header.setdefault("image_count", len([s for s in scenes if s.get("type") == "image"]))
+    return header
+
+
+def read_story_scenes(story_dir: Path) -> list[dict[str, Any]]:
+    """
+    Read the scene list of a story.
+
+    Args:
+        story_dir: Story directory
+
+    Returns:
+        List of scene dictionaries (empty if unavailable)
+    """
+    story_dir = Path(story_dir)
+    scenes_record = _read_json(story_dir / SCENES_FILENAME)
+    if isinstance(scenes_record, dict):
+        return scenes_record.get("scenes", [])
+
+    # Legacy sidecar with inline scenes
+    legacy = _read_json(story_dir / METADATA_FILENAME)
+    if isinstance(legacy, dict):
+        return legacy.get("scenes", [])
+    return []
+
+
+def read_story_metadata(story_dir: Path) -> dict[str, Any] | None:
+    """
+    Read the full story data (header plus scenes) for a story.
+
+    Args:
+        story_dir: Story directory
+
+    Returns:
+        Story data dictionary, or None if missing or unreadable
+    """
+    story_data = _read_json(Path(story_dir) / METADATA_FILENAME)
+    if not isinstance(story_data, dict):
+        return None
+    if "scenes" not in story_data:
+        story_data["scenes"] = read_story_scenes(story_dir)
+    return story_data
+
+
+def has_current_sidecar(story_dir: Path) -> bool:
+    """Check whether a story already has a sidecar in the current schema."""
+    header = read_story_header(story_dir)
+    return bool(header) and header.get("schema_version") == SCHEMA_VERSION
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Production WSGI Entry Point for the Gemini Picture Book Generator Web UI
+
+`app` is a ready-made application for any WSGI server:
+
+    gunicorn -w 4 -k gthread --threads 8 gemini_picturebook_generator.wsgi:app
+
+`gemini-picturebook-server` runs it under gunicorn (optional dependency:
+`uv pip install 'gemini-picturebook-generator[server]'`) configured from the
+environment:
+
+- WEB_BIND: address to listen on (default 0.0.0.0:8080)
+- WEB_WORKERS: worker processes (default 2 x CPUs + 1)
+- WEB_THREADS: threads per worker (default 8)
+- WEB_KEEPALIVE: seconds to hold idle keep-alive connections (default 5)
+- WEB_TIMEOUT: seconds before a stuck worker is restarted (default 120)
+- WEB_GRACEFUL_TIMEOUT: seconds workers get to finish on restart (default 30)
+
+Job status is kept in the file-backed job store, so any worker can answer for
+any job. Workers run the retention garbage collector (see retention.py); when
+launching gunicorn directly, run `gemini-picturebook-gc` from cron instead.
+
+Each worker has its own request limiter; gemini-picturebook-server splits
+GEMINI_RPM evenly between the workers to keep the host within quota (set it
+per worker yourself when launching gunicorn directly).
+
+Identical /generate requests are coalesced onto one job only within a worker
+(see jobs.py): two workers receiving the same request each run a generation.
+Updates of a story's metadata take a file lock in the story directory, so
+concurrent /regenerate requests on different workers are applied in turn.
+
+Author: Assistant
+Date: 2026-10-19
+"""
+
+import os
+import sys
+from typing import Any
+
+from .backends import enable_server_mode
+from .flask_ui import create_app, warm_templates
+from .ratelimit import DEFAULT_RPM
+from .retention import start_background_gc
+
+try:
+    from gunicorn.app.base import BaseApplication
+    GUNICORN_AVAILABLE = True
+except ImportError:
+    GUNICORN_AVAILABLE = False
+
+app = create_app()
+
+
+def get_server_config() -> dict[str, Any]:
+    """
+    Read the server settings from the environment.
+
+    Returns:
+        Gunicorn settings (bind, workers, threads, keepalive, timeouts)
+    """
+    workers = int(os.getenv("WEB_WORKERS", str(2 * (os.cpu_count() or 1) + 1)))
+    threads = int(os.getenv("WEB_THREADS", "8"))
+    return {
+        "bind": os.getenv("WEB_BIND", "0.0.0.0:8080"),
+        "workers": max(1, workers),
+        "threads": max(1, threads),
+        "worker_class": "gthread" if threads > 1 else "sync",
+        "keepalive": int(os.getenv("WEB_KEEPALIVE", "5")),
+        "timeout": int(os.getenv("WEB_TIMEOUT", "120")),
+        "graceful_timeout": int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30")),
+        # Threads do not survive fork, so each worker starts its own collector;
+        # the collection lock lets only one of them run a pass at a time
+        "post_worker_init": lambda worker: start_background_gc(),
+    }
+
+
+def share_request_quota(workers: int):
+    """Give each worker process an equal share of GEMINI_RPM."""
+    rpm = float(os.getenv("GEMINI_RPM", str(DEFAULT_RPM)))
+    if rpm > 0 and workers > 1:
+        os.environ["GEMINI_RPM"] = str(rpm / workers)
+
+
+if GUNICORN_AVAILABLE:
+    class PictureBookServer(BaseApplication):
+        """Gunicorn application serving the web UI with programmatic settings."""
+
+        def __init__(self, application, options: dict[str, Any]):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+
+def main():
+    """Start the web UI under gunicorn with the configured workers and threads."""
+    enable_server_mode()
+    config = get_server_config()
+    share_request_quota(config["workers"])
+    warm_templates(app)
+
+    if not GUNICORN_AVAILABLE:
+        print("❌ gunicorn is not installed.")
+        print("   Install with: uv pip install 'gemini-picturebook-generator[server]'")
+        print("   Or run any WSGI server with: gemini_picturebook_generator.wsgi:app")
+        sys.exit(1)
+
+    print(f"🚀 Serving AI Story Generator on {config['bind']}")
+    print(f"⚙️  {config['workers']} workers x {config['threads']} threads, "
+          f"keep-alive {config['keepalive']}s, timeout {config['timeout']}s")
+    PictureBookServer(app, config).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,49 +7,40 @@ This script helps regenerate PDFs for existing stories with enhanced formatting.
 Usage:
     python3 regenerate_pdfs.py                    # Process all stories
     python3 regenerate_pdfs.py <story_directory>  # Process specific story
+    python3 regenerate_pdfs.py --backfill-sidecars  # Write metadata sidecars for legacy stories
 
 Author: Assistant
 Date: 2025-05-28
 """
 
 import sys
-import json
 from pathlib import Path
-from enhanced_pdf_generator import regenerate_existing_story_pdf
+from enhanced_pdf_generator import backfill_story_sidecar, regenerate_existing_story_pdf
+from gemini_picturebook_generator.catalog import get_stories_dir, iter_story_dirs
+from gemini_picturebook_generator.story_metadata import read_story_header
 
 
 def find_all_stories():
-    """Find all story directories."""
-    project_dir = Path(__file__).parent
-    stories_dir = project_dir / "generated_stories"
+    """Find all story directories, sharded and legacy, oldest first."""
+    stories_dir = get_stories_dir()
     
     if not stories_dir.exists():
-        print("❌ No generated_stories directory found")
+        print(f"❌ No stories directory found at {stories_dir}")
         return []
     
-    story_dirs = []
-    for story_dir in stories_dir.glob("story_*"):
-        if story_dir.is_dir():
-            story_dirs.append(story_dir)
-    
-    return sorted(story_dirs)
+    return list(iter_story_dirs(newest_first=False))
 
 
 def get_story_info(story_dir):
     """Get basic info about a story."""
-    metadata_file = story_dir / "story_metadata.json"
-    
-    if metadata_file.exists():
-        try:
-            with open(metadata_file, 'r') as f:
-                data = json.load(f)
-            return {
-                'title': data.get('original_prompt', 'Unknown')[:50],
-                'scenes': data.get('num_scenes', 'Unknown'),
-                'generated': data.get('generated_at', 'Unknown')[:19].replace('T', ' ')
-            }
-        except:
-            pass
+    data = read_story_header(story_dir)
+
+    if data:
+        return {
+            'title': data.get('original_prompt', 'Unknown')[:50],
+            'scenes': data.get('num_scenes', 'Unknown'),
+            'generated': data.get('generated_at', 'Unknown')[:19].replace('T', ' ')
+        }
     
     # Fallback info
     scene_count = len(list(story_dir.glob("scene_*.png")))
@@ -97,6 +88,31 @@ def regenerate_all_stories():
         print("🎉 Enhanced PDFs are ready with better page formatting!")
 
 
+def backfill_all_sidecars():
+    """Write canonical metadata sidecars for every story that lacks one."""
+    story_dirs = find_all_stories()
+
+    if not story_dirs:
+        print("📭 No stories found to migrate")
+        return
+
+    print(f"🔍 Checking {len(story_dirs)} stories for metadata sidecars")
+    counts = {"current": 0, "upgraded": 0, "reconstructed": 0, "failed": 0}
+
+    for story_dir in story_dirs:
+        try:
+            action = backfill_story_sidecar(story_dir)
+            if action != "current":
+                print(f"   💾 {story_dir.name}: {action}")
+            counts[action] += 1
+        except Exception as e:
+            print(f"   ❌ {story_dir.name}: {e}")
+            counts["failed"] += 1
+
+    print(f"📈 Summary: {counts['current']} already current, {counts['upgraded']} upgraded, "
+          f"{counts['reconstructed']} reconstructed from HTML, {counts['failed']} failed")
+
+
 def regenerate_single_story(story_path):
     """Regenerate PDF for a single story."""
     story_dir = Path(story_path)
@@ -127,6 +143,10 @@ def main():
     print("🔧 PDF Regenerator for AI Story Generator")
     print("=" * 50)
     
+    if len(sys.argv) > 1 and sys.argv[1] == "--backfill-sidecars":
+        backfill_all_sidecars()
+        return
+
     if len(sys.argv) > 1:
         # Process specific story
         story_path = sys.argv[1]
@@ -0,0 +1,176 @@
+"""
+Tests for archiving cold stories into packs, restoring them and compaction.
+"""
+
+import os
+import time
+
+import pytest
+
+from gemini_picturebook_generator import archive
+from gemini_picturebook_generator.archive import (
+    archive_stories,
+    compact_packs,
+    delete_archived_story,
+    is_archived,
+    pack_usage,
+    read_archived_asset,
+    read_archived_file,
+    read_archived_metadata,
+    restore_story,
+)
+from gemini_picturebook_generator.catalog import create_story_dir, find_story_dir
+from gemini_picturebook_generator.story_metadata import (
+    METADATA_FILENAME,
+    write_story_metadata,
+)
+
+IMAGE = b"\x89PNG" + bytes(range(256)) * 40
+
+
+@pytest.fixture
+def stories_dir(tmp_path, monkeypatch):
+    root = tmp_path / "stories"
+    root.mkdir()
+    monkeypatch.setenv("OUTPUT_DIR", str(root))
+    # Reads would otherwise restore stories in the background
+    monkeypatch.setenv("ARCHIVE_PROMOTE_HITS", "0")
+    return root
+
+
+def make_story(prompt="A fox in the snow"):
+    story_id, story_dir = create_story_dir()
+    (story_dir / "scene_01.png").write_bytes(IMAGE)
+    write_story_metadata({
+        "id": story_id,
+        "original_prompt": prompt,
+        "scenes": [
+            {"type": "text", "content": "Once upon a time", "scene_number": 1},
+            {"type": "image", "filename": "scene_01.png", "scene_number": 1},
+        ],
+    }, story_dir)
+    stamp = time.time() - 90 * 86400
+    for path in [*story_dir.iterdir(), story_dir]:
+        os.utime(path, (stamp, stamp))
+    return story_dir
+
+
+def snapshot(story_dir):
+    return {p.name: (p.read_bytes(), p.stat().st_mtime_ns) for p in story_dir.iterdir()}
+
+
+def test_dry_run_archives_nothing(stories_dir):
+    story_dir = make_story()
+
+    counts = archive_stories(min_age_days=0, dry_run=True)
+
+    assert counts["stories"] == 1
+    assert counts["files"] == len(list(story_dir.iterdir()))
+    assert story_dir.is_dir() and not is_archived(story_dir.name)
+
+
+def test_recent_stories_stay_hot(stories_dir):
+    # Created today, however old its files look
+    story_dir = make_story()
+
+    assert archive_stories(min_age_days=1)["stories"] == 0
+    assert story_dir.is_dir()
+
+
+def test_archived_files_are_read_from_the_pack(stories_dir):
+    story_dir = make_story()
+    before = snapshot(story_dir)
+
+    counts = archive_stories(min_age_days=0)
+
+    assert counts["stories"] == 1
+    assert counts["bytes_packed"] < counts["bytes_before"]
+    assert not story_dir.exists() and is_archived(story_dir.name)
+    assert read_archived_file(story_dir.name, "scene_01.png") == IMAGE
+    assert read_archived_file(story_dir.name, "missing.png") is None
+    data, info = read_archived_asset(f"{story_dir.name}/scene_01.png")
+    assert data == IMAGE
+    assert info == {"name": "scene_01.png", "size": len(IMAGE), "mtime_ns": before["scene_01.png"][1]}
+    assert read_archived_metadata(story_dir.name)["scenes"][1]["filename"] == "scene_01.png"
+    # Reads do not restore the story
+    assert not story_dir.exists()
+
+
+def test_restore_round_trip_keeps_contents_and_times(stories_dir):
+    story_dir = make_story()
+    before = snapshot(story_dir)
+    archive_stories(min_age_days=0)
+
+    assert restore_story(story_dir.name) == story_dir
+
+    assert snapshot(story_dir) == before
+    assert not is_archived(story_dir.name)
+    assert restore_story(story_dir.name) is None
+
+
+def test_find_story_dir_restores_archived_stories(stories_dir):
+    story_dir = make_story()
+    archive_stories(min_age_days=0)
+
+    assert find_story_dir(story_dir.name, fetch=False) is None
+    assert find_story_dir(story_dir.name) == story_dir
+    assert (story_dir / METADATA_FILENAME).exists()
+
+
+def test_deleted_and_restored_stories_are_compacted_away(stories_dir):
+    kept, restored, deleted = make_story("kept"), make_story("restored"), make_story("deleted")
+    archive_stories(min_age_days=0)
+    used = pack_usage()
+    assert used["live_bytes"] == used["pack_bytes"]
+
+    restore_story(restored.name)
+    assert delete_archived_story(deleted.name) > 0
+    assert delete_archived_story(deleted.name) == 0
+    assert not is_archived(deleted.name)
+    freed = pack_usage()["pack_bytes"] - pack_usage()["live_bytes"]
+
+    assert compact_packs(min_live_fraction=0.9, dry_run=True) == {"packs": 1, "bytes_freed": freed}
+    assert compact_packs(min_live_fraction=0.9) == {"packs": 1, "bytes_freed": freed}
+
+    used = pack_usage()
+    assert used["live_bytes"] == used["pack_bytes"]
+    assert read_archived_file(kept.name, "scene_01.png") == IMAGE
+    assert compact_packs(min_live_fraction=0.9)["packs"] == 0
+
+
+def test_emptied_packs_and_packs_without_an_index_are_deleted(stories_dir):
+    story_dir = make_story()
+    archive_stories(min_age_days=0)
+    restore_story(story_dir.name)
+    # A pack written by an archive run that was interrupted before its index
+    (archive.get_archive_dir() / f"pack-interrupted{archive.PACK_SUFFIX}").write_bytes(b"x" * 100)
+
+    assert compact_packs()["packs"] == 1
+    assert pack_usage() == {"pack_bytes": 0, "live_bytes": 0}
+    assert [p.name for p in archive.get_archive_dir().iterdir() if not p.name.endswith(".lock")] == []
+
+
+def test_stories_changed_while_packed_stay_hot(stories_dir, monkeypatch):
+    during_pack, untouched, before_delete = make_story("a"), make_story("b"), make_story("c")
+    pack_story, remove_packed_story = archive._pack_story, archive._remove_packed_story
+
+    def pack(pack_file, story_dir):
+        entry = pack_story(pack_file, story_dir)
+        if story_dir == during_pack:
+            (story_dir / "scene_02.png").write_bytes(IMAGE)
+        return entry
+
+    def remove(story_dir, modified):
+        if story_dir == before_delete:
+            (story_dir / "export.zip").write_bytes(b"zip")
+        return remove_packed_story(story_dir, modified)
+
+    monkeypatch.setattr(archive, "_pack_story", pack)
+    monkeypatch.setattr(archive, "_remove_packed_story", remove)
+
+    assert archive_stories(min_age_days=0)["stories"] == 1
+
+    assert is_archived(untouched.name) and not untouched.exists()
+    assert not is_archived(during_pack.name) and (during_pack / "scene_02.png").exists()
+    assert not is_archived(before_delete.name) and (before_delete / "export.zip").exists()
+    assert not any(p.name.startswith(".") for p in before_delete.parent.iterdir())
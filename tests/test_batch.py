@@ -0,0 +1,28 @@
+"""
+Tests for batch generation from a spec file.
+"""
+
+import json
+
+from gemini_picturebook_generator.batch import run_batch
+
+
+def read_results(results_path):
+    return [json.loads(line) for line in results_path.read_text().splitlines()]
+
+
+def test_rerun_records_invalid_lines_once(tmp_path, monkeypatch):
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "stories"))
+    spec_path = tmp_path / "specs.jsonl"
+    spec_path.write_text('{"id": "fox", "prompt": "A fox"}\n{"scenes": 3}\nnot json\n')
+    results_path = tmp_path / "results.jsonl"
+    # The valid spec is already done, so no story is generated
+    results_path.write_text(json.dumps({"spec_id": "fox", "status": "ok"}) + "\n")
+
+    for _ in range(2):
+        counts = run_batch(spec_path, results_path)
+        assert counts == {"ok": 0, "failed": 0, "invalid": 2, "skipped": 1}
+
+    results = read_results(results_path)
+    assert [r["spec_id"] for r in results] == ["fox", "line-2", "line-3"]
+    assert all(r["status"] == "invalid" for r in results[1:])
@@ -0,0 +1,128 @@
+"""
+Tests for story IDs, the sharded story layout and the layout migration.
+"""
+
+import os
+import re
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from gemini_picturebook_generator.catalog import (
+    find_story_asset,
+    find_story_dir,
+    iter_story_dirs,
+    new_story_id,
+    story_bucket,
+    story_created_at,
+    story_path,
+)
+from gemini_picturebook_generator.migrate_layout import migrate_story_layout
+from gemini_picturebook_generator.story_metadata import write_story_metadata
+
+LEGACY_ID = "story_20240102_030405"
+
+
+@pytest.fixture
+def stories_dir(tmp_path, monkeypatch):
+    root = tmp_path / "stories"
+    root.mkdir()
+    monkeypatch.setenv("OUTPUT_DIR", str(root))
+    return root
+
+
+def make_legacy_story(root, name=LEGACY_ID, story_id=None, age=3600):
+    story_dir = root / name
+    story_dir.mkdir()
+    write_story_metadata({"id": story_id or name, "original_prompt": "A fox", "scenes": []}, story_dir)
+    (story_dir / "scene_01.png").write_bytes(b"\x89PNG fake image")
+    stamp = time.time() - age
+    for path in [*story_dir.iterdir(), story_dir]:
+        os.utime(path, (stamp, stamp))
+    return story_dir
+
+
+def test_new_ids_are_ulids_that_sort_by_creation():
+    ids = [new_story_id() for _ in range(1000)]
+
+    assert all(re.fullmatch(r"story_[0-9A-HJKMNP-TV-Z]{26}", story_id) for story_id in ids)
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+
+
+def test_ids_encode_their_creation_time():
+    before = datetime.now(timezone.utc).replace(microsecond=0)
+    created = story_created_at(new_story_id())
+
+    assert before <= created <= datetime.now(timezone.utc)
+    assert story_created_at(LEGACY_ID) == datetime(2024, 1, 2, 3, 4, 5)
+    assert story_created_at("story_unknown") is None
+
+
+def test_story_path_is_sharded_by_date_and_hash(stories_dir):
+    story_id = new_story_id()
+    date_bucket, shard = story_bucket(story_id).split("/")
+
+    assert date_bucket == story_created_at(story_id).strftime("%Y-%m-%d")
+    assert re.fullmatch(r"[0-9a-f]{2}", shard)
+    assert story_path(story_id) == stories_dir / date_bucket / shard / story_id
+    assert story_bucket("story_unknown").startswith("undated/")
+    with pytest.raises(ValueError):
+        story_path("../etc")
+
+
+def test_find_story_dir_in_sharded_and_legacy_layouts(stories_dir):
+    story_id = new_story_id()
+    story_dir = story_path(story_id)
+    story_dir.mkdir(parents=True)
+    legacy_dir = make_legacy_story(stories_dir)
+    # Older web UI jobs were saved under a folder name other than their ID
+    renamed_dir = make_legacy_story(stories_dir, "story_20240101_000000", story_id="job-1234")
+
+    assert find_story_dir(story_id) == story_dir
+    assert find_story_dir(LEGACY_ID) == legacy_dir
+    assert find_story_dir("job-1234") == renamed_dir
+    assert find_story_dir("story_01JAB3X6T3R2V8Y0Q9KZ4M5N7P", fetch=False) is None
+    assert find_story_dir("../stories", fetch=False) is None
+
+
+def test_iter_story_dirs_lists_sharded_then_legacy_stories(stories_dir):
+    older, newer = new_story_id(), new_story_id()
+    for story_id in (newer, older):
+        story_path(story_id).mkdir(parents=True)
+    legacy_dir = make_legacy_story(stories_dir)
+
+    assert list(iter_story_dirs()) == [story_path(newer), story_path(older), legacy_dir]
+    assert list(iter_story_dirs(newest_first=False)) == [story_path(older), story_path(newer), legacy_dir]
+
+
+def test_bare_asset_paths_resolve_in_legacy_stories_only(stories_dir):
+    story_id = new_story_id()
+    story_path(story_id).mkdir(parents=True)
+    (story_path(story_id) / "scene_02.png").write_bytes(b"sharded")
+    legacy_dir = make_legacy_story(stories_dir)
+
+    assert find_story_asset("scene_01.png") == legacy_dir / "scene_01.png"
+    assert find_story_asset("scene_02.png") is None
+    assert find_story_asset(f"{story_id}/scene_02.png") == story_path(story_id) / "scene_02.png"
+
+
+def test_migration_moves_legacy_stories_into_buckets(stories_dir):
+    legacy_dir = make_legacy_story(stories_dir)
+    busy_dir = make_legacy_story(stories_dir, "story_20240103_000000", age=0)
+
+    assert migrate_story_layout(dry_run=True) == {"moved": 1, "busy": 1, "conflict": 0, "failed": 0}
+    assert legacy_dir.is_dir()
+
+    assert migrate_story_layout()["moved"] == 1
+    assert not legacy_dir.exists()
+    assert busy_dir.is_dir()
+    migrated = story_path(LEGACY_ID)
+    assert (migrated / "scene_01.png").read_bytes() == b"\x89PNG fake image"
+    assert find_story_dir(LEGACY_ID) == migrated
+
+    # Interrupted and rerun: nothing left to move, a clash is left in place
+    assert migrate_story_layout(min_age=0)["moved"] == 1
+    make_legacy_story(stories_dir)
+    assert migrate_story_layout() == {"moved": 0, "busy": 0, "conflict": 1, "failed": 0}
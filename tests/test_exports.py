@@ -0,0 +1,115 @@
+"""
+Tests for on-demand story exports.
+"""
+
+import re
+import subprocess
+import sys
+import zipfile
+from datetime import datetime, timezone
+
+import pytest
+
+from gemini_picturebook_generator import exports, story_metadata
+from gemini_picturebook_generator.catalog import create_story_dir
+from gemini_picturebook_generator.story_metadata import write_story_metadata
+
+HOLD_LOCK = """
+import sys
+from pathlib import Path
+from gemini_picturebook_generator.exports import _get_build_lock
+with _get_build_lock(Path(sys.argv[1]), "zip"):
+    print("locked", flush=True)
+    sys.stdin.read()
+"""
+
+
+@pytest.fixture
+def story_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "stories"))
+    story_id, story_dir = create_story_dir()
+    (story_dir / "scene_01.png").write_bytes(b"\x89PNG fake image")
+    write_story_metadata({
+        "id": story_id,
+        "original_prompt": "A fox in the snow",
+        "generated_at": "2026-10-19T12:00:00",
+        "model": "gemini-2.0-flash-preview-image-generation",
+        "scenes": [
+            {"type": "text", "content": "Once upon a time", "scene_number": 1},
+            {"type": "image", "filename": "scene_01.png", "scene_number": 1},
+        ],
+    }, story_dir)
+    return story_dir
+
+
+def test_export_is_built_once_and_cached(story_dir):
+    path = exports.get_export(story_dir, "zip")
+
+    assert zipfile.ZipFile(path).namelist() == ["scene_01.png", "story_metadata.json"]
+    assert exports.get_export(story_dir, "zip") == path
+    assert exports.current_exports(story_dir) == {"zip": path.name}
+    assert not list(story_dir.glob("*.tmp"))
+
+
+def test_html_export_is_written_atomically(story_dir):
+    path = exports.get_export(story_dir, "html")
+
+    assert "A fox in the snow" in path.read_text(encoding="utf-8")
+    assert not list(story_dir.glob("*.tmp"))
+
+
+def test_failed_zip_write_leaves_no_temp_file(story_dir):
+    def write_entries(archive):
+        archive.writestr("partial", "data")
+        raise RuntimeError("disk full")
+
+    with pytest.raises(RuntimeError):
+        exports._write_zip_atomically(story_dir / "book.zip", write_entries)
+
+    assert not (story_dir / "book.zip").exists()
+    assert not list(story_dir.glob("*.tmp"))
+
+
+def test_epub_modified_time_is_utc(story_dir):
+    before = datetime.now(timezone.utc).replace(microsecond=0)
+    path = exports.get_export(story_dir, "epub")
+
+    opf = zipfile.ZipFile(path).read("OEBPS/content.opf").decode()
+    stamp = re.search(r'property="dcterms:modified">([^<]+)<', opf).group(1)
+    modified = datetime.strptime(stamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    assert before <= modified <= datetime.now(timezone.utc)
+
+
+@pytest.mark.skipif(not story_metadata.FCNTL_AVAILABLE, reason="needs fcntl")
+def test_prune_skips_a_story_built_by_another_process(story_dir):
+    path = exports.get_export(story_dir, "zip")
+    (story_dir / "scene_01.png").write_bytes(b"\x89PNG redrawn image")
+
+    holder = subprocess.Popen(
+        [sys.executable, "-c", HOLD_LOCK, str(story_dir)],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        assert holder.stdout.readline().strip() == "locked"
+        assert exports.prune_stale_exports(story_dir) == []
+        assert path.exists()
+    finally:
+        holder.communicate("")
+
+    assert exports.prune_stale_exports(story_dir) == [path]
+    assert not path.exists()
+    assert exports.current_exports(story_dir) == {}
+
+
+def test_forget_build_locks_removes_lock_files(story_dir):
+    exports.get_export(story_dir, "zip")
+    locks_dir = exports._get_locks_dir(story_dir)
+    assert (locks_dir / "zip.lock").exists()
+
+    exports.forget_build_locks()
+    assert (locks_dir / "zip.lock").exists()
+
+    story_dir.rename(story_dir.with_name("gone"))
+    exports.forget_build_locks()
+    assert not locks_dir.exists()
+    assert list((story_dir.parents[2] / exports.LOCKS_DIRNAME).iterdir()) == []
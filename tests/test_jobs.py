@@ -0,0 +1,92 @@
+"""
+Tests for coalescing identical in-flight generations.
+"""
+
+import threading
+
+import pytest
+
+from gemini_picturebook_generator.jobs import SingleFlight, generation_key
+
+
+def test_generation_key_ignores_case_and_spacing():
+    key = generation_key("A fox  in the snow", 4, "Fox", "", "cartoon")
+
+    assert generation_key(" a fox in the SNOW ", 4, "fox", "", "Cartoon") == key
+    assert generation_key("A fox in the snow", 5, "Fox", "", "cartoon") != key
+    assert generation_key("A fox in the snow", 4, "Fox", "", "watercolor") != key
+
+
+def test_identical_requests_join_the_running_flight():
+    registry = SingleFlight()
+
+    leader, is_leader = registry.join("key", "job-1")
+    follower, follower_is_leader = registry.join("key", "job-2")
+
+    assert is_leader and not follower_is_leader
+    assert follower is leader
+    assert leader.job_id == "job-1"
+    assert leader.followers == 1
+    assert registry.get("job-1") is leader
+    assert registry.join("other", "job-3")[1]
+
+
+def test_followers_replay_past_events_then_receive_new_ones():
+    registry = SingleFlight()
+    flight, _ = registry.join("key", "job-1")
+    flight.publish({"event": "started"})
+
+    received = []
+    flight.subscribe(received.append)
+    flight.publish({"event": "scene_image"})
+
+    assert [event["event"] for event in received] == ["started", "scene_image"]
+    assert flight.last_event == {"event": "scene_image"}
+
+
+def test_finish_releases_waiters_and_stops_coalescing():
+    registry = SingleFlight()
+    flight, _ = registry.join("key", "job-1")
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(flight.wait(timeout=5)))
+    waiter.start()
+
+    registry.finish(flight, result={"id": "job-1"})
+    waiter.join(timeout=5)
+
+    assert results == [{"id": "job-1"}]
+    assert flight.done
+    assert registry.get("job-1") is None
+    # A later identical request starts a new job
+    next_flight, is_leader = registry.join("key", "job-2")
+    assert is_leader and next_flight is not flight
+
+
+def test_failed_flight_raises_for_followers():
+    registry = SingleFlight()
+    flight, _ = registry.join("key", "job-1")
+
+    class Follower:
+        """A progress queue: receives events and is closed when the job ends."""
+
+        def __init__(self):
+            self.events = []
+            self.closed = False
+
+        def __call__(self, event):
+            self.events.append(event)
+
+        def close(self):
+            self.closed = True
+
+    follower = Follower()
+    flight.subscribe(follower)
+    flight.publish({"event": "failed"})
+    registry.finish(flight, error="quota exhausted")
+
+    assert follower.events == [{"event": "failed"}]
+    assert follower.closed
+    with pytest.raises(RuntimeError, match="quota exhausted"):
+        flight.wait()
+    with pytest.raises(TimeoutError):
+        registry.join("other", "job-2")[0].wait(timeout=0.01)
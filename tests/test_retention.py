@@ -0,0 +1,159 @@
+"""
+Tests for retention policies and garbage collection.
+"""
+
+import os
+import time
+
+import pytest
+
+from gemini_picturebook_generator import exports, retention
+from gemini_picturebook_generator.catalog import (
+    create_story_dir,
+    iter_story_dirs,
+    story_path,
+)
+from gemini_picturebook_generator.job_store import get_job_store
+from gemini_picturebook_generator.retention import (
+    RetentionPolicy,
+    collect_garbage,
+    set_story_pinned,
+)
+from gemini_picturebook_generator.story_metadata import (
+    update_story_header,
+    write_story_metadata,
+)
+
+
+@pytest.fixture
+def stories_dir(tmp_path, monkeypatch):
+    root = tmp_path / "stories"
+    root.mkdir()
+    monkeypatch.setenv("OUTPUT_DIR", str(root))
+    return root
+
+
+def make_story(story_id=None):
+    story_id, story_dir = create_story_dir(story_id)
+    (story_dir / "scene_01.png").write_bytes(b"\x89PNG" + b"\0" * 1000)
+    write_story_metadata({
+        "id": story_id,
+        "original_prompt": f"A fox {story_id}",
+        "scenes": [{"type": "image", "filename": "scene_01.png", "scene_number": 1}],
+    }, story_dir)
+    return story_dir
+
+
+def age(path, days):
+    stamp = time.time() - days * 86400
+    for p in [*path.iterdir(), path]:
+        os.utime(p, (stamp, stamp))
+
+
+def names(story_dirs):
+    return [d.name for d in story_dirs]
+
+
+def test_expired_stories_are_deleted_unless_pinned(stories_dir):
+    expired = make_story("story_20200101_000000")
+    pinned = make_story("story_20200102_000000")
+    recent = make_story()
+    set_story_pinned(pinned.name)
+
+    counts = collect_garbage(RetentionPolicy(max_age_days=365))
+
+    assert counts["expired"] == 1
+    assert not expired.exists()
+    assert names(iter_story_dirs()) == [recent.name, pinned.name]
+
+
+def test_oldest_unpinned_stories_are_evicted_first(stories_dir):
+    pinned = make_story("story_20200101_000000")
+    set_story_pinned(pinned.name)
+    stories = [make_story() for _ in range(4)]
+
+    counts = collect_garbage(RetentionPolicy(max_stories=2))
+
+    assert counts["evicted"] == 2
+    assert names(iter_story_dirs()) == [stories[3].name, stories[2].name, pinned.name]
+
+
+def test_size_quota_counts_pinned_stories(stories_dir):
+    pinned = make_story("story_20200101_000000")
+    set_story_pinned(pinned.name)
+    stories = [make_story() for _ in range(3)]
+    size = retention._story_size(stories[0])
+
+    counts = collect_garbage(RetentionPolicy(max_bytes=2 * size + size // 2))
+
+    assert counts["evicted"] == 2
+    assert counts["bytes_freed"] == 2 * size
+    assert names(iter_story_dirs()) == [stories[2].name, pinned.name]
+
+
+def test_orphans_are_removed_once_abandoned(stories_dir):
+    _, orphan = create_story_dir()
+    (orphan / "scene_01.png").write_bytes(b"partial")
+    age(orphan, 3)
+    _, fresh = create_story_dir()
+    _, running = create_story_dir()
+    age(running, 3)
+    get_job_store().put(running.name, {"status": "generating"})
+
+    counts = collect_garbage(RetentionPolicy())
+
+    assert counts["orphans"] == 1
+    assert not orphan.exists()
+    assert fresh.exists() and running.exists()
+
+
+def test_stale_exports_and_leftovers_are_removed(stories_dir):
+    story_dir = make_story()
+    stale = exports.get_export(story_dir, "zip")
+    time.sleep(0.01)
+    update_story_header(story_dir, style="watercolor")
+    (story_dir / "book_print.html").write_text("old print copy")
+
+    counts = collect_garbage(RetentionPolicy())
+
+    assert counts["files"] == 2
+    assert not stale.exists()
+    assert not (story_dir / "book_print.html").exists()
+    assert exports.current_exports(story_dir) == {}
+
+
+def test_dry_run_only_counts(stories_dir):
+    expired = make_story("story_20200101_000000")
+    stories = [make_story() for _ in range(3)]
+    _, orphan = create_story_dir()
+    age(orphan, 3)
+    policy = RetentionPolicy(max_age_days=365, max_stories=1)
+
+    dry = collect_garbage(policy, dry_run=True)
+
+    assert (dry["expired"], dry["evicted"], dry["orphans"]) == (1, 2, 1)
+    assert dry["bytes_freed"] > 0
+    assert all(d.exists() for d in [expired, orphan, *stories])
+
+    counts = collect_garbage(policy)
+    assert {key: counts[key] for key in ("expired", "evicted", "orphans", "bytes_freed")} == {
+        key: dry[key] for key in ("expired", "evicted", "orphans", "bytes_freed")
+    }
+    assert names(iter_story_dirs()) == [stories[2].name]
+
+
+def test_collection_is_skipped_while_another_pass_runs(stories_dir):
+    with retention._gc_lock(stories_dir) as acquired:
+        assert acquired
+        if retention.FCNTL_AVAILABLE:
+            # flock is per open file, so a second open conflicts like another process
+            with retention._gc_lock(stories_dir) as second:
+                assert not second
+
+
+def test_deleted_stories_leave_no_empty_buckets(stories_dir):
+    story_dir = make_story("story_20200101_000000")
+
+    collect_garbage(RetentionPolicy(max_age_days=365))
+
+    assert not story_path(story_dir.name).parent.exists()
@@ -0,0 +1,163 @@
+"""
+Tests for retrying model calls and the shared request rate limiter.
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from gemini_picturebook_generator import enhanced_story_generator, retry
+from gemini_picturebook_generator.ratelimit import RateLimitTimeout, TokenBucket
+from gemini_picturebook_generator.retry import (
+    FATAL,
+    RATE_LIMITED,
+    TRANSIENT,
+    RetryBudget,
+    RetryPolicy,
+    call_with_retry,
+    classify_error,
+    get_retry_after,
+)
+
+
+class APIError(Exception):
+    """A model error carrying an HTTP status code, like google.genai's."""
+
+    def __init__(self, code, message="", retry_after=None):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        if retry_after is not None:
+            self.retry_after = retry_after
+
+
+def flaky(*errors, result="ok"):
+    """A request that raises the given errors in turn, then succeeds."""
+    calls = []
+
+    def request():
+        calls.append(time.monotonic())
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return request, calls
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(retry.time, "sleep", delays.append)
+    return delays
+
+
+def test_errors_are_classified():
+    assert classify_error(APIError(429, "RESOURCE_EXHAUSTED")) == RATE_LIMITED
+    assert classify_error(APIError(503, "UNAVAILABLE")) == TRANSIENT
+    assert classify_error(TimeoutError("read timed out")) == TRANSIENT
+    assert classify_error(APIError(400, "INVALID_ARGUMENT")) == FATAL
+
+
+def test_retry_after_is_read_from_attribute_header_and_details():
+    assert get_retry_after(APIError(429, retry_after=7)) == 7.0
+
+    error = APIError(429)
+    error.response = SimpleNamespace(headers={"Retry-After": "12"})
+    assert get_retry_after(error) == 12.0
+
+    details = "429 RESOURCE_EXHAUSTED {'@type': 'RetryInfo', 'retryDelay': '23s'}"
+    assert get_retry_after(Exception(details)) == 23.0
+    assert get_retry_after(APIError(503)) is None
+
+
+def test_transient_errors_are_retried_with_backoff(sleeps):
+    request, calls = flaky(APIError(503, "UNAVAILABLE"), APIError(500))
+    policy = RetryPolicy(max_retries=5, base_delay=1, max_delay=60)
+
+    assert call_with_retry(request, policy=policy) == "ok"
+
+    assert len(calls) == 3
+    assert 0 <= sleeps[0] <= 1
+    assert 0 <= sleeps[1] <= 2
+
+
+def test_retry_after_sets_a_floor_under_the_backoff_and_pauses_the_limiter(sleeps):
+    request, _ = flaky(APIError(429, "RESOURCE_EXHAUSTED", retry_after=30))
+    limiter = SimpleNamespace(acquired=0, paused=[])
+    limiter.acquire = lambda: setattr(limiter, "acquired", limiter.acquired + 1)
+    limiter.pause = limiter.paused.append
+    retries = []
+
+    call_with_retry(
+        request, policy=RetryPolicy(base_delay=1), limiter=limiter,
+        on_retry=lambda attempt, delay, error, kind: retries.append((attempt, delay, kind)),
+    )
+
+    assert sleeps == [30.0]
+    assert retries == [(1, 30.0, RATE_LIMITED)]
+    assert limiter.paused == [30.0]
+    assert limiter.acquired == 2
+
+
+def test_fatal_errors_and_exhausted_retries_raise(sleeps):
+    request, calls = flaky(APIError(400, "INVALID_ARGUMENT"))
+    with pytest.raises(APIError):
+        call_with_retry(request, policy=RetryPolicy())
+    assert len(calls) == 1
+
+    request, calls = flaky(*[APIError(503)] * 3)
+    with pytest.raises(APIError):
+        call_with_retry(request, policy=RetryPolicy(max_retries=2))
+    assert len(calls) == 3
+
+
+def test_retry_budget_stops_retries_during_an_outage(sleeps):
+    budget = RetryBudget(ratio=0.5, max_tokens=2)
+    policy = RetryPolicy(max_retries=10, budget=budget)
+    request, calls = flaky(*[APIError(503)] * 10)
+
+    with pytest.raises(APIError):
+        call_with_retry(request, policy=policy)
+    assert len(calls) == 3
+
+    # Successes earn retries back
+    call_with_retry(lambda: "ok", policy=policy)
+    call_with_retry(lambda: "ok", policy=policy)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(rate_per_minute=600, burst=2)
+
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert 0 < bucket.try_acquire() <= 0.1
+
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.05
+
+
+def test_token_bucket_pause_and_timeout():
+    bucket = TokenBucket(rate_per_minute=0)
+    assert bucket.unlimited
+    assert bucket.try_acquire() == 0
+
+    bucket.pause(10)
+    assert bucket.available() == 0
+    with pytest.raises(RateLimitTimeout):
+        bucket.acquire(timeout=0.01)
+
+
+def test_api_connection_check_is_retried(sleeps, monkeypatch):
+    response = SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text="Hello")]))])
+    request, calls = flaky(APIError(503, "UNAVAILABLE"), result=response)
+    client = SimpleNamespace(
+        paces_requests=True,
+        models=SimpleNamespace(generate_content=lambda **kwargs: request()),
+    )
+    monkeypatch.setattr(enhanced_story_generator, "setup_client", lambda: client)
+
+    assert enhanced_story_generator.test_api_connection()
+    assert len(calls) == 2
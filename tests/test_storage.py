@@ -0,0 +1,184 @@
+"""
+Tests for the story storage backends, against an in-memory S3 stand-in.
+"""
+
+import shutil
+import time
+
+import pytest
+
+from gemini_picturebook_generator import storage
+from gemini_picturebook_generator.catalog import create_story_dir, story_path
+
+
+class FakeS3Error(Exception):
+    """Mimics botocore's ClientError, which carries the error code in .response."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3Client:
+    """The subset of the boto3 S3 client S3Storage uses, backed by a dict."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def upload_file(self, filename, bucket, key, ExtraArgs=None, Config=None):
+        with open(filename, "rb") as f:
+            self.objects[(bucket, key)] = f.read()
+
+    def download_file(self, bucket, key, filename, Config=None):
+        if (bucket, key) not in self.objects:
+            raise FakeS3Error("404")
+        with open(filename, "wb") as f:
+            f.write(self.objects[(bucket, key)])
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error("404")
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def get_paginator(self, operation):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                keys = sorted(key for bucket, key in client.objects if bucket == Bucket and key.startswith(Prefix))
+                yield {"Contents": [{"Key": key} for key in keys]}
+
+        return Paginator()
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete["Objects"]:
+            self.objects.pop((Bucket, item["Key"]), None)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+@pytest.fixture
+def stories_dir(tmp_path, monkeypatch):
+    root = tmp_path / "stories"
+    monkeypatch.setenv("OUTPUT_DIR", str(root))
+    return root
+
+
+@pytest.fixture
+def s3(stories_dir):
+    client = FakeS3Client()
+    storage.set_storage(storage.S3Storage("pbooks", prefix="books", client=client))
+    yield client
+    storage.set_storage(None)
+
+
+def make_story():
+    story_id, story_dir = create_story_dir()
+    (story_dir / "story_metadata.json").write_text('{"original_prompt": "A fox"}')
+    (story_dir / "scene_01.png").write_bytes(b"\x89PNG fake image")
+    (story_dir / ".exports.json").write_text("{}")
+    return story_id, story_dir
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_incomplete_backend_fails_on_instantiation():
+    class Incomplete(storage.StorageBackend):
+        def put_file(self, key, path):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_publish_skips_dotfiles_and_uses_story_keys(s3):
+    story_id, story_dir = make_story()
+
+    assert storage.publish_story(story_dir) == 2
+    prefix = f"books/{storage.story_key(story_id)}/"
+    assert sorted(key for _, key in s3.objects) == [prefix + "scene_01.png", prefix + "story_metadata.json"]
+
+
+def test_fetch_story_on_another_node(s3, stories_dir):
+    story_id, story_dir = make_story()
+    storage.publish_story(story_dir)
+    shutil.rmtree(story_dir)
+
+    fetched = storage.fetch_story(story_id)
+
+    assert fetched == story_path(story_id)
+    assert (fetched / "scene_01.png").read_bytes() == b"\x89PNG fake image"
+    assert storage.fetch_story("story_01JAB3X6T3R2V8Y0Q9KZ4M5N7P") is None
+
+
+def test_unpublish_story(s3):
+    _, story_dir = make_story()
+    storage.publish_story(story_dir)
+
+    assert storage.unpublish_story(story_dir) == 2
+    assert s3.objects == {}
+
+
+def test_urls_point_at_published_files(s3):
+    story_id, story_dir = make_story()
+    storage.publish_story(story_dir)
+
+    url = storage.story_asset_url(f"{story_id}/scene_01.png")
+    assert url.startswith(f"https://s3.test/pbooks/books/{storage.story_key(story_id)}/scene_01.png")
+    assert storage.story_file_url(story_dir, story_dir / "scene_01.png", "fox.png") is not None
+
+
+def test_unpublished_file_is_served_locally_and_republished(s3):
+    story_id, story_dir = make_story()
+
+    # Never published (created before S3 was enabled, or the upload failed)
+    assert storage.story_asset_url(f"{story_id}/scene_01.png") is None
+    key = ("pbooks", f"books/{storage.file_key(story_dir, story_dir / 'scene_01.png')}")
+    wait_for(lambda: key in s3.objects)
+
+    assert storage.story_asset_url(f"{story_id}/scene_01.png") is not None
+
+
+def test_missing_file_has_no_url(s3):
+    story_id, _ = make_story()
+
+    assert storage.story_asset_url(f"{story_id}/scene_99.png") is None
+    assert storage.story_asset_url("../etc/passwd") is None
+
+
+def test_flask_image_route_redirects_only_to_existing_objects(s3):
+    from gemini_picturebook_generator.flask_ui import create_app
+
+    story_id, story_dir = make_story()
+    client = create_app().test_client()
+
+    response = client.get(f"/images/{story_id}/scene_01.png")
+    assert response.status_code == 200
+    assert response.data == b"\x89PNG fake image"
+
+    storage.publish_story(story_dir)
+    response = client.get(f"/images/{story_id}/scene_01.png")
+    assert response.status_code == 302
+    assert response.headers["Location"].startswith("https://s3.test/")
+
+
+def test_local_storage_root(stories_dir, tmp_path):
+    shared = tmp_path / "shared"
+    storage.set_storage(storage.LocalStorage(shared))
+    try:
+        story_id, story_dir = make_story()
+        assert storage.get_storage().remote
+
+        storage.publish_story(story_dir)
+        shutil.rmtree(story_dir)
+
+        assert storage.fetch_story(story_id) == story_path(story_id)
+        assert storage.story_asset_url(f"{story_id}/scene_01.png") is None
+    finally:
+        storage.set_storage(None)
@@ -0,0 +1,125 @@
+"""
+Tests for the story metadata sidecar and story locks.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from gemini_picturebook_generator import story_metadata
+from gemini_picturebook_generator.story_metadata import (
+    METADATA_FILENAME,
+    SCENES_FILENAME,
+    SCHEMA_VERSION,
+    atomic_write_bytes,
+    get_story_lock,
+    is_story_locked,
+    read_story_header,
+    read_story_metadata,
+    update_story_header,
+    write_story_metadata,
+)
+
+STORY = {
+    "id": "story_20240102_030405",
+    "original_prompt": "A fox in the snow",
+    "scenes": [
+        {"type": "text", "content": "Once upon a time", "scene_number": 1},
+        {"type": "image", "filename": "scene_01.png", "path": "/old/scene_01.png", "scene_number": 1},
+    ],
+}
+
+PROBE = """
+import sys
+from gemini_picturebook_generator.story_metadata import get_story_lock, is_story_locked
+lock = get_story_lock(sys.argv[1])
+print(is_story_locked(sys.argv[1]), lock.acquire(blocking=False))
+"""
+
+
+@pytest.mark.parametrize("policy", story_metadata.FSYNC_POLICIES)
+def test_atomic_write_replaces_the_file(tmp_path, policy):
+    path = tmp_path / "data.json"
+    path.write_bytes(b"old")
+
+    atomic_write_bytes(path, b"new", policy)
+
+    assert path.read_bytes() == b"new"
+    assert [p.name for p in tmp_path.iterdir()] == ["data.json"]
+
+
+def test_failed_atomic_write_keeps_the_old_file(tmp_path, monkeypatch):
+    path = tmp_path / "data.json"
+    path.write_bytes(b"old")
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        atomic_write_bytes(path, b"new")
+
+    assert path.read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == ["data.json"]
+
+
+def test_sidecar_is_split_into_header_and_scenes(tmp_path):
+    write_story_metadata(STORY, tmp_path)
+
+    header = read_story_header(tmp_path)
+    assert header["schema_version"] == SCHEMA_VERSION
+    assert header["image_count"] == 1
+    assert "scenes" not in header
+    story_data = read_story_metadata(tmp_path)
+    assert story_data["scenes"][1] == {"type": "image", "filename": "scene_01.png", "scene_number": 1}
+
+
+def test_header_update_keeps_the_scenes_file(tmp_path):
+    write_story_metadata(STORY, tmp_path)
+    scenes_before = (tmp_path / SCENES_FILENAME).read_bytes()
+
+    assert update_story_header(tmp_path, pinned=True)["pinned"] is True
+
+    assert read_story_header(tmp_path)["pinned"] is True
+    assert (tmp_path / SCENES_FILENAME).read_bytes() == scenes_before
+
+
+def test_header_update_upgrades_a_legacy_sidecar(tmp_path):
+    # Schema 0: one file with the scenes inline and no version
+    (tmp_path / METADATA_FILENAME).write_text(json.dumps(STORY))
+
+    header = update_story_header(tmp_path, style="watercolor")
+
+    assert header["schema_version"] == SCHEMA_VERSION
+    assert header["style"] == "watercolor"
+    assert "scenes" not in json.loads((tmp_path / METADATA_FILENAME).read_text())
+    story_data = read_story_metadata(tmp_path)
+    assert [s["type"] for s in story_data["scenes"]] == ["text", "image"]
+    assert story_data["original_prompt"] == "A fox in the snow"
+
+
+def test_header_update_of_a_missing_story(tmp_path):
+    assert update_story_header(tmp_path, pinned=True) is None
+    assert not (tmp_path / METADATA_FILENAME).exists()
+
+
+def probe_lock(story_dir):
+    """Check the story lock from another process."""
+    result = subprocess.run([sys.executable, "-c", PROBE, str(story_dir)], capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+
+@pytest.mark.skipif(not story_metadata.FCNTL_AVAILABLE, reason="needs fcntl")
+def test_story_lock_is_held_across_processes(tmp_path):
+    lock = get_story_lock(tmp_path)
+
+    with lock:
+        assert is_story_locked(tmp_path)
+        assert not lock.acquire(blocking=False)
+        assert probe_lock(tmp_path) == ["True", "False"]
+
+    assert not is_story_locked(tmp_path)
+    assert probe_lock(tmp_path) == ["False", "True"]
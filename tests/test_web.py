@@ -0,0 +1,106 @@
+"""
+Tests for the Flask and ASGI web UIs.
+"""
+
+import subprocess
+import sys
+import time
+
+import pytest
+
+from gemini_picturebook_generator.catalog import create_story_dir, story_url_path
+from gemini_picturebook_generator.job_store import get_job_store
+
+
+@pytest.fixture
+def stories_dir(tmp_path, monkeypatch):
+    root = tmp_path / "stories"
+    monkeypatch.setenv("OUTPUT_DIR", str(root))
+    return root
+
+
+@pytest.fixture
+def story(stories_dir):
+    story_id, story_dir = create_story_dir()
+    (story_dir / "story_metadata.json").write_text('{"original_prompt": "A fox"}')
+    (story_dir / "scene_01.png").write_bytes(b"\x89PNG fake image")
+    (story_dir / ".exports.json").write_text("{}")
+    get_job_store().put(story_id, {"status": "complete", "prompt": "A fox"})
+    return story_id, story_dir
+
+
+@pytest.fixture
+def flask_client():
+    from gemini_picturebook_generator.flask_ui import create_app
+
+    return create_app().test_client()
+
+
+@pytest.fixture
+def asgi_client():
+    from starlette.testclient import TestClient
+
+    from gemini_picturebook_generator.asgi import create_asgi_app
+
+    return TestClient(create_asgi_app(include_mcp=False))
+
+
+@pytest.mark.parametrize("client_fixture", ["flask_client", "asgi_client"])
+def test_internal_files_are_not_served(request, story, stories_dir, client_fixture):
+    client = request.getfixturevalue(client_fixture)
+    story_id, story_dir = story
+    assert (stories_dir / ".jobs" / f"{story_id}.json").exists()
+
+    assert client.get(f"/generated_stories/.jobs/{story_id}.json").status_code == 404
+    assert client.get(f"/generated_stories/{story_url_path(story_dir)}/.exports.json").status_code == 404
+    assert client.get(f"/images/{story_id}/.exports.json").status_code == 404
+
+    response = client.get(f"/generated_stories/{story_url_path(story_dir)}/scene_01.png")
+    assert response.status_code == 200
+
+
+def test_importing_the_asgi_module_builds_no_app():
+    code = "import sys, gemini_picturebook_generator.asgi; print('gemini_picturebook_generator.mcp_server' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+
+@pytest.fixture
+def generated_story(stories_dir, monkeypatch):
+    from gemini_picturebook_generator.enhanced_story_generator import (
+        generate_custom_story_with_images,
+        setup_client,
+    )
+    from gemini_picturebook_generator.ratelimit import reset_shared_limiter
+
+    monkeypatch.setenv("PICTUREBOOK_BACKEND", "fake")
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.setenv("GEMINI_RPM", "0")
+    monkeypatch.setenv("FAKE_GEMINI_LATENCY", "0")
+    reset_shared_limiter()
+    story_id, story_dir = create_story_dir()
+    generate_custom_story_with_images(
+        setup_client(), "A fox in the snow", 2, story_dir,
+        extra_metadata={"id": story_id}, progress_callback=lambda event: None,
+    )
+    yield story_id
+    reset_shared_limiter()
+
+
+def test_flask_regenerate_runs_as_a_job(generated_story, flask_client):
+    response = flask_client.post(f"/regenerate/{generated_story}/2", json={"prompt_override": "Make it night"})
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+
+    deadline = time.monotonic() + 10
+    status = {}
+    while status.get("status") not in ("complete", "error"):
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+        status = flask_client.get(f"/status/{job_id}").get_json()
+
+    assert status["status"] == "complete"
+    assert status["revision"] == 1
+    assert [s["type"] for s in status["scene"]][-1] == "image"
+
+    assert flask_client.post(f"/regenerate/{generated_story}/9").status_code == 400